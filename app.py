@@ -1,13 +1,63 @@
 import logging
+import threading
+import time
 
-from flask import Flask
+_process_start = time.perf_counter()
 
-from src.webhook_handler import webhook_blueprint
+from flask import Flask, g, jsonify  # noqa: E402
+
+from src.vector_db import warm_up  # noqa: E402
+from src.webhook_handler import start_worker_pool, webhook_blueprint  # noqa: E402
 
 app = Flask(__name__)
 app.register_blueprint(webhook_blueprint)
 logging.basicConfig()
 logging.getLogger().setLevel(logging.INFO)
+logger = logging.getLogger(__name__)
+
+_warm = threading.Event()
+_first_request_logged = False
+
+
+def _warm_up_in_background():
+    try:
+        warm_up()
+        _warm.set()
+    except Exception:
+        logger.exception("Warm-up failed, models will load on first use")
+
+
+def start_warm_up():
+    """Warm up on a background thread so the server accepts requests right away"""
+    threading.Thread(target=_warm_up_in_background, name="warm-up", daemon=True).start()
+
+
+@app.before_request
+def _start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def _log_first_request_latency(response):
+    global _first_request_logged
+    if not _first_request_logged:
+        _first_request_logged = True
+        logger.info(
+            f"First request served in "
+            f"{(time.perf_counter() - g.request_start) * 1000:.1f}ms "
+            f"({'after' if _warm.is_set() else 'before'} warm-up finished)"
+        )
+    return response
+
+
+@app.route("/healthz")
+def healthz():
+    """Liveness probe, answers before the embedding model has finished loading"""
+    return jsonify({"status": "ok", "warm": _warm.is_set()}), 200
+
 
 if __name__ == "__main__":
+    start_worker_pool()
+    start_warm_up()
+    logger.info(f"Startup finished in {time.perf_counter() - _process_start:.2f}s")
     app.run(port=4000)
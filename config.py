@@ -1,12 +1,66 @@
 import os
+from functools import lru_cache
 
 from dotenv import load_dotenv
 
 load_dotenv()
 
 APP_ID = os.getenv("APP_ID")
-PRIVATE_KEY = open("rsa.pem", "r").read()
+PRIVATE_KEY_PATH = os.getenv("PRIVATE_KEY_PATH", "rsa.pem")
 WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL")
-SIMILARITY_THRESHOLD = float(os.getenv("SIMILARITY_THRESHOLD"))
+SIMILARITY_THRESHOLD = float(os.getenv("SIMILARITY_THRESHOLD", "0.5"))
 ROOT_DIR = os.path.abspath(os.curdir)
+CHROMA_PATH = os.getenv("CHROMA_PATH", "./chroma")
+# a Chroma server owning the database, required with several worker processes
+CHROMA_HOST = os.getenv("CHROMA_HOST")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8000"))
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "./models/all-MiniLM-L6-v2-onnx")
+ONNX_QUANTIZED = os.getenv("ONNX_QUANTIZED", "true").lower() == "true"
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))
+EMBEDDING_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH", os.path.join(CHROMA_PATH, "embedding_cache.sqlite3")
+)
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "100000"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+ENCODE_BATCH_WAIT_MS = float(os.getenv("ENCODE_BATCH_WAIT_MS", "5"))
+ENCODE_BATCH_MAX_SIZE = int(os.getenv("ENCODE_BATCH_MAX_SIZE", "32"))
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "./jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+START_JOB_WORKERS = os.getenv("START_JOB_WORKERS", "true").lower() == "true"
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BACKOFF = float(os.getenv("JOB_RETRY_BACKOFF", "5"))
+# GitHub Enterprise (https://host/api/v3) or a local stand-in such as evals/fake_github.py
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")
+GITHUB_MAX_WORKERS = int(os.getenv("GITHUB_MAX_WORKERS", "8"))
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "300"))
+FEEDBACK_CACHE_PATH = os.getenv(
+    "FEEDBACK_CACHE_PATH", os.path.join(CHROMA_PATH, "feedback_cache.sqlite3")
+)
+FEEDBACK_CACHE_SIZE = int(os.getenv("FEEDBACK_CACHE_SIZE", "1000"))
+PR_CONTEXT_TOKEN_BUDGET = int(os.getenv("PR_CONTEXT_TOKEN_BUDGET", "3000"))
+PR_DEPENDENCY_DEPTH = int(os.getenv("PR_DEPENDENCY_DEPTH", "1"))
+PR_DIFF_CACHE_SIZE = int(os.getenv("PR_DIFF_CACHE_SIZE", "64"))
+SYNC_DELETE_CLOSED = os.getenv("SYNC_DELETE_CLOSED", "false").lower() == "true"
+CODE_INDEX_WORKERS = int(os.getenv("CODE_INDEX_WORKERS", str(os.cpu_count() or 1)))
+CODE_INDEX_PARALLEL_MIN_FILES = int(os.getenv("CODE_INDEX_PARALLEL_MIN_FILES", "32"))
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "5"))
+RERANKER = os.getenv("RERANKER", "none")
+RERANK_WEIGHT = float(os.getenv("RERANK_WEIGHT", "0.5"))
+CROSS_ENCODER_MODEL = os.getenv(
+    "CROSS_ENCODER_MODEL", "cross-encoder/stsb-TinyBERT-L-4"
+)
+CROSS_REPO_SEARCH = os.getenv("CROSS_REPO_SEARCH", "false").lower() == "true"
+HOT_INDEX_MEMORY_MB = float(os.getenv("HOT_INDEX_MEMORY_MB", "0"))
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "./snapshots")
+SNAPSHOT_DTYPE = os.getenv("SNAPSHOT_DTYPE", "int8")
+
+
+@lru_cache(maxsize=None)
+def get_private_key():
+    """Read the GitHub App private key on first use instead of at import"""
+    with open(PRIVATE_KEY_PATH, "r") as f:
+        return f.read()
@@ -0,0 +1,322 @@
+"""
+Local stand-in for the GitHub REST API, to load-test the app without GitHub
+
+Run from the project root, e.g.
+
+    python -m evals.fake_github --issues evals/data/open-webui_open-webui_issues_20241009_123520.csv \
+        --port 8900 --latency-ms 50
+
+and point the app at it with `GITHUB_API_URL=http://127.0.0.1:8900`. The fake
+serves the endpoints the app calls: installation token issuance, paginated
+repository issues (`since` and `Link` headers included), pull request diffs and
+changed files, and issue comments and closing, which are only counted. Every
+request waits `--latency-ms` plus up to `--jitter-ms`. It also answers Ollama's
+`/api/chat` with a canned review (`OLLAMA_HOST=http://127.0.0.1:8900`), so
+`pull_request` deliveries run to the end. Counters are served at `/_stats`.
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlencode
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from flask import Flask, Response, abort, jsonify, request
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+# not taken from config, which evals.replay has to import first
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TOKEN_LIFETIME = 3600
+MAX_PER_PAGE = 100
+REVIEW = (
+    "Consider the error handling of the changed code paths. "
+    "Has the PR author considered these points?"
+)
+
+
+def write_private_key(path: str) -> None:
+    """Throwaway GitHub App key, the app signs its JWTs with it and the fake ignores them"""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    with open(path, "wb") as f:
+        f.write(
+            key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.TraditionalOpenSSL,
+                serialization.NoEncryption(),
+            )
+        )
+
+
+def synthetic_issues(count: int) -> List[Dict[str, Any]]:
+    return [
+        {
+            "number": number,
+            "title": f"Synthetic issue {number}",
+            "body": f"Steps to reproduce synthetic issue {number}",
+            "created_at": "2024-01-01T00:00:00Z",
+        }
+        for number in range(1, count + 1)
+    ]
+
+
+class _QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs) -> None:
+        pass
+
+
+class FakeGitHub:
+    """
+    In-process fake GitHub API, every repository lists the same issues
+
+    :param issues: Issues listed by `GET /repos/{owner}/{repo}/issues`, with
+        number, title, body and created_at (used as updated_at)
+    :param latency_ms: Delay added to every request
+    :param jitter_ms: Upper bound of a uniformly random extra delay
+    :param pr_files: Changed files of every pull request
+    """
+
+    def __init__(
+        self,
+        issues: List[Dict[str, Any]],
+        latency_ms: float = 0,
+        jitter_ms: float = 0,
+        pr_files: int = 3,
+    ) -> None:
+        self.issues = [
+            {
+                "number": issue["number"],
+                "title": issue["title"],
+                "body": issue["body"],
+                "state": "open",
+                "updated_at": issue["created_at"],
+            }
+            for issue in issues
+        ]
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        # real module paths, so the dependency graph of the app's own code matches them
+        self.pr_files = [
+            os.path.relpath(path, PROJECT_DIR).replace(os.sep, "/")
+            for path in sorted(glob.glob(os.path.join(PROJECT_DIR, "src", "*.py")))
+        ][:pr_files]
+        self._lock = threading.Lock()
+        self._tokens = set()
+        self.requests: Counter = Counter()
+        self.comments = 0
+        self.closed = 0
+        self.app = self._create_app()
+        self._server = None
+
+    def _create_app(self) -> Flask:
+        app = Flask(__name__)
+
+        @app.before_request
+        def _delay_and_count():
+            if request.endpoint == "stats":
+                return
+            with self._lock:
+                self.requests[request.endpoint] += 1
+            delay = self.latency_ms + random.uniform(0, self.jitter_ms)
+            if delay > 0:
+                time.sleep(delay / 1000)
+
+        @app.route(
+            "/app/installations/<int:installation_id>/access_tokens", methods=["POST"]
+        )
+        def access_token(installation_id):
+            if not request.headers.get("Authorization", "").startswith("Bearer "):
+                abort(401)
+            token = f"ghs_fake_{installation_id}_{uuid.uuid4().hex}"
+            with self._lock:
+                self._tokens.add(token)
+            expires_at = datetime.now(timezone.utc) + timedelta(seconds=TOKEN_LIFETIME)
+            return (
+                jsonify(
+                    {
+                        "token": token,
+                        "expires_at": expires_at.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                    }
+                ),
+                201,
+            )
+
+        @app.route("/repos/<owner>/<repo>/issues", methods=["GET"])
+        def list_issues(owner, repo):
+            self._authorize()
+            since = request.args.get("since")
+            issues = [
+                issue
+                for issue in self.issues
+                if not since or issue["updated_at"] >= since
+            ]
+            return self._paginate(issues)
+
+        @app.route("/repos/<owner>/<repo>/issues/<int:number>", methods=["PATCH"])
+        def update_issue(owner, repo, number):
+            self._authorize()
+            if (request.json or {}).get("state") == "closed":
+                with self._lock:
+                    self.closed += 1
+            return jsonify(
+                {"number": number, "state": request.json.get("state", "open")}
+            )
+
+        @app.route(
+            "/repos/<owner>/<repo>/issues/<int:number>/comments", methods=["POST"]
+        )
+        def create_comment(owner, repo, number):
+            self._authorize()
+            with self._lock:
+                self.comments += 1
+            return (
+                jsonify({"id": random.getrandbits(31), "body": request.json["body"]}),
+                201,
+            )
+
+        @app.route("/repos/<owner>/<repo>/pulls/<int:number>", methods=["GET"])
+        def pull_request(owner, repo, number):
+            self._authorize()
+            if "diff" in request.headers.get("Accept", ""):
+                return Response(
+                    "".join(
+                        f"diff --git a/{file['filename']} b/{file['filename']}\n"
+                        f"--- a/{file['filename']}\n+++ b/{file['filename']}\n"
+                        f"{file['patch']}\n"
+                        for file in self._files(number)
+                    ),
+                    mimetype="text/plain",
+                )
+            return jsonify({"number": number, "state": "open"})
+
+        @app.route("/repos/<owner>/<repo>/pulls/<int:number>/files", methods=["GET"])
+        def pull_request_files(owner, repo, number):
+            self._authorize()
+            return self._paginate(self._files(number))
+
+        @app.route("/api/chat", methods=["POST"])
+        def chat():
+            """Ollama's streaming chat endpoint, one chunk per word of the review"""
+            words = REVIEW.split(" ")
+            lines = [
+                {"message": {"role": "assistant", "content": f"{word} "}, "done": False}
+                for word in words
+            ]
+            lines.append(
+                {"message": {"role": "assistant", "content": ""}, "done": True}
+            )
+            return Response(
+                "".join(json.dumps(line) + "\n" for line in lines),
+                mimetype="application/x-ndjson",
+            )
+
+        @app.route("/_stats", methods=["GET"])
+        def stats():
+            return jsonify(self.stats())
+
+        return app
+
+    def _authorize(self) -> None:
+        """Reject tokens this fake did not issue, like GitHub after a token expired"""
+        token = request.headers.get("Authorization", "").split(" ")[-1]
+        with self._lock:
+            if token not in self._tokens:
+                abort(401)
+
+    def _paginate(self, items: List[Any]) -> Response:
+        per_page = min(int(request.args.get("per_page", 30)), MAX_PER_PAGE)
+        page = int(request.args.get("page", 1))
+        last_page = max(1, -(-len(items) // per_page))
+        response = jsonify(items[(page - 1) * per_page : page * per_page])
+
+        def link(to: int) -> str:
+            return f"{request.base_url}?{urlencode({**request.args, 'page': to})}"
+
+        links = []
+        if page < last_page:
+            links.append(f'<{link(page + 1)}>; rel="next"')
+            links.append(f'<{link(last_page)}>; rel="last"')
+        if links:
+            response.headers["Link"] = ", ".join(links)
+        return response
+
+    def _files(self, number: int) -> List[Dict[str, Any]]:
+        return [
+            {
+                "filename": filename,
+                "status": "modified",
+                "patch": f"@@ -1,1 +1,2 @@\n import logging\n+# pull request {number}",
+            }
+            for filename in self.pr_files
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": dict(self.requests),
+                "comments": self.comments,
+                "closed": self.closed,
+                "tokens_issued": len(self._tokens),
+            }
+
+    def start(self, port: int = 0, host: str = "127.0.0.1") -> str:
+        """Serve on a background thread, returns the base URL"""
+        self._server = make_server(
+            host, port, self.app, threaded=True, request_handler=_QuietRequestHandler
+        )
+        threading.Thread(
+            target=self._server.serve_forever, name="fake-github", daemon=True
+        ).start()
+        return f"http://{host}:{self._server.server_port}"
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+
+
+def load_fake_issues(path: Optional[str], count: int) -> List[Dict[str, Any]]:
+    """The first `count` issues of a dataset, or synthetic ones without a dataset"""
+    if not path:
+        return synthetic_issues(count)
+    from evals.replay import load_issues
+
+    return load_issues(path)[:count]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--issues", help="CSV or JSONL file of issues to list")
+    parser.add_argument("--issue-count", type=int, default=500)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--pr-files", type=int, default=3)
+    args = parser.parse_args()
+
+    fake = FakeGitHub(
+        load_fake_issues(args.issues, args.issue_count),
+        args.latency_ms,
+        args.jitter_ms,
+        args.pr_files,
+    )
+    print(f"Fake GitHub API on {fake.start(args.port, args.host)}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
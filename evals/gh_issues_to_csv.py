@@ -1,26 +1,16 @@
-import requests
 import csv
 from datetime import datetime
 
+from src.github_client import get_github_client
 
+
+# run from the project root with `python -m evals.gh_issues_to_csv`
 def get_github_issues(owner, repo, token):
-    issues = []
-    page = 1
-    while True:
-        url = f"https://api.github.com/repos/{owner}/{repo}/issues"
-        params = {"state": "all", "per_page": 100, "page": page}
-        headers = {
-            "Authorization": f"token {token}",
-            "Accept": "application/vnd.github.v3+json",
-        }
-        response = requests.get(url, params=params, headers=headers)
-        response.raise_for_status()
-        new_issues = response.json()
-        if not new_issues:
-            break
-        issues.extend(new_issues)
-        page += 1
-    return issues
+    return get_github_client().paginate(
+        f"/repos/{owner}/{repo}/issues",
+        params={"state": "all"},
+        headers={"Authorization": f"token {token}"},
+    )
 
 
 def save_issues_to_csv(issues, filename):
@@ -28,6 +18,7 @@ def save_issues_to_csv(issues, filename):
         fieldnames = [
             "number",
             "title",
+            "body",
             "state",
             "created_at",
             "updated_at",
@@ -43,6 +34,7 @@ def save_issues_to_csv(issues, filename):
                 {
                     "number": issue["number"],
                     "title": issue["title"],
+                    "body": issue.get("body") or "",
                     "state": issue["state"],
                     "created_at": issue["created_at"],
                     "updated_at": issue["updated_at"],
@@ -0,0 +1,328 @@
+"""
+Measure how issue throughput scales with the number of gunicorn workers
+
+Run from the project root, e.g.
+
+    python -m evals.load_test evals/data/open-webui_open-webui_issues_20241009_123520.csv \
+        --workers 1,2,4 --deliveries 200
+
+For every worker count, a Chroma server and `gunicorn -c gunicorn.conf.py app:app`
+are started on temporary data. Signed `issues` `opened` deliveries are posted
+from `--concurrency` threads, and the run lasts until every job has reached a
+final state in the job queue. Deliveries are tried once. Without
+`--fake-github`, jobs fail at the first GitHub call, which comes after the
+encode and query stages this test is meant to load. With it, the app talks to
+evals/fake_github.py and comments on and closes issues there.
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from evals.fake_github import FakeGitHub, write_private_key
+from evals.replay import git_commit, latency_summary, load_issues
+
+LOAD_TEST_REPO_ID = 424242
+LOAD_TEST_INSTALLATION_ID = 4242
+
+
+def free_port() -> int:
+    with closing(socket.socket()) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def sign_payload(body: bytes, secret: str) -> str:
+    """X-Hub-Signature-256 header of a delivery, as GitHub computes it"""
+    return (
+        "sha256=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    )
+
+
+def issue_opened_payload(
+    issue: Dict[str, Any], number: int, repo_id: int = LOAD_TEST_REPO_ID
+) -> Dict[str, Any]:
+    return {
+        "action": "opened",
+        "installation": {"id": LOAD_TEST_INSTALLATION_ID},
+        "repository": {"id": repo_id, "full_name": "load-test/repo"},
+        "issue": {"number": number, "title": issue["title"], "body": issue["body"]},
+    }
+
+
+def wait_for(url: str, timeout: float, process: subprocess.Popen) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{process.args[0]} exited with {process.returncode}")
+        try:
+            if requests.get(url, timeout=1).ok:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"{url} did not come up within {timeout:g}s")
+
+
+def stop(process: subprocess.Popen) -> None:
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def post_delivery(
+    session: requests.Session,
+    url: str,
+    secret: str,
+    event_type: str,
+    payload: Dict[str, Any],
+    delivery_id: str,
+) -> requests.Response:
+    body = json.dumps(payload).encode("utf-8")
+    return session.post(
+        url,
+        data=body,
+        headers={
+            "Content-Type": "application/json",
+            "X-GitHub-Event": event_type,
+            "X-GitHub-Delivery": delivery_id,
+            "X-Hub-Signature-256": sign_payload(body, secret),
+        },
+        timeout=30,
+    )
+
+
+def post_deliveries(
+    url: str, secret: str, payloads: List[Dict[str, Any]], concurrency: int
+) -> Dict[str, Any]:
+    """Post signed deliveries, returns their ids and the accept latencies"""
+    session = requests.Session()
+
+    def _post(payload):
+        delivery_id = str(uuid.uuid4())
+        start = time.perf_counter()
+        response = post_delivery(session, url, secret, "issues", payload, delivery_id)
+        return delivery_id, response.status_code, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(_post, payloads))
+    return {
+        "delivery_ids": [delivery_id for delivery_id, status, _ in results],
+        "errors": sum(status != 202 for _, status, _ in results),
+        "latencies": [latency for _, _, latency in results],
+    }
+
+
+def wait_for_jobs(
+    queue_path: str, delivery_ids: List[str], timeout: float
+) -> List[sqlite3.Row]:
+    """Poll the job queue until every delivery is done or failed"""
+    placeholders = ",".join("?" * len(delivery_ids))
+    deadline = time.monotonic() + timeout
+    while True:
+        with closing(sqlite3.connect(queue_path, timeout=30)) as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute(
+                f"SELECT delivery_id, event_type, status, created_at, updated_at "
+                f"FROM jobs "
+                f"WHERE delivery_id IN ({placeholders})",
+                delivery_ids,
+            ).fetchall()
+        if len(rows) == len(delivery_ids) and all(
+            row["status"] in ("done", "failed") for row in rows
+        ):
+            return rows
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Jobs did not finish within {timeout:g}s")
+        time.sleep(0.2)
+
+
+def start_app(
+    port: int, env: Dict[str, str], timeout: float, verbose: bool
+) -> subprocess.Popen:
+    """Start `gunicorn -c gunicorn.conf.py app:app` and wait until it answers"""
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+        env={**os.environ, "BIND": f"127.0.0.1:{port}", **env},
+        stdout=subprocess.DEVNULL,
+        stderr=None if verbose else subprocess.DEVNULL,
+    )
+    try:
+        wait_for(f"http://127.0.0.1:{port}/healthz", timeout, server)
+    except Exception:
+        stop(server)
+        raise
+    return server
+
+
+def start_chroma(data_dir: str, port: int, timeout: float) -> subprocess.Popen:
+    chroma = subprocess.Popen(
+        [
+            "chroma",
+            "run",
+            "--path",
+            os.path.join(data_dir, "chroma"),
+            "--port",
+            str(port),
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        # chroma writes chroma.log to its working directory
+        cwd=data_dir,
+    )
+    try:
+        wait_for(f"http://127.0.0.1:{port}/api/v1/heartbeat", timeout, chroma)
+    except Exception:
+        stop(chroma)
+        raise
+    return chroma
+
+
+def fake_github_env(github_url: str, data_dir: str) -> Dict[str, str]:
+    """Settings pointing the app at a fake GitHub, which also stands in for Ollama"""
+    private_key_path = os.path.join(data_dir, "fake-app-key.pem")
+    if not os.path.exists(private_key_path):
+        write_private_key(private_key_path)
+    return {
+        "APP_ID": "1",
+        "PRIVATE_KEY_PATH": private_key_path,
+        "GITHUB_API_URL": github_url,
+        "OLLAMA_HOST": github_url,
+        "OLLAMA_MODEL": "fake",
+    }
+
+
+def run(
+    workers: int,
+    issues: List[Dict[str, Any]],
+    args: argparse.Namespace,
+    chroma_port: int,
+    data_dir: str,
+    github_url: Optional[str] = None,
+) -> Dict[str, Any]:
+    port = free_port()
+    secret = uuid.uuid4().hex
+    queue_path = os.path.join(data_dir, f"jobs-{workers}.sqlite3")
+    env = {
+        "WEB_CONCURRENCY": str(workers),
+        "CHROMA_HOST": "127.0.0.1",
+        "CHROMA_PORT": str(chroma_port),
+        "CHROMA_PATH": os.path.join(data_dir, f"state-{workers}"),
+        "JOB_QUEUE_PATH": queue_path,
+        "JOB_MAX_ATTEMPTS": "1",
+        "WEBHOOK_SECRET": secret,
+        "HOT_INDEX_MEMORY_MB": "0",
+        **(fake_github_env(github_url, data_dir) if github_url else {}),
+    }
+    server = start_app(port, env, args.startup_timeout, args.verbose)
+    try:
+        url = f"http://127.0.0.1:{port}/webhook"
+
+        # every run gets its own collection on the shared Chroma server
+        repo_id = LOAD_TEST_REPO_ID + workers
+        # loads the model in every worker before measuring
+        warmup = [
+            issue_opened_payload(issue, number, repo_id)
+            for number, issue in enumerate(issues[: args.warmup], start=1)
+        ]
+        posted = post_deliveries(url, secret, warmup, args.concurrency)
+        wait_for_jobs(queue_path, posted["delivery_ids"], args.job_timeout)
+
+        measured = [
+            issue_opened_payload(issue, number, repo_id)
+            for number, issue in enumerate(
+                issues[args.warmup : args.warmup + args.deliveries],
+                start=args.warmup + 1,
+            )
+        ]
+        start = time.time()
+        posted = post_deliveries(url, secret, measured, args.concurrency)
+        accepted = time.time()
+        jobs = wait_for_jobs(queue_path, posted["delivery_ids"], args.job_timeout)
+        finished = max(row["updated_at"] for row in jobs)
+    finally:
+        stop(server)
+
+    return {
+        "workers": workers,
+        "deliveries": len(measured),
+        "http_errors": posted["errors"],
+        "accept_per_second": len(measured) / (accepted - start),
+        "accept_latency": latency_summary(posted["latencies"]),
+        "jobs_per_second": len(jobs) / (finished - start),
+        "job_latency": latency_summary(
+            [row["updated_at"] - row["created_at"] for row in jobs]
+        ),
+        "jobs_failed": sum(row["status"] == "failed" for row in jobs),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("dataset", help="CSV or JSONL file of issues to post")
+    parser.add_argument("--workers", default="1,2,4", help="Worker counts to compare")
+    parser.add_argument("--deliveries", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--startup-timeout", type=float, default=120)
+    parser.add_argument("--job-timeout", type=float, default=600)
+    parser.add_argument("--output", default="evals/results/load_test.json")
+    parser.add_argument(
+        "--fake-github",
+        action="store_true",
+        help="Serve GitHub calls from evals/fake_github.py so jobs run to the end",
+    )
+    parser.add_argument("--github-latency-ms", type=float, default=0)
+    parser.add_argument("--verbose", action="store_true", help="Show server logs")
+    args = parser.parse_args()
+
+    issues = load_issues(args.dataset)[: args.warmup + args.deliveries]
+    results = []
+    fake_github = FakeGitHub([], args.github_latency_ms) if args.fake_github else None
+    github_url = fake_github.start() if fake_github else None
+    with tempfile.TemporaryDirectory(prefix="doppelganger-load-") as data_dir:
+        chroma_port = free_port()
+        chroma = start_chroma(data_dir, chroma_port, args.startup_timeout)
+        try:
+            for workers in [int(count) for count in args.workers.split(",")]:
+                results.append(
+                    run(workers, issues, args, chroma_port, data_dir, github_url)
+                )
+                print(json.dumps(results[-1], indent=2))
+        finally:
+            stop(chroma)
+            if fake_github:
+                fake_github.stop()
+
+    result = {
+        "dataset": args.dataset,
+        "fake_github": args.fake_github,
+        "commit": git_commit(),
+        "cpu_count": os.cpu_count(),
+        "runs": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
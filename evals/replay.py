@@ -0,0 +1,226 @@
+"""
+Replay historical issues through the duplicate detection pipeline offline
+
+Run from the project root, e.g.
+
+    python -m evals.replay evals/data/open-webui_open-webui_issues_20241009_123520.csv \
+        --output evals/results/replay.json
+
+Issues are streamed in creation order through embed -> query_similar_issues ->
+classify_similarity -> add_issue_to_chroma, with no GitHub calls. Issues labelled
+as duplicates (or with a `duplicate_of` field) are the positives.
+
+The body column was added to gh_issues_to_csv later. CSVs exported before it,
+like the bundled open-webui one, have titles only and are scored on titles.
+"""
+
+import argparse
+import atexit
+import csv
+import json
+import os
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+import numpy as np
+
+# keep the replay away from the app's Chroma data and embedding cache,
+# this has to happen before config is imported
+if "CHROMA_PATH" not in os.environ:
+    os.environ["CHROMA_PATH"] = tempfile.mkdtemp(prefix="doppelganger-replay-")
+    atexit.register(shutil.rmtree, os.environ["CHROMA_PATH"], ignore_errors=True)
+
+from config import (  # noqa: E402
+    SIMILARITY_THRESHOLD,
+    RETRIEVAL_TOP_K,
+    RERANKER,
+    EMBEDDING_BACKEND,
+)
+from src.issue_handler import classify_similarity  # noqa: E402
+from src.vector_db import (  # noqa: E402
+    add_issue_to_chroma,
+    embed_texts,
+    query_similar_issues,
+    warm_up,
+)
+
+REPLAY_REPO_ID = "replay"
+
+
+def _labels(value) -> List[str]:
+    if isinstance(value, list):
+        return [
+            (label["name"] if isinstance(label, dict) else label).lower()
+            for label in value
+        ]
+    return [label.strip().lower() for label in (value or "").split(",") if label]
+
+
+def load_issues(path: str, duplicate_label: str = "duplicate") -> List[Dict[str, Any]]:
+    """
+    Load issues from a CSV (as written by gh_issues_to_csv) or JSONL file
+
+    :return: Issues sorted by creation time, each with number, title, body,
+        created_at, is_duplicate and duplicate_of
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+
+    issues = []
+    for row in rows:
+        duplicate_of = row.get("duplicate_of") or None
+        issues.append(
+            {
+                "number": int(row["number"]),
+                "title": row["title"],
+                "body": row.get("body") or "",
+                "created_at": row["created_at"],
+                "duplicate_of": int(duplicate_of) if duplicate_of else None,
+                "is_duplicate": bool(duplicate_of)
+                or duplicate_label.lower() in _labels(row.get("labels")),
+            }
+        )
+    return sorted(issues, key=lambda issue: (issue["created_at"], issue["number"]))
+
+
+def latency_summary(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {}
+    millis = np.array(samples) * 1000
+    return {
+        "mean_ms": float(millis.mean()),
+        "p50_ms": float(np.percentile(millis, 50)),
+        "p95_ms": float(np.percentile(millis, 95)),
+        "p99_ms": float(np.percentile(millis, 99)),
+    }
+
+
+def precision_recall(predicted: List[bool], actual: List[bool]) -> Dict[str, float]:
+    predicted, actual = np.array(predicted, bool), np.array(actual, bool)
+    true_positives = int((predicted & actual).sum())
+    precision = true_positives / predicted.sum() if predicted.sum() else 0.0
+    recall = true_positives / actual.sum() if actual.sum() else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {
+        "true_positives": true_positives,
+        "false_positives": int((predicted & ~actual).sum()),
+        "false_negatives": int((~predicted & actual).sum()),
+        "precision": float(precision),
+        "recall": float(recall),
+        "f1": float(f1),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def replay(issues: List[Dict[str, Any]], threshold: float) -> Dict[str, Any]:
+    timings = {"encode": [], "query": [], "add": []}
+    decisions = []
+    matched_duplicate_of = 0
+
+    start = time.perf_counter()
+    for issue in issues:
+        full_issue = f"{issue['title']} {issue['body']}"
+
+        t0 = time.perf_counter()
+        embedding = embed_texts([full_issue])[0]
+        t1 = time.perf_counter()
+        candidates = query_similar_issues(
+            full_issue, REPLAY_REPO_ID, issue["title"], embedding=embedding
+        )
+        t2 = time.perf_counter()
+        add_issue_to_chroma(
+            full_issue, issue["number"], issue["title"], REPLAY_REPO_ID, embedding
+        )
+        t3 = time.perf_counter()
+
+        timings["encode"].append(t1 - t0)
+        timings["query"].append(t2 - t1)
+        timings["add"].append(t3 - t2)
+
+        decision = (
+            classify_similarity(candidates[0]["distance"], threshold)
+            if candidates
+            else "new"
+        )
+        decisions.append(decision)
+        if (
+            decision == "duplicate"
+            and issue["duplicate_of"]
+            and int(candidates[0]["issue_number"]) == issue["duplicate_of"]
+        ):
+            matched_duplicate_of += 1
+    elapsed = time.perf_counter() - start
+
+    actual = [issue["is_duplicate"] for issue in issues]
+    return {
+        "issues": len(issues),
+        "labelled_duplicates": sum(actual),
+        "elapsed_seconds": elapsed,
+        "issues_per_second": len(issues) / elapsed if elapsed else 0.0,
+        "decisions": {
+            decision: decisions.count(decision)
+            for decision in ("duplicate", "related", "new")
+        },
+        "closed_as_duplicate": precision_recall(
+            [decision == "duplicate" for decision in decisions], actual
+        ),
+        "duplicate_or_related": precision_recall(
+            [decision != "new" for decision in decisions], actual
+        ),
+        "matched_duplicate_of": matched_duplicate_of,
+        "latency": {
+            stage: latency_summary(samples) for stage, samples in timings.items()
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("dataset", help="CSV or JSONL file of historical issues")
+    parser.add_argument("--output", default="evals/results/replay.json")
+    parser.add_argument("--threshold", type=float, default=SIMILARITY_THRESHOLD)
+    parser.add_argument("--duplicate-label", default="duplicate")
+    parser.add_argument("--limit", type=int, help="Replay only the first N issues")
+    args = parser.parse_args()
+
+    issues = load_issues(args.dataset, args.duplicate_label)[: args.limit]
+    warm_up()
+    result = {
+        "dataset": args.dataset,
+        "commit": git_commit(),
+        "run_at": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "threshold": args.threshold,
+            "top_k": RETRIEVAL_TOP_K,
+            "reranker": RERANKER,
+            "embedding_backend": EMBEDDING_BACKEND,
+        },
+        **replay(issues, args.threshold),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Sweep SIMILARITY_THRESHOLD over historical issues with a single embedding pass
+
+Run from the project root, e.g.
+
+    python -m evals.sweep evals/data/open-webui_open-webui_issues_20241009_123520.csv \
+        --output evals/results/sweep.json
+
+Issues are embedded once and the vectors are saved to a .npy file that later
+sweeps of the same dataset, backend and model load memory-mapped. The distance from each issue to
+its nearest earlier issue is computed in one vectorized pass, in the same space
+as the Chroma collections, and every threshold of the grid is then evaluated
+against those distances. The reranker is not applied, so the distances are the
+ones `RERANKER=none` would act on.
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+import numpy as np
+
+# evals.replay points CHROMA_PATH at a temporary directory, so it is imported
+# before config to keep the embedding cache away from the app's data
+from evals.replay import git_commit, load_issues, precision_recall
+
+from config import (
+    EMBEDDING_BACKEND,
+    EMBEDDING_MODEL_NAME,
+    ONNX_QUANTIZED,
+    SIMILARITY_THRESHOLD,
+)
+from src.issue_handler import RELATED_THRESHOLD_FACTOR
+from src.vector_db import embed_texts
+
+
+def embedding_tag() -> str:
+    """Backend and model for the cache file name, e.g. `torch_all-MiniLM-L6-v2`"""
+    tag = f"{EMBEDDING_BACKEND}_{EMBEDDING_MODEL_NAME.strip('/')}"
+    if EMBEDDING_BACKEND == "onnx" and ONNX_QUANTIZED:
+        tag += "-int8"
+    return re.sub(r"[^A-Za-z0-9._-]+", "-", tag)
+
+
+def load_or_embed(
+    issues: List[Dict[str, Any]], path: str, reembed: bool = False
+) -> np.ndarray:
+    """
+    Embeddings of the issues, memory-mapped from `path` when it already holds them
+
+    :return: Array with one row per issue, in the order of `issues`
+    """
+    if not reembed and os.path.exists(path):
+        embeddings = np.load(path, mmap_mode="r")
+        if embeddings.shape[0] == len(issues):
+            return embeddings
+        print(f"{path} has {embeddings.shape[0]} rows, re-embedding {len(issues)}")
+
+    texts = [f"{issue['title']} {issue['body']}" for issue in issues]
+    embeddings = np.asarray(embed_texts(texts), dtype=np.float32)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    np.save(path, embeddings)
+    return np.load(path, mmap_mode="r")
+
+
+def nearest_earlier_neighbours(
+    embeddings: np.ndarray, chunk_size: int = 1024
+) -> Dict[str, np.ndarray]:
+    """
+    Distance from each issue to the closest issue created before it
+
+    Distances are squared euclidean, Chroma's default l2 space, so they are on
+    the scale `classify_similarity` expects. The first issue has no earlier
+    neighbour and gets an infinite distance and a neighbour index of -1.
+    """
+    count = embeddings.shape[0]
+    distances = np.full(count, np.inf, dtype=np.float32)
+    neighbours = np.full(count, -1, dtype=np.int64)
+    squared_norms = np.einsum("ij,ij->i", embeddings, embeddings)
+
+    for start in range(1, count, chunk_size):
+        end = min(start + chunk_size, count)
+        # only issues before the last row of the chunk can be earlier neighbours
+        chunk_distances = (
+            squared_norms[start:end, np.newaxis]
+            + squared_norms[np.newaxis, :end]
+            - 2 * embeddings[start:end] @ embeddings[:end].T
+        )
+        rows = np.arange(start, end)[:, np.newaxis]
+        chunk_distances[np.arange(end)[np.newaxis, :] >= rows] = np.inf
+        neighbours[start:end] = chunk_distances.argmin(axis=1)
+        distances[start:end] = np.maximum(
+            chunk_distances[np.arange(end - start), neighbours[start:end]], 0
+        )
+    return {"distances": distances, "neighbours": neighbours}
+
+
+def sweep(
+    issues: List[Dict[str, Any]],
+    distances: np.ndarray,
+    neighbours: np.ndarray,
+    thresholds: List[float],
+) -> List[Dict[str, Any]]:
+    """Close/comment/no-op outcomes and precision/recall for each threshold"""
+    actual = np.array([issue["is_duplicate"] for issue in issues], dtype=bool)
+    duplicate_of = np.array([issue["duplicate_of"] or -1 for issue in issues])
+    neighbour_numbers = np.array([issues[i]["number"] for i in neighbours])
+    neighbour_numbers[neighbours < 0] = -1
+
+    rows = []
+    for threshold in thresholds:
+        # same comparisons as classify_similarity
+        duplicate = distances < 1 - threshold
+        related = ~duplicate & (distances < 1 - threshold * RELATED_THRESHOLD_FACTOR)
+        rows.append(
+            {
+                "threshold": round(float(threshold), 4),
+                "decisions": {
+                    "duplicate": int(duplicate.sum()),
+                    "related": int(related.sum()),
+                    "new": int((~duplicate & ~related).sum()),
+                },
+                "closed_as_duplicate": precision_recall(duplicate, actual),
+                "duplicate_or_related": precision_recall(duplicate | related, actual),
+                "matched_duplicate_of": int(
+                    (duplicate & (neighbour_numbers == duplicate_of)).sum()
+                ),
+            }
+        )
+    return rows
+
+
+def print_table(rows: List[Dict[str, Any]]) -> None:
+    print(
+        f"{'threshold':>9} {'close':>6} {'comment':>7} {'no-op':>6} "
+        f"{'precision':>9} {'recall':>6} {'f1':>5} {'rel. recall':>11}"
+    )
+    for row in rows:
+        closed = row["closed_as_duplicate"]
+        print(
+            f"{row['threshold']:>9.2f} {row['decisions']['duplicate']:>6} "
+            f"{row['decisions']['related']:>7} {row['decisions']['new']:>6} "
+            f"{closed['precision']:>9.3f} {closed['recall']:>6.3f} "
+            f"{closed['f1']:>5.3f} {row['duplicate_or_related']['recall']:>11.3f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("dataset", help="CSV or JSONL file of historical issues")
+    parser.add_argument("--output", default="evals/results/sweep.json")
+    parser.add_argument(
+        "--embeddings",
+        help="Where to keep the embeddings, defaults to "
+        "evals/results/<dataset>_<backend>_<model>.npy",
+    )
+    parser.add_argument("--reembed", action="store_true")
+    parser.add_argument("--start", type=float, default=0.3)
+    parser.add_argument("--stop", type=float, default=0.95)
+    parser.add_argument("--step", type=float, default=0.05)
+    parser.add_argument("--duplicate-label", default="duplicate")
+    parser.add_argument("--limit", type=int, help="Sweep only the first N issues")
+    parser.add_argument("--chunk-size", type=int, default=1024)
+    args = parser.parse_args()
+
+    issues = load_issues(args.dataset, args.duplicate_label)[: args.limit]
+    embeddings_path = args.embeddings or os.path.join(
+        "evals/results",
+        f"{os.path.splitext(os.path.basename(args.dataset))[0]}"
+        f"{f'_{args.limit}' if args.limit else ''}_{embedding_tag()}.npy",
+    )
+
+    start = time.perf_counter()
+    embeddings = load_or_embed(issues, embeddings_path, args.reembed)
+    embedded = time.perf_counter()
+    nearest = nearest_earlier_neighbours(embeddings, args.chunk_size)
+    searched = time.perf_counter()
+    thresholds = np.arange(args.start, args.stop + args.step / 2, args.step)
+    rows = sweep(issues, nearest["distances"], nearest["neighbours"], thresholds)
+    swept = time.perf_counter()
+
+    best = max(rows, key=lambda row: row["closed_as_duplicate"]["f1"])
+    result = {
+        "dataset": args.dataset,
+        "commit": git_commit(),
+        "run_at": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "current_threshold": SIMILARITY_THRESHOLD,
+            "related_threshold_factor": RELATED_THRESHOLD_FACTOR,
+            "embedding_backend": EMBEDDING_BACKEND,
+            "embeddings": embeddings_path,
+        },
+        "issues": len(issues),
+        "labelled_duplicates": sum(issue["is_duplicate"] for issue in issues),
+        "timings_seconds": {
+            "embed": embedded - start,
+            "nearest_neighbours": searched - embedded,
+            "sweep": swept - searched,
+        },
+        "best_f1_threshold": best["threshold"],
+        "thresholds": rows,
+    }
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+    print_table(rows)
+    print(
+        f"\nBest F1 for closing at threshold {best['threshold']:.2f}, "
+        f"results written to {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""
+Replay signed webhook deliveries at a target rate against a fake GitHub
+
+Run from the project root, e.g.
+
+    python -m evals.webhook_load evals/data/open-webui_open-webui_issues_20241009_123520.csv \
+        --rps 5 --duration 60 --mix issues=90,pull_request=5,installation=5
+
+The app is started with `gunicorn -c gunicorn.conf.py app:app` on temporary data,
+talking to evals/fake_github.py for GitHub and Ollama calls. An `installation`
+`created` delivery first syncs the `--repo-issues` oldest issues of the dataset
+into the test repository. Then `issues` `opened` deliveries (the later issues),
+`pull_request` `opened` deliveries and `installation` `created` deliveries for
+new repositories are sent on an open-loop schedule of `--rps` deliveries per
+second, each signed with the webhook secret like GitHub does.
+
+Latencies count from the scheduled send time, so a server that falls behind is
+not hidden by the generator waiting on it. End to end, a delivery is finished
+when its job is done or failed in the job queue. Per event type the report has
+throughput, the HTTP and job error rates and the p50/p95/p99 latencies, and is
+written to `evals/results/webhook_load.json`.
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+import requests
+
+from evals.fake_github import FakeGitHub
+from evals.load_test import (
+    LOAD_TEST_INSTALLATION_ID,
+    LOAD_TEST_REPO_ID,
+    fake_github_env,
+    free_port,
+    post_delivery,
+    start_app,
+    start_chroma,
+    stop,
+    wait_for_jobs,
+)
+from evals.replay import git_commit, latency_summary, load_issues
+
+EVENT_TYPES = ("issues", "pull_request", "installation")
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """`issues=90,pull_request=5,installation=5` -> weights per event type"""
+    weights = {}
+    for part in mix.split(","):
+        event_type, weight = part.split("=")
+        if event_type not in EVENT_TYPES:
+            raise ValueError(f"Unknown event type {event_type}, use {EVENT_TYPES}")
+        weights[event_type] = float(weight)
+    return weights
+
+
+def installation_payload(repo_id: int) -> Dict[str, Any]:
+    return {
+        "action": "created",
+        "installation": {"id": LOAD_TEST_INSTALLATION_ID},
+        "repositories": [{"id": repo_id, "full_name": f"load-test/repo-{repo_id}"}],
+    }
+
+
+class Deliveries:
+    """Payloads of each event type, built in order from the dataset"""
+
+    def __init__(self, issues: List[Dict[str, Any]], repo_id: int) -> None:
+        self._issues = issues
+        self._repo = {"id": repo_id, "full_name": f"load-test/repo-{repo_id}"}
+        self._next_issue = 0
+        self._next_pull_request = 0
+        self._next_repo_id = repo_id + 1
+
+    def build(self, event_type: str) -> Dict[str, Any]:
+        installation = {"id": LOAD_TEST_INSTALLATION_ID}
+        if event_type == "installation":
+            self._next_repo_id += 1
+            return installation_payload(self._next_repo_id - 1)
+
+        issue = self._issues[self._next_issue % len(self._issues)]
+        self._next_issue += 1
+        if event_type == "issues":
+            return {
+                "action": "opened",
+                "installation": installation,
+                "repository": self._repo,
+                "issue": {
+                    "number": issue["number"],
+                    "title": issue["title"],
+                    "body": issue["body"],
+                },
+            }
+
+        self._next_pull_request += 1
+        return {
+            "action": "opened",
+            "installation": installation,
+            "repository": self._repo,
+            "pull_request": {
+                "number": self._next_pull_request,
+                "title": issue["title"],
+                "body": issue["body"],
+                # a new head commit, so the diff is not served from the cache
+                "head": {"sha": uuid.uuid4().hex},
+            },
+        }
+
+
+def send_at_rate(
+    url: str,
+    secret: str,
+    deliveries: List[Dict[str, Any]],
+    rps: float,
+    concurrency: int,
+) -> List[Dict[str, Any]]:
+    """
+    Post deliveries on a fixed schedule, whether or not earlier ones were answered
+
+    :param deliveries: Each with event_type and payload
+    :return: Per delivery its id, event type, scheduled send time (epoch
+        seconds), HTTP status (None on a connection error) and latency
+    """
+    session = requests.Session()
+    results: List[Dict[str, Any]] = []
+    results_lock = threading.Lock()
+
+    def _post(delivery, scheduled):
+        delivery_id = str(uuid.uuid4())
+        try:
+            status = post_delivery(
+                session,
+                url,
+                secret,
+                delivery["event_type"],
+                delivery["payload"],
+                delivery_id,
+            ).status_code
+        except requests.RequestException:
+            status = None
+        with results_lock:
+            results.append(
+                {
+                    "delivery_id": delivery_id,
+                    "event_type": delivery["event_type"],
+                    "scheduled": scheduled,
+                    "status": status,
+                    "latency": time.time() - scheduled,
+                }
+            )
+
+    start = time.time() + 0.1
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for i, delivery in enumerate(deliveries):
+            scheduled = start + i / rps
+            delay = scheduled - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(_post, delivery, scheduled)
+    return results
+
+
+def summarize(
+    sent: List[Dict[str, Any]], jobs: Dict[str, Any], duration: float
+) -> Dict[str, Any]:
+    """Throughput, error rates and latencies of a group of deliveries"""
+    if not sent:
+        return {}
+    accepted = [delivery for delivery in sent if delivery["status"] == 202]
+    finished = [
+        jobs[delivery["delivery_id"]]
+        for delivery in accepted
+        if delivery["delivery_id"] in jobs
+    ]
+    first = min(delivery["scheduled"] for delivery in sent)
+    last = max([row["updated_at"] for row in finished] or [first])
+    failed = sum(row["status"] == "failed" for row in finished)
+    return {
+        "deliveries": len(sent),
+        "offered_per_second": len(sent) / duration,
+        "http_error_rate": 1 - len(accepted) / len(sent),
+        "accept_latency": latency_summary([delivery["latency"] for delivery in sent]),
+        "jobs_per_second": len(finished) / (last - first) if last > first else 0.0,
+        "job_error_rate": failed / len(finished) if finished else 0.0,
+        "end_to_end_latency": latency_summary(
+            [
+                jobs[delivery["delivery_id"]]["updated_at"] - delivery["scheduled"]
+                for delivery in accepted
+                if delivery["delivery_id"] in jobs
+            ]
+        ),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("dataset", help="CSV or JSONL file of issues")
+    parser.add_argument("--rps", type=float, default=5, help="Deliveries per second")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds to send")
+    parser.add_argument("--mix", default="issues=90,pull_request=5,installation=5")
+    parser.add_argument(
+        "--repo-issues",
+        type=int,
+        default=200,
+        help="Issues listed by the fake GitHub, synced into every installed repository",
+    )
+    parser.add_argument("--workers", type=int, default=1, help="gunicorn workers")
+    parser.add_argument("--github-latency-ms", type=float, default=50)
+    parser.add_argument("--github-jitter-ms", type=float, default=20)
+    parser.add_argument(
+        "--concurrency", type=int, default=64, help="Requests in flight at most"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--startup-timeout", type=float, default=120)
+    parser.add_argument("--job-timeout", type=float, default=600)
+    parser.add_argument("--output", default="evals/results/webhook_load.json")
+    parser.add_argument("--verbose", action="store_true", help="Show server logs")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    issues = load_issues(args.dataset)
+    if len(issues) <= args.repo_issues:
+        parser.error(
+            f"The dataset has {len(issues)} issues, use --repo-issues below it"
+        )
+    fake_github = FakeGitHub(
+        issues[: args.repo_issues], args.github_latency_ms, args.github_jitter_ms
+    )
+    github_url = fake_github.start()
+
+    rng = random.Random(args.seed)
+    deliveries = Deliveries(issues[args.repo_issues :], LOAD_TEST_REPO_ID)
+    schedule = [
+        {"event_type": event_type, "payload": deliveries.build(event_type)}
+        for event_type in rng.choices(
+            list(mix), weights=list(mix.values()), k=int(args.rps * args.duration)
+        )
+    ]
+
+    with tempfile.TemporaryDirectory(prefix="doppelganger-webhook-load-") as data_dir:
+        port = free_port()
+        secret = uuid.uuid4().hex
+        queue_path = os.path.join(data_dir, "jobs.sqlite3")
+        env = {
+            "WEB_CONCURRENCY": str(args.workers),
+            "CHROMA_PATH": os.path.join(data_dir, "state"),
+            "JOB_QUEUE_PATH": queue_path,
+            "JOB_MAX_ATTEMPTS": "1",
+            "WEBHOOK_SECRET": secret,
+            **fake_github_env(github_url, data_dir),
+        }
+        chroma = None
+        if args.workers > 1:
+            chroma_port = free_port()
+            chroma = start_chroma(data_dir, chroma_port, args.startup_timeout)
+            env.update(
+                CHROMA_HOST="127.0.0.1",
+                CHROMA_PORT=str(chroma_port),
+                HOT_INDEX_MEMORY_MB="0",
+            )
+        server = None
+        try:
+            server = start_app(port, env, args.startup_timeout, args.verbose)
+            url = f"http://127.0.0.1:{port}/webhook"
+
+            # index the test repository and load the model before measuring
+            seeded = send_at_rate(
+                url,
+                secret,
+                [
+                    {
+                        "event_type": "installation",
+                        "payload": installation_payload(LOAD_TEST_REPO_ID),
+                    }
+                ],
+                1,
+                1,
+            )
+            wait_for_jobs(queue_path, [seeded[0]["delivery_id"]], args.job_timeout)
+            github_calls_before = fake_github.stats()
+
+            sent = send_at_rate(url, secret, schedule, args.rps, args.concurrency)
+            accepted_ids = [
+                delivery["delivery_id"]
+                for delivery in sent
+                if delivery["status"] == 202
+            ]
+            jobs = {
+                row["delivery_id"]: dict(row)
+                for row in (
+                    wait_for_jobs(queue_path, accepted_ids, args.job_timeout)
+                    if accepted_ids
+                    else []
+                )
+            }
+        finally:
+            if server is not None:
+                stop(server)
+            if chroma is not None:
+                stop(chroma)
+            fake_github.stop()
+
+    github_calls = fake_github.stats()
+    result = {
+        "dataset": args.dataset,
+        "commit": git_commit(),
+        "cpu_count": os.cpu_count(),
+        "settings": {
+            key: getattr(args, key)
+            for key in (
+                "rps",
+                "duration",
+                "mix",
+                "repo_issues",
+                "workers",
+                "github_latency_ms",
+                "github_jitter_ms",
+            )
+        },
+        "total": summarize(sent, jobs, args.duration),
+        "by_event": {
+            event_type: summarize(
+                [delivery for delivery in sent if delivery["event_type"] == event_type],
+                jobs,
+                args.duration,
+            )
+            for event_type in mix
+        },
+        "github": {
+            "requests": {
+                endpoint: count - github_calls_before["requests"].get(endpoint, 0)
+                for endpoint, count in github_calls["requests"].items()
+            },
+            "comments": github_calls["comments"] - github_calls_before["comments"],
+            "closed": github_calls["closed"] - github_calls_before["closed"],
+        },
+    }
+    print(json.dumps(result, indent=2))
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Production serving with gunicorn: `gunicorn -c gunicorn.conf.py app:app`
+
+The app and the embedding model are loaded once in the master process before
+the workers are forked, so the workers share the model's memory pages copy on
+write. Each worker then runs its own pool of JOB_WORKERS job threads on the
+shared SQLite job queue.
+
+Every worker writes its metrics to a temporary directory shared with the
+others, so `/metrics` answers for all workers whichever one serves the scrape.
+"""
+
+import gc
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+# read by config.py on import, the pool is started in post_fork instead
+os.environ["START_JOB_WORKERS"] = "false"
+
+from config import (  # noqa: E402
+    CHROMA_HOST,
+    EMBEDDING_BACKEND,
+    HOT_INDEX_MEMORY_MB,
+    METRICS_FLUSH_INTERVAL,
+)
+
+bind = os.getenv("BIND", "0.0.0.0:4000")
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+threads = int(os.getenv("WEB_THREADS", "4"))
+timeout = int(os.getenv("WEB_TIMEOUT", "60"))
+preload_app = True
+
+# created in the master before forking, so every worker writes to the same one
+metrics_dir = None
+
+
+def on_starting(server):
+    # the worker count as started, WEB_CONCURRENCY or `-w` on the command line
+    if server.cfg.workers > 1 and not CHROMA_HOST:
+        raise RuntimeError(
+            "Several workers cannot share a PersistentClient on CHROMA_PATH, "
+            "run a Chroma server and set CHROMA_HOST"
+        )
+    if server.cfg.workers > 1 and HOT_INDEX_MEMORY_MB > 0:
+        raise RuntimeError(
+            "Hot indexes are per process and would miss writes made by other "
+            "workers, set HOT_INDEX_MEMORY_MB=0 with more than one worker"
+        )
+
+    global metrics_dir
+    metrics_dir = tempfile.mkdtemp(prefix="doppelganger-metrics-")
+
+
+def when_ready(server):
+    from src.webhook_handler import get_worker_pool
+
+    # once for all workers, a worker starting later must not requeue jobs
+    # that are running in the others
+    get_worker_pool().recover()
+
+    # onnxruntime sessions own thread pools that do not survive a fork, so the
+    # ONNX backend is loaded by each worker instead
+    if EMBEDDING_BACKEND == "torch":
+        from src.vector_db import get_embedding_backend
+
+        get_embedding_backend()
+    # keep the garbage collector from touching, and so copying, the shared pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    if EMBEDDING_BACKEND == "torch":
+        import torch
+
+        # intra-op threads per worker, defaults to an even share of the cores
+        torch.set_num_threads(
+            int(
+                os.getenv(
+                    "EMBEDDING_THREADS",
+                    str(max(1, multiprocessing.cpu_count() // server.cfg.workers)),
+                )
+            )
+        )
+
+    from app import start_warm_up
+    from src.metrics import share_metrics
+    from src.webhook_handler import get_worker_pool
+
+    share_metrics(metrics_dir, METRICS_FLUSH_INTERVAL)
+    get_worker_pool().start(recover=False)
+    start_warm_up()
+
+
+def child_exit(server, worker):
+    from src.metrics import remove_process_metrics
+
+    remove_process_metrics(metrics_dir, worker.pid)
+
+
+def on_exit(server):
+    shutil.rmtree(metrics_dir, ignore_errors=True)
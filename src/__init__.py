@@ -1,27 +1,29 @@
-from .github_api import (
-    get_access_token,
-    close_issue,
-    leave_comment,
-    fetch_existing_issues,
-)
-from .issue_handler import handle_new_issue
-from .vector_db import (
-    add_issue_to_chroma,
-    query_similar_issue,
-    remove_issues_from_chroma,
-    add_issues_to_chroma,
-)
-from .webhook_handler import webhook_blueprint
+import importlib
 
-__all__ = [
-    "get_access_token",
-    "close_issue",
-    "leave_comment",
-    "fetch_existing_issues",
-    "handle_new_issue",
-    "add_issue_to_chroma",
-    "query_similar_issue",
-    "remove_issues_from_chroma",
-    "add_issues_to_chroma",
-    "webhook_blueprint",
-]
+# exported name -> submodule, imported on first access so that importing one
+# submodule, e.g. in a spawned parser process, does not load the whole app
+_EXPORTS = {
+    "get_access_token": "github_api",
+    "close_issue": "github_api",
+    "leave_comment": "github_api",
+    "fetch_existing_issues": "github_api",
+    "iter_existing_issues": "github_api",
+    "get_token_cache_stats": "github_api",
+    "get_pull_request_changes": "github_api",
+    "handle_new_issue": "issue_handler",
+    "add_issue_to_chroma": "vector_db",
+    "query_similar_issue": "vector_db",
+    "query_similar_issues": "vector_db",
+    "remove_issues_from_chroma": "vector_db",
+    "add_issues_to_chroma": "vector_db",
+    "get_embedding_cache_stats": "vector_db",
+    "webhook_blueprint": "webhook_handler",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
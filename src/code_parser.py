@@ -0,0 +1,159 @@
+import ast
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Union
+
+FunctionNode = Union[ast.FunctionDef, ast.AsyncFunctionDef]
+
+
+class _FunctionCollector(ast.NodeVisitor):
+    """
+    Collect sync and async functions with their `Class.method` qualified names
+
+    A name defined more than once in the same scope (property setters,
+    `typing.overload` stubs, redefinitions) keeps only its last definition, the
+    one bound at runtime, so function paths are unique within a file.
+    """
+
+    def __init__(self, file_path: str, source: str) -> None:
+        self._file_path = file_path
+        # str.splitlines also splits on form feeds and other characters ast does not
+        self._lines = io.StringIO(source, newline="").readlines()
+        self._scope: List[str] = []
+        self._functions: Dict[str, Dict[str, Any]] = {}
+
+    @property
+    def functions(self) -> List[Dict[str, Any]]:
+        return list(self._functions.values())
+
+    def visit_ClassDef(self, node: ast.ClassDef) -> None:
+        self._scope.append(node.name)
+        self.generic_visit(node)
+        self._scope.pop()
+
+    def visit_FunctionDef(self, node: ast.FunctionDef) -> None:
+        self._add_function(node)
+
+    def visit_AsyncFunctionDef(self, node: ast.AsyncFunctionDef) -> None:
+        self._add_function(node)
+
+    def _add_function(self, node: FunctionNode) -> None:
+        qualified_name = ".".join(self._scope + [node.name])
+        code = self._source_segment(node)
+        if code:
+            function_path = f"{self._file_path}:{qualified_name}"
+            self._functions.pop(function_path, None)
+            self._functions[function_path] = {
+                "function_path": function_path,
+                "file_path": self._file_path,
+                "function_name": node.name,
+                "qualified_name": qualified_name,
+                "source_code": code,
+            }
+
+        self._scope.append(node.name)
+        self.generic_visit(node)
+        self._scope.pop()
+
+    def _source_segment(self, node: FunctionNode) -> str:
+        """Same result as ast.get_source_segment without re-splitting the source per node"""
+        if node.end_lineno is None or node.end_col_offset is None:
+            return ""
+        # column offsets are in UTF-8 bytes
+        lines = [
+            line.encode("utf-8")
+            for line in self._lines[node.lineno - 1 : node.end_lineno]
+        ]
+        if not lines:
+            return ""
+        if len(lines) == 1:
+            return lines[0][node.col_offset : node.end_col_offset].decode("utf-8")
+        first = lines[0][node.col_offset :]
+        last = lines[-1][: node.end_col_offset]
+        return b"".join([first, *lines[1:-1], last]).decode("utf-8")
+
+
+def extract_function_info(file_path: str) -> List[Dict[str, Any]]:
+    """
+    Extract function information from a Python file
+
+    The file is read once. Async functions are included, and methods and nested
+    functions are named by their qualified name, e.g. `Class.method`.
+
+    :param file_path: Path to the Python source file
+    :return: List of function information dictionaries
+    """
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            source = f.read()
+        tree = ast.parse(source, filename=file_path)
+    except (SyntaxError, ValueError):
+        return []  # Skip files with syntax errors or that are not valid UTF-8
+
+    collector = _FunctionCollector(file_path, source)
+    collector.visit(tree)
+    return collector.functions
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _get_pool(max_workers: int) -> ProcessPoolExecutor:
+    """Parser pool shared by every indexing call, started on first use"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != max_workers:
+            if _pool is not None:
+                # maps already running on the old pool still finish
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(
+                max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            _pool_workers = max_workers
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+
+
+def extract_functions_from_files(
+    file_paths: List[str],
+    max_workers: Optional[int] = None,
+    parallel_min_files: int = 32,
+) -> List[List[Dict[str, Any]]]:
+    """
+    Extract functions from many files, in a process pool when there are enough of them
+
+    :param file_paths: Paths of the Python source files
+    :param max_workers: Number of worker processes, defaults to the CPU count
+    :param parallel_min_files: Below this many files parsing stays in-process,
+        where it is cheaper than starting the pool
+    :return: Functions of each file, in the order of `file_paths`
+
+    The workers are spawned rather than forked: the caller is a job worker
+    thread in a process with model thread pools, SQLite connections and locks
+    held by other threads, which a forked child can deadlock on. The pool is
+    kept for later calls, so only the first one pays for starting it.
+    """
+    if len(file_paths) < parallel_min_files:
+        return [extract_function_info(file_path) for file_path in file_paths]
+
+    max_workers = max_workers or os.cpu_count() or 1
+    chunksize = max(1, len(file_paths) // (max_workers * 4))
+    pool = _get_pool(max_workers)
+    try:
+        return list(pool.map(extract_function_info, file_paths, chunksize=chunksize))
+    except BrokenProcessPool:
+        # a worker died, e.g. killed for memory, the next call starts a new pool
+        _discard_pool(pool)
+        raise
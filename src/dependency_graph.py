@@ -0,0 +1,230 @@
+import ast
+import json
+import logging
+import os
+import threading
+from collections import defaultdict
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from config import CHROMA_PATH
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+
+def module_key(relative_path: str) -> str:
+    """`src/vector_db.py` -> `src/vector_db`, the form used in function ids"""
+    return os.path.splitext(relative_path.replace("\\", "/"))[0]
+
+
+def extract_imports(file_path: str, module: str) -> List[str]:
+    """
+    Dotted targets imported by a file, with relative imports resolved
+
+    `from src.vector_db import embed_texts` gives `src.vector_db.embed_texts` and
+    `import src.vector_db` gives `src.vector_db`. Whether a target is a module or
+    a function is decided later, against the modules in the graph.
+    """
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            tree = ast.parse(f.read(), filename=file_path)
+    except (OSError, SyntaxError, ValueError):
+        return []
+
+    # `src/__init__` and `src/module` both resolve `.` to `src`
+    package = module.split("/")
+    targets = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            targets.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                base = package[: -node.level]
+                if node.module:
+                    base = base + node.module.split(".")
+                prefix = ".".join(base)
+            else:
+                prefix = node.module or ""
+            for alias in node.names:
+                if alias.name != "*":
+                    targets.add(f"{prefix}.{alias.name}" if prefix else alias.name)
+    return sorted(targets)
+
+
+class DependencyGraph:
+    """
+    Import graph of an indexed code base, kept in memory with a JSON snapshot
+
+    Modules are keyed like `src/webhook_handler`. Forward edges go from a module to
+    the functions it imports (`src/vector_db/embed_texts`) and the modules it
+    depends on, reverse edges from a module to the modules importing it. Files are
+    re-parsed only when their content hash changes, and transitive lookups are
+    memoized until the next change.
+    """
+
+    def __init__(self, snapshot_path: str) -> None:
+        self._snapshot_path = snapshot_path
+        self._lock = threading.Lock()
+        # module -> {"hash": ..., "imports": [...]}
+        self._files: Dict[str, Dict] = {}
+        self._functions: Dict[str, FrozenSet[str]] = {}
+        self._modules: Dict[str, FrozenSet[str]] = {}
+        self._reverse: Dict[str, FrozenSet[str]] = {}
+        self._closures: Dict[Tuple[str, int], FrozenSet[str]] = {}
+        self._mtime: Optional[float] = None
+        self._load()
+
+    def _snapshot_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self._snapshot_path).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def _load(self) -> None:
+        self._mtime = self._snapshot_mtime()
+        try:
+            with open(self._snapshot_path) as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return
+        if snapshot.get("version") == SNAPSHOT_VERSION:
+            self._files = snapshot["files"]
+            self._derive_edges()
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(self._snapshot_path), exist_ok=True)
+        tmp_path = f"{self._snapshot_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": SNAPSHOT_VERSION, "files": self._files}, f)
+        os.replace(tmp_path, self._snapshot_path)
+        self._mtime = self._snapshot_mtime()
+
+    def reload_if_changed(self) -> None:
+        """Pick up a snapshot written by another worker process"""
+        if self._snapshot_mtime() != self._mtime:
+            with self._lock:
+                if self._snapshot_mtime() != self._mtime:
+                    self._load()
+
+    def refresh(self, files: Dict[str, Tuple[str, str]]) -> Dict[str, int]:
+        """
+        Bring the graph up to date with the indexed files
+
+        :param files: Every indexed file, relative path -> (path on disk, content hash)
+        :return: Number of re-parsed and removed files
+        """
+        current = {module_key(path): entry for path, entry in files.items()}
+        with self._lock:
+            changed = {
+                module: file_path
+                for module, (file_path, content_hash) in current.items()
+                if self._files.get(module, {}).get("hash") != content_hash
+            }
+            removed = [module for module in self._files if module not in current]
+            if not changed and not removed:
+                return {"parsed_files": 0, "removed_files": 0}
+
+            for module in removed:
+                del self._files[module]
+            for module, file_path in changed.items():
+                self._files[module] = {
+                    "hash": current[module][1],
+                    "imports": extract_imports(file_path, module),
+                }
+            self._derive_edges()
+            self._save()
+        return {"parsed_files": len(changed), "removed_files": len(removed)}
+
+    def _resolve_module(self, dotted: str) -> Optional[str]:
+        path = dotted.replace(".", "/")
+        if path in self._files:
+            return path
+        if f"{path}/__init__" in self._files:
+            return f"{path}/__init__"
+        return None
+
+    def _derive_edges(self) -> None:
+        functions: Dict[str, Set[str]] = defaultdict(set)
+        modules: Dict[str, Set[str]] = defaultdict(set)
+        reverse: Dict[str, Set[str]] = defaultdict(set)
+
+        for module, entry in self._files.items():
+            for target in entry["imports"]:
+                imported = self._resolve_module(target)
+                if imported is None and "." in target:
+                    # `from package.module import name`, name is a function or class
+                    parent, name = target.rsplit(".", 1)
+                    imported = self._resolve_module(parent)
+                    if imported is None:
+                        continue
+                    functions[module].add(f"{imported}/{name}")
+                if imported is None or imported == module:
+                    continue
+                modules[module].add(imported)
+                reverse[imported].add(module)
+
+        self._functions = {k: frozenset(v) for k, v in functions.items()}
+        self._modules = {k: frozenset(v) for k, v in modules.items()}
+        self._reverse = {k: frozenset(v) for k, v in reverse.items()}
+        self._closures = {}
+
+    def imported_functions(self, module: str) -> FrozenSet[str]:
+        """Functions a module imports directly"""
+        return self._functions.get(module, frozenset())
+
+    def dependents(self, module: str) -> FrozenSet[str]:
+        """Modules that import `module`"""
+        return self._reverse.get(module, frozenset())
+
+    def dependencies(self, module: str, depth: int = 1) -> FrozenSet[str]:
+        """
+        Functions imported by a module and, up to `depth` import hops, by its dependencies
+
+        A depth of 1 gives the functions the module imports directly.
+        """
+        key = (module, depth)
+        closure = self._closures.get(key)
+        if closure is not None:
+            return closure
+
+        with self._lock:
+            found: Set[str] = set()
+            visited = {module}
+            frontier = [module]
+            for _ in range(depth):
+                next_frontier = []
+                for current in frontier:
+                    found.update(self._functions.get(current, ()))
+                    for imported in self._modules.get(current, ()):
+                        if imported not in visited:
+                            visited.add(imported)
+                            next_frontier.append(imported)
+                frontier = next_frontier
+            closure = frozenset(found)
+            self._closures[key] = closure
+        return closure
+
+    def dependencies_of_files(
+        self, file_paths: Iterable[str], depth: int = 1
+    ) -> List[str]:
+        """Functions the changed files depend on, e.g. the files of a pull request"""
+        functions: Set[str] = set()
+        for file_path in file_paths:
+            functions.update(self.dependencies(module_key(file_path), depth))
+        return sorted(functions)
+
+
+_graphs: Dict[str, DependencyGraph] = {}
+_graphs_lock = threading.Lock()
+
+
+def get_dependency_graph(repo_id: int, branch: str = "main") -> DependencyGraph:
+    """Dependency graph of a repository branch, loaded from its snapshot on first use"""
+    path = os.path.join(CHROMA_PATH, f"dependency_graph_{repo_id}_{branch}.json")
+    with _graphs_lock:
+        if path not in _graphs:
+            _graphs[path] = DependencyGraph(path)
+        graph = _graphs[path]
+    graph.reload_if_changed()
+    return graph
@@ -0,0 +1,131 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from typing import Dict, Iterable
+
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so formatting-only edits map to the same cache entry"""
+    return " ".join(text.split())
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache keyed by model name and a hash of the normalized text
+
+    Entries live in a SQLite file and the least recently used ones are evicted once
+    the cache holds more than `max_entries` vectors. A `max_entries` of 0 disables
+    the cache.
+    """
+
+    def __init__(self, path: str, max_entries: int) -> None:
+        self._path = path
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if not self.enabled:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    vector BLOB NOT NULL,
+                    last_used REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings (last_used)"
+            )
+            self._size = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @property
+    def enabled(self) -> bool:
+        return self._max_entries > 0
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self._path, timeout=30, isolation_level=None)
+
+    @staticmethod
+    def make_key(model_name: str, text: str) -> str:
+        digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        return f"{model_name}:{digest}"
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, np.ndarray]:
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        if self.enabled and keys:
+            with closing(self._connect()) as conn:
+                # stay well below SQLite's bound parameter limit
+                for i in range(0, len(keys), 500):
+                    chunk = keys[i : i + 500]
+                    placeholders = ",".join("?" * len(chunk))
+                    rows = conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                        chunk,
+                    ).fetchall()
+                    found.update(
+                        (key, np.frombuffer(vector, dtype=np.float32))
+                        for key, vector in rows
+                    )
+                if found:
+                    now = time.time()
+                    conn.executemany(
+                        "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                        [(now, key) for key in found],
+                    )
+
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, vectors: Dict[str, np.ndarray]) -> None:
+        if not self.enabled or not vectors:
+            return
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            inserted = conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [
+                    (key, np.asarray(vector, dtype=np.float32).tobytes(), now)
+                    for key, vector in vectors.items()
+                ],
+            ).rowcount
+            with self._lock:
+                # replaced rows are counted too, so recount before evicting
+                self._size += inserted
+                if self._size > self._max_entries:
+                    self._size = conn.execute(
+                        "SELECT COUNT(*) FROM embeddings"
+                    ).fetchone()[0]
+                overflow = self._size - self._max_entries
+                if overflow > 0:
+                    conn.execute(
+                        "DELETE FROM embeddings WHERE key IN "
+                        "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                        (overflow,),
+                    )
+                    self._size = self._max_entries
+            conn.execute("COMMIT")
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": self._size if self.enabled else 0,
+            }
@@ -0,0 +1,318 @@
+import argparse
+import inspect
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import time
+from typing import List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# all-MiniLM-L6-v2 truncates inputs to this many tokens
+MAX_SEQ_LENGTH = 256
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_QUANTIZED_MODEL_FILE = "model_int8.onnx"
+
+
+class EmbeddingBackend:
+    """Turns texts into L2-normalized sentence embeddings"""
+
+    # identifies the vectors a backend produces, used in embedding cache keys
+    name: str
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        raise NotImplementedError
+
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """PyTorch SentenceTransformer model"""
+
+    def __init__(self, model_name: str) -> None:
+        from sentence_transformers import SentenceTransformer
+
+        self.name = model_name
+        self._model = SentenceTransformer(model_name)
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        return self._model.encode(texts, batch_size=batch_size)
+
+
+class OnnxBackend(EmbeddingBackend):
+    """
+    The same model exported to ONNX and run with onnxruntime
+
+    Mean pooling and normalization mirror the SentenceTransformer pipeline of
+    all-MiniLM-L6-v2. Create the model directory with `python -m src.embeddings export`.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        model_dir: str,
+        quantized: bool = True,
+        num_threads: int = 0,
+    ) -> None:
+        # tokenizers instead of transformers, which would pull in torch
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError(
+                "The onnx embedding backend needs onnxruntime and tokenizers, "
+                "install them with `pip install -r requirements-onnx.txt`"
+            ) from e
+
+        model_file = ONNX_QUANTIZED_MODEL_FILE if quantized else ONNX_MODEL_FILE
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        self._session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, model_file),
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+        self._input_names = {i.name for i in self._session.get_inputs()}
+        self._tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self._tokenizer.enable_truncation(MAX_SEQ_LENGTH)
+        pad_token = "[PAD]"
+        self._tokenizer.enable_padding(
+            pad_id=self._tokenizer.token_to_id(pad_token) or 0, pad_token=pad_token
+        )
+        self.name = f"{model_name}:onnx{'-int8' if quantized else ''}"
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        batches = []
+        for i in range(0, len(texts), batch_size):
+            encodings = self._tokenizer.encode_batch(texts[i : i + batch_size])
+            tokens = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.array(
+                    [e.attention_mask for e in encodings], dtype=np.int64
+                ),
+                "token_type_ids": np.array(
+                    [e.type_ids for e in encodings], dtype=np.int64
+                ),
+            }
+            inputs = {
+                name: value
+                for name, value in tokens.items()
+                if name in self._input_names
+            }
+            token_embeddings = self._session.run(None, inputs)[0]
+
+            mask = tokens["attention_mask"][..., np.newaxis].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.maximum(
+                mask.sum(axis=1), 1e-9
+            )
+            batches.append(
+                pooled
+                / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+            )
+        if not batches:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.concatenate(batches).astype(np.float32)
+
+
+def create_backend(
+    backend: str,
+    model_name: str,
+    onnx_model_dir: Optional[str] = None,
+    onnx_quantized: bool = True,
+    onnx_threads: int = 0,
+) -> EmbeddingBackend:
+    if backend == "torch":
+        return SentenceTransformerBackend(model_name)
+    if backend == "onnx":
+        return OnnxBackend(model_name, onnx_model_dir, onnx_quantized, onnx_threads)
+    raise ValueError(f"Unknown embedding backend: {backend}")
+
+
+def export_onnx(model_name: str, output_dir: str, quantize: bool = True) -> None:
+    """
+    Export the transformer of a SentenceTransformer model to ONNX
+
+    Writes `model.onnx`, the tokenizer files and, with `quantize`, a dynamically
+    int8-quantized `model_int8.onnx` to `output_dir`.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(output_dir, exist_ok=True)
+    sentence_model = SentenceTransformer(model_name, device="cpu")
+    transformer = sentence_model[0].auto_model.eval()
+    tokenizer = sentence_model.tokenizer
+    tokenizer.save_pretrained(output_dir)
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    input_names = [
+        name
+        for name in ("input_ids", "attention_mask", "token_type_ids")
+        if name in sample
+    ]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    class _LastHiddenState(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs))).last_hidden_state
+
+    model_path = os.path.join(output_dir, ONNX_MODEL_FILE)
+    export_kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        # keep the TorchScript exporter, which supports dynamic_axes
+        export_kwargs["dynamo"] = False
+    with torch.no_grad():
+        torch.onnx.export(
+            _LastHiddenState(transformer),
+            tuple(sample[name] for name in input_names),
+            model_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+            **export_kwargs,
+        )
+    logger.info(f"Exported {model_name} to {model_path}")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantized_path = os.path.join(output_dir, ONNX_QUANTIZED_MODEL_FILE)
+        quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+        logger.info(f"Quantized model written to {quantized_path}")
+
+
+def _sample_texts(path: Optional[str], limit: int) -> List[str]:
+    if path:
+        import csv
+
+        with open(path, newline="", encoding="utf-8") as f:
+            texts = [
+                f"{row['title']} {row.get('body') or ''}".strip()
+                for row in csv.DictReader(f)
+            ]
+    else:
+        texts = [
+            "App crashes on startup after updating to the latest version",
+            "Add dark mode to the settings page",
+            "Login with Google fails with a 500 error",
+            "Docs: installation instructions are out of date",
+        ]
+    # repeat short samples so throughput is measured over `limit` texts
+    return [texts[i % len(texts)] for i in range(limit)]
+
+
+def parity_check(
+    torch_backend: EmbeddingBackend, other: EmbeddingBackend, texts: List[str]
+) -> dict:
+    """Cosine agreement between two backends' embeddings of the same texts"""
+    a = torch_backend.encode(texts)
+    b = other.encode(texts)
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    cosines = (a * b).sum(axis=1)
+    return {
+        "texts": len(texts),
+        "mean_cosine": float(cosines.mean()),
+        "min_cosine": float(cosines.min()),
+        "p01_cosine": float(np.percentile(cosines, 1)),
+    }
+
+
+def _peak_rss_mb() -> float:
+    # VmHWM starts over at exec, unlike ru_maxrss which keeps the parent's peak
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _benchmark_worker(kwargs: dict, texts: List[str], batch_size: int, queue) -> None:
+    start = time.perf_counter()
+    backend = create_backend(**kwargs)
+    backend.encode(texts[:batch_size], batch_size)
+    loaded = time.perf_counter()
+    backend.encode(texts, batch_size)
+    encoded = time.perf_counter()
+    queue.put(
+        {
+            "backend": backend.name,
+            "load_seconds": loaded - start,
+            "texts_per_second": len(texts) / (encoded - loaded),
+            "peak_rss_mb": _peak_rss_mb(),
+        }
+    )
+
+
+def benchmark(backend_kwargs: List[dict], texts: List[str], batch_size: int) -> list:
+    """Throughput and peak RSS of each backend, each measured in a fresh process"""
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for kwargs in backend_kwargs:
+        queue = context.Queue()
+        process = context.Process(
+            target=_benchmark_worker, args=(kwargs, texts, batch_size, queue)
+        )
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            raise RuntimeError(f"Benchmark of the {kwargs['backend']} backend failed")
+        results.append(queue.get(timeout=10))
+    return results
+
+
+def main() -> None:
+    from config import EMBEDDING_MODEL_NAME, ONNX_MODEL_DIR
+
+    parser = argparse.ArgumentParser(description="Manage embedding backends")
+    parser.add_argument("command", choices=["export", "parity", "benchmark"])
+    parser.add_argument("--model-name", default=EMBEDDING_MODEL_NAME)
+    parser.add_argument("--onnx-model-dir", default=ONNX_MODEL_DIR)
+    parser.add_argument("--no-quantize", action="store_true")
+    parser.add_argument("--texts", help="CSV with title (and body) columns to embed")
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "export":
+        export_onnx(args.model_name, args.onnx_model_dir, not args.no_quantize)
+        return
+
+    texts = _sample_texts(args.texts, args.limit)
+    onnx_kwargs = {
+        "backend": "onnx",
+        "model_name": args.model_name,
+        "onnx_model_dir": args.onnx_model_dir,
+        "onnx_quantized": not args.no_quantize,
+    }
+    if args.command == "parity":
+        result = parity_check(
+            create_backend("torch", args.model_name),
+            create_backend(**onnx_kwargs),
+            texts,
+        )
+        print(json.dumps(result, indent=2))
+    else:
+        results = benchmark(
+            [{"backend": "torch", "model_name": args.model_name}, onnx_kwargs],
+            texts,
+            args.batch_size,
+        )
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,79 +1,275 @@
+import threading
 import time
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
 
 import jwt
-import requests
 
-from config import APP_ID, PRIVATE_KEY
+from config import APP_ID, PR_DIFF_CACHE_SIZE, get_private_key
+from src.github_client import get_github_client
+from src.metrics import timed
 
+JWT_LIFETIME = 600
+# refresh cached credentials this many seconds before they expire
+TOKEN_REFRESH_MARGIN = 60
 
-def generate_jwt():
-    current_time = int(time.time())
-    payload = {"iat": current_time, "exp": current_time + 600, "iss": APP_ID}
-    return jwt.encode(payload, PRIVATE_KEY, algorithm="RS256")
 
+class _TokenCache:
+    """Thread-safe cache of the app JWT and per-installation access tokens"""
 
-def get_access_token(installation_id):
-    jwt_token = generate_jwt()
-    headers = {
-        "Authorization": f"Bearer {jwt_token}",
-        "Accept": "application/vnd.github.v3+json",
-    }
-    response = requests.post(
-        f"https://api.github.com/app/installations/{installation_id}/access_tokens",
-        headers=headers,
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._installation_locks = defaultdict(threading.Lock)
+        self._jwt = None
+        self._jwt_expires_at = 0.0
+        self._tokens = {}
+        self.stats = {
+            "jwt_hits": 0,
+            "jwt_misses": 0,
+            "token_hits": 0,
+            "token_misses": 0,
+        }
+
+    def get_jwt(self):
+        with self._lock:
+            if self._jwt and time.time() < self._jwt_expires_at - TOKEN_REFRESH_MARGIN:
+                self.stats["jwt_hits"] += 1
+                return self._jwt
+            self.stats["jwt_misses"] += 1
+            current_time = int(time.time())
+            self._jwt = generate_jwt(current_time)
+            self._jwt_expires_at = current_time + JWT_LIFETIME
+            return self._jwt
+
+    def get_access_token(self, installation_id):
+        with self._lock:
+            installation_lock = self._installation_locks[installation_id]
+
+        # one refresh per installation at a time, other installations are not blocked
+        with installation_lock:
+            cached = self._tokens.get(installation_id)
+            if cached and time.time() < cached[1] - TOKEN_REFRESH_MARGIN:
+                with self._lock:
+                    self.stats["token_hits"] += 1
+                return cached[0]
+
+            with self._lock:
+                self.stats["token_misses"] += 1
+            token, expires_at = _request_access_token(installation_id, self.get_jwt())
+            self._tokens[installation_id] = (token, expires_at)
+            return token
+
+    def invalidate(self, installation_id):
+        self._tokens.pop(installation_id, None)
+
+
+def generate_jwt(current_time=None):
+    if current_time is None:
+        current_time = int(time.time())
+    payload = {"iat": current_time, "exp": current_time + JWT_LIFETIME, "iss": APP_ID}
+    return jwt.encode(payload, get_private_key(), algorithm="RS256")
+
+
+def _request_access_token(installation_id, jwt_token):
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    response = get_github_client().post(
+        f"/app/installations/{installation_id}/access_tokens", headers=headers
     )
     response.raise_for_status()
-    return response.json()["token"]
+    data = response.json()
+    expires_at = datetime.strptime(data["expires_at"], "%Y-%m-%dT%H:%M:%SZ")
+    return data["token"], expires_at.replace(tzinfo=timezone.utc).timestamp()
+
+
+_token_cache = _TokenCache()
+
+
+def get_access_token(installation_id):
+    with timed("github_access_token"):
+        return _token_cache.get_access_token(installation_id)
+
+
+def invalidate_access_token(installation_id):
+    """Drop a cached installation token, e.g. after GitHub rejected it"""
+    _token_cache.invalidate(installation_id)
+
+
+def get_token_cache_stats():
+    """Hit/miss counters for the JWT and installation token caches"""
+    return dict(_token_cache.stats)
+
+
+def _installation_headers(installation_id):
+    return {"Authorization": f"token {get_access_token(installation_id)}"}
+
+
+def _raise_for_status(response, installation_id):
+    if response.status_code == 401:
+        invalidate_access_token(installation_id)
+    response.raise_for_status()
 
 
 def close_issue(installation_id, repo_full_name, issue_number):
-    access_token = get_access_token(installation_id)
-    headers = {
-        "Authorization": f"token {access_token}",
-        "Accept": "application/vnd.github.v3+json",
-    }
     payload = {"state": "closed"}
-    response = requests.patch(
-        f"https://api.github.com/repos/{repo_full_name}/issues/{issue_number}",
-        json=payload,
-        headers=headers,
-    )
-    response.raise_for_status()
+    headers = _installation_headers(installation_id)
+    with timed("github_close_issue"):
+        response = get_github_client().patch(
+            f"/repos/{repo_full_name}/issues/{issue_number}",
+            json=payload,
+            headers=headers,
+        )
+    _raise_for_status(response, installation_id)
 
 
 def leave_comment(installation_id, repo_full_name, issue_number, comment_text):
-    access_token = get_access_token(installation_id)
-    headers = {
-        "Authorization": f"token {access_token}",
-        "Accept": "application/vnd.github.v3+json",
-    }
     payload = {"body": comment_text}
-    response = requests.post(
-        f"https://api.github.com/repos/{repo_full_name}/issues/{issue_number}/comments",
-        json=payload,
-        headers=headers,
-    )
-    response.raise_for_status()
+    headers = _installation_headers(installation_id)
+    with timed("github_comment"):
+        response = get_github_client().post(
+            f"/repos/{repo_full_name}/issues/{issue_number}/comments",
+            json=payload,
+            headers=headers,
+        )
+    _raise_for_status(response, installation_id)
 
 
 def fetch_existing_issues(installation_id, repo_full_name):
-    access_token = get_access_token(installation_id)
+    headers = _installation_headers(installation_id)
+    with timed("github_fetch_issues"):
+        return get_github_client().paginate(
+            f"/repos/{repo_full_name}/issues",
+            params={"state": "all"},
+            headers=headers,
+        )
+
+
+def iter_existing_issues(installation_id, repo_full_name, since=None):
+    """
+    Stream the issues of a repository page by page
+
+    Only the fields needed for indexing are kept, so raw page JSON is released
+    as soon as the page has been consumed.
+
+    :param since: ISO 8601 timestamp, only issues updated at or after it are returned
+    """
+    params = {"state": "all"}
+    if since:
+        params["since"] = since
+    pages = get_github_client().iter_pages(
+        f"/repos/{repo_full_name}/issues",
+        params=params,
+        headers=_installation_headers(installation_id),
+    )
+    while True:
+        # time spent waiting for each page, not the caller's work in between
+        with timed("github_fetch_issues_page"):
+            page = next(pages, None)
+        if page is None:
+            return
+        for issue in page:
+            yield {
+                "number": issue["number"],
+                "title": issue["title"],
+                "body": issue.get("body"),
+                "state": issue.get("state"),
+                "updated_at": issue.get("updated_at"),
+            }
+
+
+class _PullRequestChangesCache:
+    """LRU cache of pull request diffs and changed files, keyed by head commit"""
+
+    def __init__(self, max_entries):
+        self._lock = threading.Lock()
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, changes):
+        if self._max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = changes
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+
+_pull_request_changes_cache = _PullRequestChangesCache(PR_DIFF_CACHE_SIZE)
+
+
+def fetch_pull_request_diff(
+    installation_id, repo_full_name, pr_number
+) -> Optional[str]:
+    """
+    Unified diff of a pull request
+
+    :return: None when GitHub refuses to render the diff because it is too large
+    """
     headers = {
-        "Authorization": f"token {access_token}",
-        "Accept": "application/vnd.github.v3+json",
+        **_installation_headers(installation_id),
+        "Accept": "application/vnd.github.v3.diff",
     }
-    issues = []
-    page = 1
-    while True:
-        response = requests.get(
-            f"https://api.github.com/repos/{repo_full_name}/issues",
-            headers=headers,
-            params={"state": "all", "per_page": 100, "page": page},
+    response = get_github_client().get(
+        f"/repos/{repo_full_name}/pulls/{pr_number}", headers=headers
+    )
+    if response.status_code == 406:
+        return None
+    _raise_for_status(response, installation_id)
+    return response.text
+
+
+def fetch_pull_request_files(installation_id, repo_full_name, pr_number):
+    """Every changed file of a pull request, across all pages"""
+    return get_github_client().paginate(
+        f"/repos/{repo_full_name}/pulls/{pr_number}/files",
+        headers=_installation_headers(installation_id),
+    )
+
+
+def _diff_from_patches(files) -> str:
+    parts = []
+    for file in files:
+        old_path = file.get("previous_filename") or file["filename"]
+        parts.append(
+            f"diff --git a/{old_path} b/{file['filename']}\n"
+            f"--- a/{old_path}\n+++ b/{file['filename']}\n"
         )
-        response.raise_for_status()
-        page_issues = response.json()
-        if not page_issues:
-            break
-        issues.extend(page_issues)
-        page += 1
-    return issues
+        if file.get("patch"):
+            parts.append(file["patch"].rstrip("\n") + "\n")
+    return "".join(parts)
+
+
+def get_pull_request_changes(
+    installation_id, repo_full_name, pr_number, head_sha
+) -> Tuple[str, List[str]]:
+    """
+    Diff and changed file names of a pull request, downloaded once per head commit
+
+    Re-deliveries and edits that leave the head commit unchanged are served from
+    memory. Diffs GitHub will not render are rebuilt from the per-file patches.
+
+    :return: The unified diff and the names of the changed files
+    """
+    key = (repo_full_name, pr_number, head_sha)
+    cached = _pull_request_changes_cache.get(key)
+    if cached is not None:
+        return cached
+
+    with timed("github_pr_files"):
+        files = fetch_pull_request_files(installation_id, repo_full_name, pr_number)
+    with timed("github_pr_diff"):
+        diff = fetch_pull_request_diff(installation_id, repo_full_name, pr_number)
+    if diff is None:
+        diff = _diff_from_patches(files)
+
+    changes = (diff, [file["filename"] for file in files])
+    _pull_request_changes_cache.put(key, changes)
+    return changes
@@ -0,0 +1,193 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import GITHUB_API_URL, GITHUB_MAX_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# longest single sleep when GitHub asks us to back off
+MAX_RATE_LIMIT_WAIT = 900
+
+
+class GitHubClient:
+    """GitHub REST client on a pooled keep-alive session with retries and rate limit handling"""
+
+    def __init__(
+        self,
+        base_url: str = GITHUB_API_URL,
+        max_workers: int = GITHUB_MAX_WORKERS,
+        max_retries: int = 3,
+        backoff_factor: float = 0.5,
+        timeout: float = 30,
+        max_rate_limit_retries: int = 3,
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._max_rate_limit_retries = max_rate_limit_retries
+        self._rate_limit_lock = threading.Lock()
+        self._rate_limit_reset: Optional[float] = None
+
+        # only idempotent methods are retried, so comments are never posted twice
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(500, 502, 503, 504),
+        )
+        adapter = HTTPAdapter(
+            pool_connections=max_workers, pool_maxsize=max_workers, max_retries=retry
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["Accept"] = "application/vnd.github.v3+json"
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """Send a request, waiting out primary and secondary rate limits"""
+        url = path if path.startswith("http") else f"{self.base_url}{path}"
+        kwargs.setdefault("timeout", self.timeout)
+
+        for attempt in range(self._max_rate_limit_retries + 1):
+            self._wait_for_rate_limit_reset()
+            response = self.session.request(method, url, **kwargs)
+            self._record_rate_limit(response)
+
+            delay = self._rate_limit_delay(response)
+            if delay is None or attempt == self._max_rate_limit_retries:
+                return response
+            logger.warning(f"Rate limited on {method} {url}, retrying in {delay:.0f}s")
+            time.sleep(delay)
+        return response
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+    def patch(self, path: str, **kwargs) -> requests.Response:
+        return self.request("PATCH", path, **kwargs)
+
+    def paginate(
+        self,
+        path: str,
+        params: Optional[Dict[str, Any]] = None,
+        per_page: int = 100,
+        **kwargs,
+    ) -> List[Any]:
+        """Fetch every page of a list endpoint and return all items in page order"""
+        return [
+            item
+            for page in self.iter_pages(path, params, per_page, **kwargs)
+            for item in page
+        ]
+
+    def iter_pages(
+        self,
+        path: str,
+        params: Optional[Dict[str, Any]] = None,
+        per_page: int = 100,
+        **kwargs,
+    ) -> Iterator[List[Any]]:
+        """
+        Yield the pages of a list endpoint in order as they arrive
+
+        The first page is fetched on its own to read the last page number from
+        the `Link` header. The remaining pages are fetched concurrently, with at
+        most `max_workers` pages in flight or waiting to be consumed, so memory
+        stays bounded by the page size however long the list is.
+
+        :param path: API path or absolute URL of the list endpoint
+        :param params: Query parameters sent with every page
+        :param per_page: Page size requested from GitHub
+        """
+        params = {**(params or {}), "per_page": per_page}
+
+        first_page = self._get_page(path, params, 1, **kwargs)
+        last_page = self._last_page_number(first_page)
+        yield first_page.json()
+
+        if last_page <= 1:
+            return
+
+        def fetch(page: int) -> List[Any]:
+            return self._get_page(path, params, page, **kwargs).json()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = deque()
+            next_page = 2
+            while pending or next_page <= last_page:
+                while next_page <= last_page and len(pending) < self.max_workers:
+                    pending.append(executor.submit(fetch, next_page))
+                    next_page += 1
+                yield pending.popleft().result()
+
+    def _get_page(
+        self, path: str, params: Dict[str, Any], page: int, **kwargs
+    ) -> requests.Response:
+        response = self.get(path, params={**params, "page": page}, **kwargs)
+        response.raise_for_status()
+        return response
+
+    @staticmethod
+    def _last_page_number(response: requests.Response) -> int:
+        last_url = response.links.get("last", {}).get("url")
+        if not last_url:
+            return 1
+        return int(parse_qs(urlparse(last_url).query).get("page", ["1"])[0])
+
+    def _record_rate_limit(self, response: requests.Response) -> None:
+        if response.headers.get("X-RateLimit-Remaining") != "0":
+            return
+        reset = response.headers.get("X-RateLimit-Reset")
+        if reset:
+            with self._rate_limit_lock:
+                self._rate_limit_reset = float(reset)
+
+    def _wait_for_rate_limit_reset(self) -> None:
+        with self._rate_limit_lock:
+            reset = self._rate_limit_reset
+        if reset is None:
+            return
+        delay = reset - time.time() + 1
+        if delay > 0:
+            logger.warning(f"GitHub rate limit exhausted, waiting {delay:.0f}s")
+            time.sleep(min(delay, MAX_RATE_LIMIT_WAIT))
+        with self._rate_limit_lock:
+            if self._rate_limit_reset == reset:
+                self._rate_limit_reset = None
+
+    @staticmethod
+    def _rate_limit_delay(response: requests.Response) -> Optional[float]:
+        """Seconds to wait before retrying a rate limited response, None if not rate limited"""
+        if response.status_code not in (403, 429):
+            return None
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            return min(float(retry_after), MAX_RATE_LIMIT_WAIT)
+        if response.headers.get("X-RateLimit-Remaining") == "0":
+            reset = float(response.headers.get("X-RateLimit-Reset", time.time() + 60))
+            return min(max(reset - time.time() + 1, 1), MAX_RATE_LIMIT_WAIT)
+        return None
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_github_client() -> GitHubClient:
+    """Shared client so all GitHub calls reuse the same connection pool"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = GitHubClient()
+        return _client
@@ -0,0 +1,391 @@
+import argparse
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class Loaded(NamedTuple):
+    """Contents of a collection as returned by `collection.get`"""
+
+    ids: List[str]
+    embeddings: Any
+    metadatas: List[Dict[str, Any]]
+    documents: List[str]
+    space: str
+
+
+def _normalize(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+class HotIndex:
+    """
+    Exact nearest neighbour index of one collection held in memory
+
+    Rows live in a contiguous float32 matrix of unit vectors that grows by
+    doubling, so appends are amortized O(1) and a query is one matrix-vector
+    product. Appends only write past the rows visible to running searches, while
+    replacing or deleting rows builds new arrays, so searches read a consistent
+    snapshot without holding the lock during the product. Distances are those
+    of the collection's space for unit vectors, `2 - 2 * cosine` for l2.
+    """
+
+    def __init__(self, loaded: Loaded) -> None:
+        self.space = loaded.space
+        self._lock = threading.Lock()
+        self._size = 0
+        self._matrix = np.empty((0, 0), dtype=np.float32)
+        self._ids: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._documents: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._document_bytes = 0
+        if loaded.ids:
+            self._rebuild(
+                list(loaded.ids),
+                _normalize(loaded.embeddings),
+                list(loaded.metadatas),
+                list(loaded.documents),
+            )
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held, the matrix plus the stored documents"""
+        return self._matrix.nbytes + self._document_bytes
+
+    def _rebuild(self, ids, matrix, metadatas, documents) -> None:
+        self._matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        self._ids, self._metadatas, self._documents = ids, metadatas, documents
+        self._positions = {id_: row for row, id_ in enumerate(ids)}
+        self._document_bytes = sum(len(document) for document in documents)
+        self._size = len(ids)
+
+    def upsert(self, ids, embeddings, metadatas, documents) -> None:
+        vectors = _normalize(embeddings)
+        with self._lock:
+            replaced = [id_ for id_ in ids if id_ in self._positions]
+            if replaced:
+                # copy on write, a running search may still read the old rows
+                matrix = self._matrix[: self._size].copy()
+                all_ids, all_metadatas, all_documents = (
+                    list(self._ids),
+                    list(self._metadatas),
+                    list(self._documents),
+                )
+                for id_, vector, metadata, document in zip(
+                    ids, vectors, metadatas, documents
+                ):
+                    row = self._positions.get(id_)
+                    if row is None:
+                        continue
+                    matrix[row] = vector
+                    all_metadatas[row] = metadata
+                    all_documents[row] = document
+                self._rebuild(all_ids, matrix, all_metadatas, all_documents)
+
+            new_rows = [
+                row for row, id_ in enumerate(ids) if id_ not in self._positions
+            ]
+            if not new_rows:
+                return
+            needed = self._size + len(new_rows)
+            if self._matrix.shape[0] < needed or not self._size:
+                capacity = max(needed, 2 * self._matrix.shape[0], 16)
+                grown = np.empty((capacity, vectors.shape[1]), dtype=np.float32)
+                if self._size:
+                    grown[: self._size] = self._matrix[: self._size]
+                self._matrix = grown
+            self._matrix[self._size : needed] = vectors[new_rows]
+            for row in new_rows:
+                self._positions[ids[row]] = len(self._ids)
+                self._ids.append(ids[row])
+                self._metadatas.append(metadatas[row])
+                self._documents.append(documents[row])
+                self._document_bytes += len(documents[row])
+            self._size = needed
+
+    def delete(self, ids) -> None:
+        with self._lock:
+            rows = {self._positions[id_] for id_ in ids if id_ in self._positions}
+            if not rows:
+                return
+            keep = [row for row in range(self._size) if row not in rows]
+            self._rebuild(
+                [self._ids[row] for row in keep],
+                self._matrix[keep],
+                [self._metadatas[row] for row in keep],
+                [self._documents[row] for row in keep],
+            )
+
+    def search(self, embedding, k: int) -> Dict[str, List[List[Any]]]:
+        """Exact top-k, in the shape of `collection.query` for a single query"""
+        with self._lock:
+            size = self._size
+            matrix = self._matrix[:size]
+            ids, metadatas, documents = self._ids, self._metadatas, self._documents
+
+        k = min(k, size)
+        if k == 0:
+            return {
+                "ids": [[]],
+                "metadatas": [[]],
+                "documents": [[]],
+                "distances": [[]],
+            }
+        similarities = matrix @ _normalize([embedding])[0]
+        if k < size:
+            top = np.argpartition(-similarities, k - 1)[:k]
+        else:
+            top = np.arange(size)
+        top = top[np.argsort(-similarities[top], kind="stable")]
+        if self.space == "l2":
+            distances = 2 - 2 * similarities[top]
+        else:
+            distances = 1 - similarities[top]
+        return {
+            "ids": [[ids[row] for row in top]],
+            "metadatas": [[metadatas[row] for row in top]],
+            "documents": [[documents[row] for row in top]],
+            "distances": [distances.astype(float).tolist()],
+        }
+
+
+class HotIndexCache:
+    """
+    Hot indexes of the most recently queried collections within a memory budget
+
+    The least recently used indexes are evicted once their total size exceeds
+    `max_bytes`, and a collection larger than the whole budget is not kept. It
+    is not loaded again until it is written to, so queries on it go straight to
+    Chroma. A budget of 0 disables the cache.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._indexes: "OrderedDict[str, HotIndex]" = OrderedDict()
+        self._load_locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+        # collections that did not fit the budget when last loaded
+        self._oversized: Set[str] = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._max_bytes > 0
+
+    def _load_lock(self, name: str) -> threading.Lock:
+        with self._lock:
+            return self._load_locks[name]
+
+    def get(self, name: str, load: Callable[[], Loaded]) -> Optional[HotIndex]:
+        """
+        Hot index of the collection `name`, built with `load` on a miss
+
+        Loading holds only the collection's own lock, so lookups of other
+        collections are not blocked, while writes to this collection that land
+        while it reads from Chroma wait and are applied to the new index afterwards.
+
+        :return: None when the cache is disabled or the collection does not fit
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            index = self._lookup(name)
+            if index is not None or name in self._oversized:
+                return index
+            load_lock = self._load_locks[name]
+
+        # one load per collection at a time, the others are not blocked
+        with load_lock:
+            with self._lock:
+                index = self._lookup(name)
+                if index is not None or name in self._oversized:
+                    return index
+                self.misses += 1
+
+            start = time.perf_counter()
+            index = HotIndex(load())
+            if index.nbytes > self._max_bytes:
+                logger.info(
+                    f"Collection {name} ({index.nbytes / 2**20:.1f} MiB) exceeds the "
+                    f"hot index budget, querying Chroma instead"
+                )
+                with self._lock:
+                    self._oversized.add(name)
+                return None
+            with self._lock:
+                self._indexes[name] = index
+                self._evict()
+        logger.info(
+            f"Loaded hot index for {name}: {len(index)} rows, "
+            f"{index.nbytes / 2**20:.1f} MiB in {time.perf_counter() - start:.2f}s"
+        )
+        return index
+
+    def _lookup(self, name: str) -> Optional[HotIndex]:
+        """Loaded index of `name`, counted as a hit, the caller holds the lock"""
+        index = self._indexes.get(name)
+        if index is not None:
+            self._indexes.move_to_end(name)
+            self.hits += 1
+        return index
+
+    def _evict(self) -> None:
+        total = sum(index.nbytes for index in self._indexes.values())
+        while total > self._max_bytes and len(self._indexes) > 1:
+            name, index = self._indexes.popitem(last=False)
+            total -= index.nbytes
+            self.evictions += 1
+            logger.info(f"Evicted hot index for {name}")
+
+    def upsert(self, name: str, ids, embeddings, metadatas, documents) -> None:
+        """Apply a write to the collection `name` if its index is loaded"""
+        with self._load_lock(name), self._lock:
+            self._oversized.discard(name)
+            index = self._indexes.get(name)
+            if index is not None:
+                index.upsert(ids, embeddings, metadatas, documents)
+                self._evict()
+
+    def delete(self, name: str, ids) -> None:
+        with self._load_lock(name), self._lock:
+            self._oversized.discard(name)
+            index = self._indexes.get(name)
+            if index is not None:
+                index.delete(ids)
+
+    def discard(self, name: str) -> None:
+        with self._load_lock(name), self._lock:
+            self._oversized.discard(name)
+            self._indexes.pop(name, None)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "collections": len(self._indexes),
+                "oversized": len(self._oversized),
+                "bytes": sum(index.nbytes for index in self._indexes.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def benchmark(
+    sizes: List[int],
+    dim: int,
+    queries: int,
+    k: int,
+    embeddings: Optional[np.ndarray] = None,
+    seed: int = 0,
+) -> List[Dict[str, float]]:
+    """
+    Query latency and recall of the hot index against a Chroma HNSW collection
+
+    Recall is measured against the exact top-k of the hot index. Without
+    `embeddings`, random unit vectors of `dim` dimensions are indexed, which is
+    the worst case for HNSW recall. With them, the first `queries` rows are the
+    queries and sizes are capped at the remaining rows.
+    """
+    import chromadb
+
+    client = chromadb.EphemeralClient()
+    rng = np.random.default_rng(seed)
+    if embeddings is not None:
+        embeddings = _normalize(embeddings)
+        probes = embeddings[:queries].tolist()
+        pool = embeddings[queries:]
+        sizes = sorted({min(size, len(pool)) for size in sizes})
+    else:
+        probes = _normalize(rng.standard_normal((queries, dim))).tolist()
+    results = []
+    for size in sizes:
+        if embeddings is not None:
+            vectors = pool[:size]
+        else:
+            vectors = _normalize(rng.standard_normal((size, dim)))
+        ids = [str(i) for i in range(size)]
+        metadatas = [{"issue_number": str(i)} for i in range(size)]
+        documents = [""] * size
+        name = f"hot_index_benchmark_{size}"
+        collection = client.get_or_create_collection(name)
+        for start in range(0, size, 5000):
+            collection.add(
+                ids=ids[start : start + 5000],
+                embeddings=vectors[start : start + 5000].tolist(),
+                metadatas=metadatas[start : start + 5000],
+                documents=documents[start : start + 5000],
+            )
+        index = HotIndex(Loaded(ids, vectors, metadatas, documents, "l2"))
+        collection.query(query_embeddings=[probes[0]], n_results=k)
+
+        row = {"size": size}
+        exact = []
+        for label, search in (
+            ("hot_index", lambda probe: index.search(probe, k)),
+            (
+                "hnsw",
+                lambda probe: collection.query(query_embeddings=[probe], n_results=k),
+            ),
+        ):
+            latencies, found = [], []
+            for probe in probes:
+                start = time.perf_counter()
+                found.append(set(search(probe)["ids"][0]))
+                latencies.append(time.perf_counter() - start)
+            millis = np.array(latencies) * 1000
+            row[f"{label}_p50_ms"] = float(np.percentile(millis, 50))
+            row[f"{label}_p95_ms"] = float(np.percentile(millis, 95))
+            if label == "hot_index":
+                exact = found
+            else:
+                row["hnsw_recall"] = float(
+                    np.mean([len(a & b) / len(a) for a, b in zip(exact, found)])
+                )
+        results.append(row)
+        client.delete_collection(name)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Compare hot index brute force with Chroma HNSW by collection size"
+    )
+    parser.add_argument("--sizes", default="1000,5000,20000,50000")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument(
+        "--embeddings",
+        help="Issue embeddings (.npy) to index instead of random vectors, "
+        "e.g. from evals/sweep.py",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    sizes = [int(size) for size in args.sizes.split(",")]
+    embeddings = np.load(args.embeddings) if args.embeddings else None
+    print(
+        json.dumps(
+            benchmark(sizes, args.dim, args.queries, args.k, embeddings), indent=2
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
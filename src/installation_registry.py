@@ -0,0 +1,88 @@
+import json
+import os
+import threading
+from typing import Dict, Iterable, Optional
+
+from config import CHROMA_PATH
+
+REGISTRY_FILE = os.path.join(CHROMA_PATH, "installation_repositories.json")
+
+_lock = threading.Lock()
+# installation id -> {repo id -> full name}, loaded from REGISTRY_FILE on first use
+_installations: Optional[Dict[str, Dict[str, str]]] = None
+_loaded_mtime: Optional[float] = None
+
+
+def _mtime() -> Optional[float]:
+    try:
+        return os.stat(REGISTRY_FILE).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def _load() -> Dict[str, Dict[str, str]]:
+    """Registry, re-read when another worker process has written the file"""
+    global _installations, _loaded_mtime
+    mtime = _mtime()
+    if _installations is None or mtime != _loaded_mtime:
+        try:
+            with open(REGISTRY_FILE) as f:
+                _installations = json.load(f)
+        except FileNotFoundError:
+            _installations = {}
+        _loaded_mtime = mtime
+    return _installations
+
+
+def _save() -> None:
+    global _loaded_mtime
+    os.makedirs(CHROMA_PATH, exist_ok=True)
+    tmp_file = f"{REGISTRY_FILE}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(_installations, f, indent=2)
+    os.replace(tmp_file, REGISTRY_FILE)
+    _loaded_mtime = _mtime()
+
+
+def register_repositories(installation_id, repositories: Dict[int, str]) -> None:
+    """Record repositories (id -> full name) as part of an installation"""
+    with _lock:
+        installation = _load().setdefault(str(installation_id), {})
+        new = {
+            str(repo_id): full_name
+            for repo_id, full_name in repositories.items()
+            if installation.get(str(repo_id)) != full_name
+        }
+        if new:
+            installation.update(new)
+            _save()
+
+
+def unregister_repositories(installation_id, repo_ids: Iterable[int]) -> None:
+    with _lock:
+        installation = _load().get(str(installation_id), {})
+        removed = [installation.pop(str(repo_id), None) for repo_id in repo_ids]
+        if any(name is not None for name in removed):
+            _save()
+
+
+def remove_installation(installation_id) -> None:
+    with _lock:
+        if _load().pop(str(installation_id), None) is not None:
+            _save()
+
+
+def get_installation_repositories(installation_id) -> Dict[int, str]:
+    """Repositories of an installation, repo id -> full name"""
+    with _lock:
+        installation = _load().get(str(installation_id), {})
+        return {int(repo_id): name for repo_id, name in installation.items()}
+
+
+def get_repository_installation(repo_id) -> Optional[int]:
+    """Installation a repository belongs to, None for unknown repositories"""
+    with _lock:
+        for installation_id, installation in _load().items():
+            if str(repo_id) in installation:
+                return int(installation_id)
+    return None
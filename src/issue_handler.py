@@ -1,42 +1,135 @@
 import logging
 
-from config import SIMILARITY_THRESHOLD
+from config import SIMILARITY_THRESHOLD, CROSS_REPO_SEARCH
 from src.github_api import close_issue, leave_comment
-from src.vector_db import add_issue_to_chroma, query_similar_issue
+from src.installation_registry import get_installation_repositories
+from src.job_queue import run_once
+from src.metrics import issue_decisions, timed
+from src.vector_db import (
+    add_issue_to_chroma,
+    query_similar_issues,
+    query_similar_issues_for_installation,
+)
 
 logger = logging.getLogger(__name__)
 
+# issues closer than 1 - threshold are duplicates, closer than 1 - threshold * factor are related
+RELATED_THRESHOLD_FACTOR = 0.5
+
+
+def classify_similarity(distance, threshold=SIMILARITY_THRESHOLD):
+    """Decide what to do about a new issue given the distance to its best candidate"""
+    if distance < 1 - threshold:
+        return "duplicate"
+    if distance < 1 - (threshold * RELATED_THRESHOLD_FACTOR):
+        return "related"
+    return "new"
+
+
+def find_similar_issues(
+    installation_id, repo_id, repo_full_name, full_issue, issue_title
+):
+    """
+    Candidates from the issue's repository or, with CROSS_REPO_SEARCH, from every
+    repository of the installation
+
+    Each candidate gets a `reference` to use in comments: `#123` in the same
+    repository and `owner/repo#123` in another one.
+    """
+    if not CROSS_REPO_SEARCH:
+        candidates = query_similar_issues(full_issue, repo_id, issue_title)
+        repositories = {repo_id: repo_full_name}
+    else:
+        repositories = get_installation_repositories(installation_id)
+        repositories[repo_id] = repo_full_name
+        candidates = [
+            candidate
+            for candidate in query_similar_issues_for_installation(
+                full_issue, installation_id, list(repositories), issue_title
+            )
+            if candidate["repo_id"] in repositories
+        ]
+
+    for candidate in candidates:
+        if candidate["repo_id"] == repo_id:
+            candidate["reference"] = f"#{candidate['issue_number']}"
+        else:
+            candidate["reference"] = (
+                f"{repositories[candidate['repo_id']]}#{candidate['issue_number']}"
+            )
+    return candidates
+
+
+def _comment_once(installation_id, repo_full_name, issue_number, comment_text):
+    """Comment on the issue, unless an earlier attempt of this delivery already did"""
+    run_once(
+        "comment",
+        lambda: leave_comment(
+            installation_id, repo_full_name, issue_number, comment_text
+        ),
+    )
+
 
 def handle_new_issue(
     installation_id, repo_id, repo_full_name, issue_number, issue_title, issue_body
+):
+    with timed("handle_new_issue"):
+        _handle_new_issue(
+            installation_id,
+            repo_id,
+            repo_full_name,
+            issue_number,
+            issue_title,
+            issue_body,
+        )
+
+
+def _handle_new_issue(
+    installation_id, repo_id, repo_full_name, issue_number, issue_title, issue_body
 ):
     logger.info(f"New issue opened: {issue_number} in {repo_full_name}")
     full_issue = f"{issue_title} {issue_body}"
-    similar_issue = query_similar_issue(full_issue, repo_id)
+    candidates = find_similar_issues(
+        installation_id, repo_id, repo_full_name, full_issue, issue_title
+    )
+    similar_issue = candidates[0] if candidates else None
+    logger.info(
+        "Ranked candidates: "
+        + ", ".join(
+            f"{candidate['reference']} ({1 - candidate['distance']:.2f})"
+            for candidate in candidates
+        )
+    )
 
     if similar_issue:
-        if similar_issue["distance"] < 1 - SIMILARITY_THRESHOLD:
-            comment_text = f"Closed due to high similarity with issue #{similar_issue['issue_number']} with title '{similar_issue['title']}'"
-            leave_comment(installation_id, repo_full_name, issue_number, comment_text)
-            close_issue(installation_id, repo_full_name, issue_number)
+        decision = classify_similarity(similar_issue["distance"])
+        issue_decisions.inc(decision=decision)
+        if decision == "duplicate":
+            comment_text = f"Closed due to high similarity with issue {similar_issue['reference']} with title '{similar_issue['title']}'"
+            _comment_once(installation_id, repo_full_name, issue_number, comment_text)
+            run_once(
+                "close_issue",
+                lambda: close_issue(installation_id, repo_full_name, issue_number),
+            )
             logger.info(
-                f"The new issue #{issue_number} with title '{issue_title}' is most similar to existing issue #{similar_issue['issue_number']} with title '{similar_issue['title']}', with a cosine similarity of {1 - similar_issue['distance']:.2f}."
+                f"The new issue #{issue_number} with title '{issue_title}' is most similar to existing issue {similar_issue['reference']} with title '{similar_issue['title']}', with a cosine similarity of {1 - similar_issue['distance']:.2f}."
             )
-        elif similar_issue["distance"] < 1 - (SIMILARITY_THRESHOLD * 0.5):
-            comment_text = f"Possibly related to issue #{similar_issue['issue_number']} with title '{similar_issue['title']}'"
-            leave_comment(installation_id, repo_full_name, issue_number, comment_text)
+        elif decision == "related":
+            comment_text = f"Possibly related to issue {similar_issue['reference']} with title '{similar_issue['title']}'"
+            _comment_once(installation_id, repo_full_name, issue_number, comment_text)
             logger.info(
-                f"The new issue #{issue_number} with title '{issue_title}' is possibly similar to existing issue #{similar_issue['issue_number']} with title '{similar_issue['title']}', with a cosine similarity of {1 - similar_issue['distance']:.2f}."
+                f"The new issue #{issue_number} with title '{issue_title}' is possibly similar to existing issue {similar_issue['reference']} with title '{similar_issue['title']}', with a cosine similarity of {1 - similar_issue['distance']:.2f}."
             )
         else:
-            comment_text = f"Most likely a new issue, most similar issue: #{similar_issue['issue_number']} with title '{similar_issue['title']}'"
-            leave_comment(installation_id, repo_full_name, issue_number, comment_text)
+            comment_text = f"Most likely a new issue, most similar issue: {similar_issue['reference']} with title '{similar_issue['title']}'"
+            _comment_once(installation_id, repo_full_name, issue_number, comment_text)
             logger.info(
-                f"The new issue #{issue_number} with title '{issue_title}' is not similar enough to close, most similar: #{similar_issue['issue_number']} with title '{similar_issue['title']}', with a cosine similarity of {1 - similar_issue['distance']:.2f}"
+                f"The new issue #{issue_number} with title '{issue_title}' is not similar enough to close, most similar: {similar_issue['reference']} with title '{similar_issue['title']}', with a cosine similarity of {1 - similar_issue['distance']:.2f}"
             )
     else:
+        issue_decisions.inc(decision="new")
         comment_text = "No similar issues found. This seems to be a new issue."
-        leave_comment(installation_id, repo_full_name, issue_number, comment_text)
+        _comment_once(installation_id, repo_full_name, issue_number, comment_text)
         logger.info(
             f"The new issue #{issue_number} with title '{issue_title}' has no similar issues in the database."
         )
@@ -0,0 +1,108 @@
+import argparse
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from config import CHROMA_PATH, SYNC_DELETE_CLOSED
+from src.github_api import iter_existing_issues
+from src.vector_db import add_issues_to_chroma, delete_issues_from_chroma
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FILE = os.path.join(CHROMA_PATH, "sync_checkpoints.json")
+_checkpoint_lock = threading.Lock()
+
+
+def _read_checkpoints() -> Dict[str, str]:
+    try:
+        with open(CHECKPOINT_FILE) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _write_checkpoints(checkpoints: Dict[str, str]) -> None:
+    os.makedirs(CHROMA_PATH, exist_ok=True)
+    tmp_file = f"{CHECKPOINT_FILE}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(checkpoints, f, indent=2)
+    os.replace(tmp_file, CHECKPOINT_FILE)
+
+
+def load_checkpoint(repo_id) -> Optional[str]:
+    """Timestamp the repository issues were last synced at, None if never synced"""
+    with _checkpoint_lock:
+        return _read_checkpoints().get(str(repo_id))
+
+
+def save_checkpoint(repo_id, synced_at: str) -> None:
+    with _checkpoint_lock:
+        checkpoints = _read_checkpoints()
+        checkpoints[str(repo_id)] = synced_at
+        _write_checkpoints(checkpoints)
+
+
+def clear_checkpoint(repo_id) -> None:
+    with _checkpoint_lock:
+        checkpoints = _read_checkpoints()
+        if checkpoints.pop(str(repo_id), None) is not None:
+            _write_checkpoints(checkpoints)
+
+
+def sync_repo_issues(installation_id, repo_full_name, repo_id) -> Dict[str, int]:
+    """
+    Bring the issue collection of a repository up to date
+
+    Without a checkpoint every issue is loaded. Otherwise only issues updated
+    since the checkpoint are fetched (GitHub's `since` parameter) and upserted,
+    so catching up costs O(changed issues). Closed issues are deleted instead
+    when SYNC_DELETE_CLOSED is set. Issues transferred or deleted on GitHub
+    no longer show up in the listing, those are removed by the `issues` webhook.
+
+    :return: Number of upserted and deleted issues
+    """
+    # taken before fetching, so issues updated mid-sync are picked up next time
+    started_at = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    since = load_checkpoint(repo_id)
+    if since:
+        logger.info(f"Syncing issues of {repo_full_name} updated since {since}")
+    else:
+        logger.info(f"No sync checkpoint for {repo_full_name}, loading all issues")
+
+    closed = []
+
+    def issues_to_upsert():
+        for issue in iter_existing_issues(installation_id, repo_full_name, since):
+            if SYNC_DELETE_CLOSED and issue["state"] == "closed":
+                closed.append(issue["number"])
+            else:
+                yield issue
+
+    upserted = add_issues_to_chroma(issues_to_upsert(), repo_id)
+    delete_issues_from_chroma(closed, repo_id)
+    save_checkpoint(repo_id, started_at)
+
+    logger.info(
+        f"Synced {repo_full_name}: {upserted} issues upserted, {len(closed)} deleted"
+    )
+    return {"upserted": upserted, "deleted": len(closed)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Sync the issues of a repository changed since its last checkpoint"
+    )
+    parser.add_argument("installation_id")
+    parser.add_argument("repo_full_name")
+    parser.add_argument("repo_id", type=int)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    sync_repo_issues(args.installation_id, args.repo_full_name, args.repo_id)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+import contextvars
+import json
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class Job(NamedTuple):
+    delivery_id: str
+    event_type: str
+    payload: Dict[str, Any]
+    attempts: int
+    # side effects finished by earlier attempts, see `run_once`
+    completed_steps: Set[str]
+
+
+class JobQueue:
+    """Durable SQLite-backed queue of webhook deliveries, deduplicated on delivery id"""
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    delivery_id TEXT PRIMARY KEY,
+                    event_type TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    available_at REAL NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    last_error TEXT
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, available_at)"
+            )
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(jobs)")]
+            if "completed_steps" not in columns:
+                conn.execute(
+                    "ALTER TABLE jobs ADD COLUMN completed_steps TEXT NOT NULL DEFAULT '[]'"
+                )
+
+    def _connect(self) -> sqlite3.Connection:
+        # autocommit mode, transactions are opened explicitly where needed
+        return sqlite3.connect(self._path, timeout=30, isolation_level=None)
+
+    def enqueue(self, delivery_id: str, event_type: str, payload: Dict) -> bool:
+        """
+        Add a delivery to the queue
+
+        A delivery that already failed for good is queued again, GitHub keeps the
+        delivery id when a delivery is redelivered. Steps it completed stay done.
+
+        :return: False if the delivery id is already queued, running or done
+        """
+        now = time.time()
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO jobs "
+                "(delivery_id, event_type, payload, available_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (delivery_id, event_type, json.dumps(payload), now, now, now),
+            )
+            if cursor.rowcount == 1:
+                return True
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = 0, payload = ?, "
+                "available_at = ?, updated_at = ?, last_error = NULL "
+                "WHERE delivery_id = ? AND status = 'failed'",
+                (json.dumps(payload), now, now, delivery_id),
+            )
+            return cursor.rowcount == 1
+
+    def claim(self) -> Optional[Job]:
+        """Atomically mark the oldest ready job as running and return it"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT delivery_id, event_type, payload, attempts, completed_steps "
+                    "FROM jobs "
+                    "WHERE status = 'queued' AND available_at <= ? "
+                    "ORDER BY created_at LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, "
+                    "updated_at = ? WHERE delivery_id = ?",
+                    (now, row[0]),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return Job(
+            row[0], row[1], json.loads(row[2]), row[3] + 1, set(json.loads(row[4]))
+        )
+
+    def complete_step(self, delivery_id: str, step: str) -> None:
+        """Record that a step of a job is done, so retries skip it"""
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT completed_steps FROM jobs WHERE delivery_id = ?",
+                (delivery_id,),
+            ).fetchone()
+            steps = sorted(set(json.loads(row[0])) | {step}) if row else [step]
+            conn.execute(
+                "UPDATE jobs SET completed_steps = ? WHERE delivery_id = ?",
+                (json.dumps(steps), delivery_id),
+            )
+            conn.execute("COMMIT")
+
+    def complete(self, delivery_id: str) -> None:
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'done', last_error = NULL, updated_at = ? "
+                "WHERE delivery_id = ?",
+                (time.time(), delivery_id),
+            )
+
+    def fail(self, job: Job, error: str, max_attempts: int, backoff: float) -> bool:
+        """
+        Record a failed attempt, scheduling a retry with exponential backoff
+
+        :return: True if the job will be retried
+        """
+        now = time.time()
+        retry = job.attempts < max_attempts
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, available_at = ?, last_error = ?, "
+                "updated_at = ? WHERE delivery_id = ?",
+                (
+                    "queued" if retry else "failed",
+                    now + backoff * 2 ** (job.attempts - 1),
+                    error,
+                    now,
+                    job.delivery_id,
+                ),
+            )
+        return retry
+
+    def requeue_running(self) -> int:
+        """Return jobs left running by a previous process to the queue"""
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'queued', updated_at = ? "
+                "WHERE status = 'running'",
+                (time.time(),),
+            )
+            return cursor.rowcount
+
+    def purge_finished(self, older_than: float) -> int:
+        """Delete completed and failed jobs last updated more than `older_than` seconds ago"""
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+                (time.time() - older_than,),
+            )
+            return cursor.rowcount
+
+
+# queue and job of the delivery the current worker thread is handling
+_current_job = contextvars.ContextVar("current_job", default=None)
+
+
+def run_once(step: str, action: Callable[[], Any]) -> None:
+    """
+    Run a side effect of the current job at most once across its retries
+
+    Comments and closing issues are not idempotent. A job retried after a later
+    stage failed skips the steps its earlier attempts completed. Outside a job,
+    e.g. from the CLI, the action always runs.
+    """
+    current = _current_job.get()
+    if current is None:
+        action()
+        return
+    queue, job = current
+    if step in job.completed_steps:
+        logger.info(f"Skipping {step} of delivery {job.delivery_id}, already done")
+        return
+    action()
+    job.completed_steps.add(step)
+    queue.complete_step(job.delivery_id, step)
+
+
+class JobWorkerPool:
+    """Fixed number of threads draining a JobQueue with retries"""
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        handler: Callable[[str, Dict[str, Any]], None],
+        concurrency: int = 4,
+        max_attempts: int = 3,
+        retry_backoff: float = 5.0,
+        poll_interval: float = 1.0,
+        retention: float = 7 * 24 * 3600,
+    ) -> None:
+        self._queue = queue
+        self._handler = handler
+        self._concurrency = concurrency
+        self._max_attempts = max_attempts
+        self._retry_backoff = retry_backoff
+        self._poll_interval = poll_interval
+        self._retention = retention
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._start_lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+    def recover(self) -> None:
+        """Requeue jobs interrupted by a restart and purge old finished jobs"""
+        requeued = self._queue.requeue_running()
+        if requeued:
+            logger.info(f"Requeued {requeued} interrupted jobs")
+        self._queue.purge_finished(self._retention)
+
+    def start(self, recover: bool = True) -> None:
+        """
+        :param recover: Run `recover` first, only safe while no other process
+            is working on the same queue
+        """
+        with self._start_lock:
+            if self._threads:
+                return
+            if recover:
+                self.recover()
+            for i in range(self._concurrency):
+                thread = threading.Thread(
+                    target=self._run, name=f"job-worker-{i}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+            logger.info(f"Started {self._concurrency} job workers")
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stopped.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def notify(self) -> None:
+        """Wake idle workers after a job has been enqueued"""
+        self._wakeup.set()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                job = self._queue.claim()
+            except sqlite3.Error as e:
+                logger.error(f"Failed to claim job: {str(e)}")
+                job = None
+
+            if job is None:
+                self._wakeup.wait(self._poll_interval)
+                self._wakeup.clear()
+                continue
+
+            self._process(job)
+
+    def _process(self, job: Job) -> None:
+        logger.info(
+            f"Processing {job.event_type} delivery {job.delivery_id} "
+            f"(attempt {job.attempts}/{self._max_attempts})"
+        )
+        token = _current_job.set((self._queue, job))
+        try:
+            self._handler(job.event_type, job.payload)
+        except Exception as e:
+            logger.exception(f"Job {job.delivery_id} failed")
+            if not self._queue.fail(
+                job, str(e), self._max_attempts, self._retry_backoff
+            ):
+                logger.error(
+                    f"Giving up on delivery {job.delivery_id} after {job.attempts} attempts"
+                )
+        else:
+            self._queue.complete(job.delivery_id)
+        finally:
+            _current_job.reset(token)
@@ -0,0 +1,214 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+from typing import Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationCancelled(Exception):
+    """A newer event for the same pull request superseded this generation"""
+
+
+class ResponseCache:
+    """
+    Persistent cache of LLM responses keyed by a hash of the model and prompt
+
+    The oldest responses are evicted beyond `max_entries`, 0 disables the cache.
+    Caches sharing a file are kept apart by their `table`.
+    """
+
+    def __init__(self, path: str, max_entries: int, table: str = "responses") -> None:
+        self._path = path
+        self._max_entries = max_entries
+        self._table = table
+        if not self.enabled:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+
+    @property
+    def enabled(self) -> bool:
+        return self._max_entries > 0
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self._path, timeout=30, isolation_level=None)
+
+    @staticmethod
+    def make_key(model: str, prompt: str) -> str:
+        return hashlib.sha256(f"{model}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                f"SELECT response FROM {self._table} WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, response: str) -> None:
+        if not self.enabled:
+            return
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self._table} (key, response, created_at) VALUES (?, ?, ?)",
+                (key, response, time.time()),
+            )
+            conn.execute(
+                f"DELETE FROM {self._table} WHERE key NOT IN "
+                f"(SELECT key FROM {self._table} ORDER BY created_at DESC LIMIT ?)",
+                (self._max_entries,),
+            )
+            conn.execute("COMMIT")
+
+
+class _Generation(threading.Event):
+    """Cancel event of one generation, also set once another process supersedes it"""
+
+    def __init__(self, registry: "GenerationRegistry", key: str, token: str) -> None:
+        super().__init__()
+        self._registry = registry
+        self.key = key
+        self.token = token
+        self._checked_at = time.monotonic()
+
+    def is_set(self) -> bool:
+        if super().is_set():
+            return True
+        now = time.monotonic()
+        if now - self._checked_at >= self._registry.poll_interval:
+            self._checked_at = now
+            if self._registry.superseded(self.key, self.token):
+                self.set()
+        return super().is_set()
+
+
+class GenerationRegistry:
+    """
+    Tracks the latest generation per key, e.g. per (repo, pull request)
+
+    With a `path`, the latest generation per key is also recorded in a SQLite
+    file, so a generation begun by another process sharing the file (another
+    gunicorn worker on the host) cancels this one within `poll_interval`
+    seconds. The file is created on the first `begin`.
+    """
+
+    def __init__(self, path: Optional[str] = None, poll_interval: float = 1.0) -> None:
+        self._path = path
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._current: Dict[Hashable, _Generation] = {}
+        self._schema_ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._schema_ready:
+            os.makedirs(os.path.dirname(os.path.abspath(self._path)), exist_ok=True)
+        conn = sqlite3.connect(self._path, timeout=30, isolation_level=None)
+        if not self._schema_ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS generations (
+                    key TEXT PRIMARY KEY,
+                    token TEXT NOT NULL,
+                    started_at REAL NOT NULL
+                )
+                """
+            )
+            self._schema_ready = True
+        return conn
+
+    def begin(self, key: Hashable) -> threading.Event:
+        """
+        Register a new generation for `key`, cancelling the one in flight
+
+        :return: Event that is set once a newer generation for `key` begins
+        """
+        cancel = _Generation(self, repr(key), uuid.uuid4().hex)
+        if self._path is not None:
+            with closing(self._connect()) as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO generations (key, token, started_at) VALUES (?, ?, ?)",
+                    (cancel.key, cancel.token, time.time()),
+                )
+        with self._lock:
+            previous = self._current.get(key)
+            if previous is not None:
+                previous.set()
+            self._current[key] = cancel
+        return cancel
+
+    def superseded(self, key: str, token: str) -> bool:
+        """Whether a newer generation than `token` began for `key` in any process"""
+        if self._path is None:
+            return False
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT token FROM generations WHERE key = ?", (key,)
+            ).fetchone()
+        return row is not None and row[0] != token
+
+    def end(self, key: Hashable, cancel: threading.Event) -> None:
+        with self._lock:
+            if self._current.get(key) is cancel:
+                del self._current[key]
+        if self._path is not None and isinstance(cancel, _Generation):
+            with closing(self._connect()) as conn:
+                conn.execute(
+                    "DELETE FROM generations WHERE key = ? AND token = ?",
+                    (cancel.key, cancel.token),
+                )
+
+
+def stream_chat(
+    client,
+    model: str,
+    prompt: str,
+    timeout: float,
+    cancel: Optional[threading.Event] = None,
+) -> str:
+    """
+    Stream a chat completion and return the full response
+
+    The stream is closed, which makes Ollama stop generating, once `timeout`
+    seconds have passed or `cancel` is set.
+
+    :raises TimeoutError: The response took longer than `timeout`
+    :raises GenerationCancelled: `cancel` was set during generation
+    """
+    if cancel is not None and cancel.is_set():
+        raise GenerationCancelled()
+    deadline = time.monotonic() + timeout
+    chunks = []
+    stream = client.chat(
+        model=model, messages=[{"role": "user", "content": prompt}], stream=True
+    )
+    try:
+        for chunk in stream:
+            if cancel is not None and cancel.is_set():
+                raise GenerationCancelled()
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Generation exceeded {timeout:g}s")
+            chunks.append(chunk["message"]["content"])
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+    return "".join(chunks)
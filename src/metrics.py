@@ -0,0 +1,435 @@
+import contextvars
+import glob
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# seconds, from Prometheus' defaults up to the minutes an LLM review can take
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+)
+
+# labels of the webhook delivery being processed, attached to every sample
+_context_labels = contextvars.ContextVar(
+    "metric_labels", default={"event": "", "repo": ""}
+)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: List[str], values: LabelValues) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)
+    )
+    return f"{{{pairs}}}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    type_name: str
+
+    def __init__(self, name: str, documentation: str, label_names: List[str]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = list(label_names)
+        self._lock = threading.Lock()
+
+    def _label_values(self, labels: Dict[str, str]) -> LabelValues:
+        merged = {**_context_labels.get(), **labels}
+        return tuple(str(merged.get(name, "")) for name in self.label_names)
+
+    def values(self) -> Dict[LabelValues, Any]:
+        with self._lock:
+            return dict(self._values)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values = {}
+
+    def decode(self, value) -> Any:
+        """A value read back from JSON"""
+        return float(value)
+
+    def merge(
+        self, values_by_process: Dict[str, Dict[LabelValues, Any]]
+    ) -> Tuple[List[str], Dict[LabelValues, Any]]:
+        """Label names and values of the metric summed over processes"""
+        raise NotImplementedError
+
+    def render(
+        self,
+        values: Optional[Dict[LabelValues, Any]] = None,
+        label_names: Optional[List[str]] = None,
+    ) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+            *self._samples(
+                self.values() if values is None else values,
+                self.label_names if label_names is None else label_names,
+            ),
+        ]
+
+    def _samples(self, values, label_names) -> List[str]:
+        raise NotImplementedError
+
+
+class _ValueMetric(_Metric):
+    def __init__(self, name, documentation, label_names):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[LabelValues, float] = {}
+
+    def _samples(self, values, label_names):
+        return [
+            f"{self.name}{_format_labels(label_names, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Counter(_ValueMetric):
+    type_name = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def merge(self, values_by_process):
+        merged: Dict[LabelValues, float] = {}
+        for values in values_by_process.values():
+            for key, value in values.items():
+                merged[key] = merged.get(key, 0.0) + value
+        return self.label_names, merged
+
+
+class Gauge(_ValueMetric):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        # gauges describe the process, not the delivery being processed
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            self._values[key] = value
+
+    def merge(self, values_by_process):
+        # a gauge describes one process, so each keeps its own series
+        merged = {
+            key + (process,): value
+            for process, values in values_by_process.items()
+            for key, value in values.items()
+        }
+        return self.label_names + ["pid"], merged
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, label_names, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self._buckets = tuple(sorted(buckets)) + (math.inf,)
+        # per label set: bucket counts, sum of observations
+        self._values: Dict[LabelValues, Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._label_values(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self._buckets), 0.0))
+            for i, bound in enumerate(self._buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def values(self):
+        with self._lock:
+            return {
+                key: (list(counts), total)
+                for key, (counts, total) in self._values.items()
+            }
+
+    def decode(self, value):
+        counts, total = value
+        return [int(count) for count in counts], float(total)
+
+    def merge(self, values_by_process):
+        merged: Dict[LabelValues, Tuple[List[int], float]] = {}
+        for values in values_by_process.values():
+            for key, (counts, total) in values.items():
+                if key in merged:
+                    merged_counts, merged_total = merged[key]
+                    counts = [a + b for a, b in zip(merged_counts, counts)]
+                    total += merged_total
+                merged[key] = (list(counts), total)
+        return self.label_names, merged
+
+    def _samples(self, values, label_names):
+        samples = []
+        for key, (counts, total) in sorted(values.items()):
+            for bound, count in zip(self._buckets, counts):
+                labels = _format_labels(
+                    label_names + ["le"], key + (_format_value(bound),)
+                )
+                samples.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(label_names, key)
+            samples.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            samples.append(f"{self.name}_count{labels} {counts[-1]}")
+        return samples
+
+
+class Registry:
+    """
+    Metrics of this process, rendered in the Prometheus text exposition format
+
+    After `share`, the process also writes its samples to a directory every few
+    seconds and renders the samples of every process writing there, so any
+    gunicorn worker answers a scrape for all of them. Counters and histograms
+    are summed, gauges get a `pid` label. Processes that exited keep their
+    counts once moved aside with `remove_process`.
+    """
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        self._directory: Optional[str] = None
+
+    def _get_or_create(self, cls, name, documentation, label_names, **kwargs):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(name, documentation, label_names, **kwargs)
+            return self._metrics[name]
+
+    def counter(self, name, documentation, label_names=()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, label_names)
+
+    def gauge(self, name, documentation, label_names=()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, label_names)
+
+    def histogram(
+        self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._get_or_create(
+            Histogram, name, documentation, label_names, buckets=buckets
+        )
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        """Call `collector` before samples are read, e.g. to set gauges from caches"""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def _collect(self) -> Dict[str, _Metric]:
+        with self._lock:
+            collectors = list(self._collectors)
+            metrics = dict(self._metrics)
+        for collector in collectors:
+            collector()
+        return metrics
+
+    def share(self, directory: str, interval: float) -> None:
+        """
+        Write this process's samples to `directory` every `interval` seconds
+
+        Samples recorded before, e.g. by the gunicorn master before forking this
+        worker, are dropped so they are not counted once per worker.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.reset()
+        self._directory = directory
+        self.write()
+
+        def _flush():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.write()
+                except Exception:
+                    logger.exception("Writing metrics failed")
+
+        threading.Thread(target=_flush, name="metrics-flush", daemon=True).start()
+
+    @staticmethod
+    def _process_path(directory: str, process: str) -> str:
+        return os.path.join(directory, f"{process}.json")
+
+    def write(self) -> None:
+        metrics = self._collect()
+        snapshot = {
+            name: [[list(key), value] for key, value in metric.values().items()]
+            for name, metric in metrics.items()
+        }
+        self._write(self._process_path(self._directory, str(os.getpid())), snapshot)
+
+    @staticmethod
+    def _write(path: str, snapshot: Dict[str, list]) -> None:
+        # written aside and renamed, so readers never see a partial file
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, path)
+
+    def _read(self, path: str) -> Dict[str, Dict[LabelValues, Any]]:
+        """Samples of one process, of the metrics this registry knows"""
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        with self._lock:
+            metrics = dict(self._metrics)
+        return {
+            name: {tuple(key): metrics[name].decode(value) for key, value in samples}
+            for name, samples in snapshot.items()
+            if name in metrics
+        }
+
+    def remove_process(self, directory: str, pid: int) -> None:
+        """Fold the counters and histograms of an exited process into `exited.json`"""
+        path = self._process_path(directory, str(pid))
+        if not os.path.exists(path):
+            return
+        exited_path = self._process_path(directory, "exited")
+        by_name: Dict[str, Dict[str, Dict[LabelValues, Any]]] = {}
+        for process, source in (("exited", exited_path), (str(pid), path)):
+            for name, values in self._read(source).items():
+                by_name.setdefault(name, {})[process] = values
+        with self._lock:
+            metrics = dict(self._metrics)
+        snapshot = {}
+        for name, values_by_process in by_name.items():
+            if isinstance(metrics[name], Gauge):
+                continue
+            _, merged = metrics[name].merge(values_by_process)
+            snapshot[name] = [[list(key), value] for key, value in merged.items()]
+        self._write(exited_path, snapshot)
+        os.remove(path)
+
+    def render(self) -> str:
+        if self._directory is not None:
+            return self._render_shared()
+        metrics = self._collect()
+        lines = []
+        for metric in metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def _render_shared(self) -> str:
+        # this process's own samples are written first, so they are current
+        self.write()
+        by_name: Dict[str, Dict[str, Dict[LabelValues, Any]]] = {}
+        for path in sorted(glob.glob(os.path.join(self._directory, "*.json"))):
+            process = os.path.basename(path)[: -len(".json")]
+            for name, values in self._read(path).items():
+                by_name.setdefault(name, {})[process] = values
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            label_names, values = metric.merge(by_name.get(metric.name, {}))
+            lines.extend(metric.render(values, label_names))
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+stage_seconds = registry.histogram(
+    "doppelganger_stage_seconds",
+    "Time spent in each stage of handling a delivery",
+    ["stage", "event", "repo"],
+)
+stage_errors = registry.counter(
+    "doppelganger_stage_errors_total",
+    "Stages that raised an exception",
+    ["stage", "event", "repo"],
+)
+jobs_processed = registry.counter(
+    "doppelganger_jobs_total",
+    "Webhook deliveries processed by outcome",
+    ["event", "repo", "outcome"],
+)
+issue_decisions = registry.counter(
+    "doppelganger_issue_decisions_total",
+    "Duplicate, related and new decisions for opened issues",
+    ["decision", "event", "repo"],
+)
+
+
+@contextmanager
+def metric_labels(**labels: str) -> Iterator[None]:
+    """Attach labels such as the event type and repository to metrics recorded inside"""
+    token = _context_labels.set(
+        {**_context_labels.get(), **{k: str(v) for k, v in labels.items()}}
+    )
+    try:
+        yield
+    finally:
+        _context_labels.reset(token)
+
+
+class Timer:
+    elapsed: Optional[float] = None
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[Timer]:
+    """
+    Record the duration of a stage in `doppelganger_stage_seconds`
+
+    Exceptions are counted in `doppelganger_stage_errors_total` and re-raised.
+    The yielded timer holds the elapsed seconds once the block has finished.
+    """
+    timer = Timer()
+    start = time.perf_counter()
+    try:
+        yield timer
+    except BaseException:
+        stage_errors.inc(stage=stage)
+        raise
+    finally:
+        timer.elapsed = time.perf_counter() - start
+        stage_seconds.observe(timer.elapsed, stage=stage)
+
+
+def render_metrics() -> str:
+    return registry.render()
+
+
+def share_metrics(directory: str, interval: float) -> None:
+    """Render the metrics of every process sharing `directory`, see `Registry`"""
+    registry.share(directory, interval)
+
+
+def remove_process_metrics(directory: str, pid: int) -> None:
+    """Keep the counts of the exited process `pid` without its gauges"""
+    registry.remove_process(directory, pid)
@@ -0,0 +1,173 @@
+import argparse
+import contextvars
+import json
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from src.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+encode_batch_size = registry.histogram(
+    "doppelganger_encode_batch_size",
+    "Number of texts per micro-batched encode call",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent single-text encode requests into batched encode calls
+
+    A background thread takes the first pending request, waits up to `max_wait`
+    seconds for up to `max_batch_size` requests in total, encodes them with one
+    call to `encode_fn` and hands each caller its own vector. With `max_wait` of
+    0 or a `max_batch_size` of 1, requests are encoded directly on the caller's
+    thread.
+
+    `encode_fn` runs in a copy of the first request's context, so metrics it
+    records keep that delivery's labels. A batch mixing deliveries is
+    attributed to the first one.
+    """
+
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str]], np.ndarray],
+        max_batch_size: int = 32,
+        max_wait: float = 0.005,
+    ) -> None:
+        self._encode_fn = encode_fn
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait
+        self._requests: "queue.Queue[Tuple[str, Future, contextvars.Context]]" = (
+            queue.Queue()
+        )
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self._max_wait > 0 and self._max_batch_size > 1
+
+    def encode(self, text: str) -> np.ndarray:
+        """Embedding of one text, blocking until its batch has been encoded"""
+        if not self.enabled:
+            return self._encode_fn([text])[0]
+        self._ensure_started()
+        future: Future = Future()
+        self._requests.put((text, future, contextvars.copy_context()))
+        return future.result()
+
+    def _ensure_started(self) -> None:
+        # started on first use so forked worker processes each get their own thread
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="encode-batcher", daemon=True
+                )
+                self._thread.start()
+
+    def _collect(self) -> List[Tuple[str, Future, contextvars.Context]]:
+        batch = [self._requests.get()]
+        deadline = time.monotonic() + self._max_wait
+        while len(batch) < self._max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            encode_batch_size.observe(len(batch))
+            context = batch[0][2]
+            try:
+                vectors = context.run(self._encode_fn, [text for text, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future, _), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+
+def benchmark(
+    encode_fn: Callable[[List[str]], np.ndarray],
+    texts: List[str],
+    concurrency: int,
+    max_batch_size: int,
+    max_wait: float,
+) -> dict:
+    """Throughput of `concurrency` threads encoding one text per call, with and without batching"""
+    results = {}
+    for mode, batcher in (
+        ("direct", MicroBatcher(encode_fn, max_batch_size=1)),
+        ("micro-batched", MicroBatcher(encode_fn, max_batch_size, max_wait)),
+    ):
+        latencies = []
+
+        def _encode(text):
+            start = time.perf_counter()
+            batcher.encode(text)
+            latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(_encode, texts))
+        elapsed = time.perf_counter() - start
+        millis = np.array(latencies) * 1000
+        results[mode] = {
+            "texts_per_second": len(texts) / elapsed,
+            "p50_ms": float(np.percentile(millis, 50)),
+            "p95_ms": float(np.percentile(millis, 95)),
+        }
+    results["speedup"] = (
+        results["micro-batched"]["texts_per_second"]
+        / results["direct"]["texts_per_second"]
+    )
+    return results
+
+
+def main() -> None:
+    from config import ENCODE_BATCH_MAX_SIZE, ENCODE_BATCH_WAIT_MS
+    from src.embeddings import _sample_texts
+    from src.vector_db import get_embedding_backend
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark micro-batched against direct single-text encodes"
+    )
+    parser.add_argument("--texts", help="CSV with title (and body) columns to embed")
+    parser.add_argument("--limit", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--max-batch-size", type=int, default=ENCODE_BATCH_MAX_SIZE)
+    parser.add_argument("--max-wait-ms", type=float, default=ENCODE_BATCH_WAIT_MS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    backend = get_embedding_backend()
+    texts = _sample_texts(args.texts, args.limit)
+    # uncached, so both modes pay for every encode
+    encode_fn = backend.encode
+    encode_fn(texts[: args.max_batch_size])
+    results = benchmark(
+        encode_fn,
+        texts,
+        args.concurrency,
+        args.max_batch_size,
+        args.max_wait_ms / 1000,
+    )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import logging
+import re
+from typing import Any, Callable, Dict, List, NamedTuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# rough size of a token for code and English text, Ollama models ship different tokenizers
+CHARS_PER_TOKEN = 4
+# share of the budget the diff may take before dependency functions get the rest
+DIFF_BUDGET_SHARE = 0.6
+
+_FILE_HEADER = re.compile(r"^diff --git a/(.*?) b/(.*)$")
+
+
+class Hunk(NamedTuple):
+    file_path: str
+    text: str
+
+
+class PrContext(NamedTuple):
+    diff: str
+    functions: str
+    stats: Dict[str, int]
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def split_diff(pr_diff: str) -> List[Hunk]:
+    """
+    Split a unified diff into hunks, each prefixed with its file's `---`/`+++` header
+
+    Files without hunks (binary files, pure renames, mode changes) become one hunk
+    holding their header so the change is still visible.
+    """
+    hunks: List[Hunk] = []
+    file_path = ""
+    header: List[str] = []
+    current: List[str] = []
+    file_has_hunks = False
+
+    def _flush():
+        if current:
+            hunks.append(Hunk(file_path, "".join(header + current)))
+
+    for line in pr_diff.splitlines(keepends=True):
+        match = _FILE_HEADER.match(line)
+        if match:
+            _flush()
+            if file_path and not file_has_hunks:
+                hunks.append(Hunk(file_path, "".join(header)))
+            file_path, header, current, file_has_hunks = match.group(2), [], [], False
+        if line.startswith("@@"):
+            _flush()
+            current, file_has_hunks = [line], True
+        elif current:
+            current.append(line)
+        else:
+            header.append(line)
+
+    _flush()
+    if file_path and not file_has_hunks:
+        hunks.append(Hunk(file_path, "".join(header)))
+    return hunks
+
+
+def _format_function(function: Dict[str, Any]) -> str:
+    metadata = function.get("metadata") or {}
+    name = metadata.get("function_path") or metadata.get("function_name") or ""
+    return f"# {name}\n{function.get('source_code') or ''}\n"
+
+
+def rank_functions(
+    hunks: List[Hunk],
+    functions: List[Dict[str, Any]],
+    embed_fn: Callable[[List[str]], np.ndarray],
+) -> List[Dict[str, Any]]:
+    """Order functions by their highest cosine similarity to any of the hunks"""
+    if not hunks or not functions:
+        return list(functions)
+    vectors = embed_fn(
+        [hunk.text for hunk in hunks]
+        + [function.get("source_code") or "" for function in functions]
+    )
+    vectors = vectors / np.maximum(
+        np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12
+    )
+    similarities = (vectors[len(hunks) :] @ vectors[: len(hunks)].T).max(axis=1)
+    order = np.argsort(-similarities, kind="stable")
+    return [functions[i] for i in order]
+
+
+def build_pr_context(
+    pr_diff: str,
+    functions: List[Dict[str, Any]],
+    token_budget: int,
+    embed_fn: Callable[[List[str]], np.ndarray],
+) -> PrContext:
+    """
+    Pack the diff and the most relevant dependency functions into a token budget
+
+    Hunks are kept in diff order while they fit in DIFF_BUDGET_SHARE of the budget,
+    and hunks that do not fit are listed by file instead. Dependency functions are
+    ranked by embedding similarity to the kept hunks and added, most similar first,
+    until the rest of the budget is used.
+
+    :param pr_diff: Unified diff of the pull request
+    :param functions: Results of `query_by_function_names`
+    :param token_budget: Approximate number of tokens for the diff and functions
+    :param embed_fn: Encodes a list of texts, e.g. `vector_db.embed_texts`
+    """
+    hunks = split_diff(pr_diff)
+    diff_budget = int(token_budget * DIFF_BUDGET_SHARE)
+
+    kept, omitted_files = [], []
+    used = 0
+    for hunk in hunks:
+        tokens = estimate_tokens(hunk.text)
+        if used + tokens <= diff_budget:
+            kept.append(hunk)
+            used += tokens
+        elif hunk.file_path not in omitted_files:
+            omitted_files.append(hunk.file_path)
+
+    diff = "".join(hunk.text for hunk in kept)
+    if omitted_files:
+        note = (
+            "\n[Changes omitted to fit the context: " + ", ".join(omitted_files) + "]\n"
+        )
+        diff += note
+        used += estimate_tokens(note)
+
+    packed = []
+    for function in rank_functions(kept or hunks, functions, embed_fn):
+        text = _format_function(function)
+        tokens = estimate_tokens(text)
+        if used + tokens <= token_budget:
+            packed.append(text)
+            used += tokens
+
+    stats = {
+        "hunks": len(hunks),
+        "kept_hunks": len(kept),
+        "functions": len(functions),
+        "kept_functions": len(packed),
+        "diff_tokens": estimate_tokens(pr_diff),
+        "context_tokens": used,
+    }
+    logger.info(f"Built PR context: {stats}")
+    return PrContext(diff, "\n".join(packed), stats)
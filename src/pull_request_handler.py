@@ -1,21 +1,69 @@
-import json
 import logging
-import os
-from typing import List
+import threading
+from typing import List, Optional
 
 import ollama
 
-from config import OLLAMA_MODEL
+from config import (
+    OLLAMA_MODEL,
+    OLLAMA_TIMEOUT,
+    FEEDBACK_CACHE_PATH,
+    FEEDBACK_CACHE_SIZE,
+    PR_CONTEXT_TOKEN_BUDGET,
+    PR_DEPENDENCY_DEPTH,
+)
+from src.dependency_graph import get_dependency_graph
 from src.github_api import leave_comment
-from src.vector_db import query_by_function_names
+from src.job_queue import run_once
+from src.llm import GenerationCancelled, GenerationRegistry, ResponseCache, stream_chat
+from src.metrics import timed
+from src.pr_context import build_pr_context, estimate_tokens
+from src.vector_db import embed_texts, query_by_function_names
 
 logger = logging.getLogger(__name__)
 
+# the timeout bounds connecting and each streamed chunk, stream_chat bounds the total
+ollama_client = ollama.Client(timeout=OLLAMA_TIMEOUT)
+_feedback_cache = None
+_posted_feedback = None
+_feedback_cache_lock = threading.Lock()
+# in-flight feedback per (repo_id, pr_number), a newer event cancels the older one,
+# also in other processes sharing the feedback cache file
+feedback_generations = GenerationRegistry(FEEDBACK_CACHE_PATH)
+
+
+def get_feedback_cache() -> ResponseCache:
+    """Feedback cache, opened on first use so importing the app does not touch the disk"""
+    global _feedback_cache
+    if _feedback_cache is None:
+        with _feedback_cache_lock:
+            if _feedback_cache is None:
+                _feedback_cache = ResponseCache(
+                    FEEDBACK_CACHE_PATH, FEEDBACK_CACHE_SIZE
+                )
+    return _feedback_cache
+
+
+def get_posted_feedback() -> ResponseCache:
+    """Feedback last posted per pull request head, kept next to the feedback cache"""
+    global _posted_feedback
+    if _posted_feedback is None:
+        with _feedback_cache_lock:
+            if _posted_feedback is None:
+                _posted_feedback = ResponseCache(
+                    FEEDBACK_CACHE_PATH, FEEDBACK_CACHE_SIZE, table="posted_feedback"
+                )
+    return _posted_feedback
+
 
 def generate_pr_feedback(
-    used_functions: List, pr_title: str, pr_body: str, pr_diff: str
+    used_functions: str,
+    pr_title: str,
+    pr_body: str,
+    pr_diff: str,
+    cancel: Optional[threading.Event] = None,
 ) -> str:
-    """Generate feedback using Ollama"""
+    """Generate feedback using Ollama, reusing the cached response to an identical prompt"""
     # TODO: refine the prompt
     prompt = f"""
     
@@ -33,45 +81,32 @@ def generate_pr_feedback(
     Changes in PR:
     {pr_diff}
     """
-    logging.info("generating feedback...")
-    response = ollama.chat(
-        model=OLLAMA_MODEL, messages=[{"role": "user", "content": prompt}]
-    )
+    cache_key = ResponseCache.make_key(OLLAMA_MODEL, prompt)
+    cached = get_feedback_cache().get(cache_key)
+    if cached is not None:
+        logger.info("Reusing cached feedback for an identical prompt")
+        return cached
+
+    logger.info(f"Generating feedback from a ~{estimate_tokens(prompt)} token prompt")
+    with timed("ollama_chat"):
+        feedback = stream_chat(
+            ollama_client, OLLAMA_MODEL, prompt, OLLAMA_TIMEOUT, cancel
+        )
 
-    return response["message"]["content"]
+    get_feedback_cache().put(cache_key, feedback)
+    return feedback
 
 
-def get_function_dependencies(changed_files: List[str]) -> List[str]:
-    """Gets all internal functions that are imported into a file"""
+def get_function_dependencies(changed_files: List[str], repo_id: int) -> List[str]:
+    """
+    Gets the internal functions imported by the changed files
 
-    def _replace_dots_with_slash_in_json(json_data):
-        if isinstance(json_data, dict):
-            return {
-                _replace_dots_with_slash_in_json(key): _replace_dots_with_slash_in_json(
-                    value
-                )
-                for key, value in json_data.items()
-            }
-        elif isinstance(json_data, list):
-            return [_replace_dots_with_slash_in_json(element) for element in json_data]
-        elif isinstance(json_data, str):
-            return json_data.replace(".", "/")
-        else:
-            return json_data
-
-    function_set = set()
-
-    # remove file extension
-    changed_files = [os.path.splitext(x)[0] for x in changed_files]
-
-    with open(
-        "dependencies.json"
-    ) as f:  # TODO: update dependencies.json when main branch is updated
-        dependency_graph = _replace_dots_with_slash_in_json(json.load(f))
-        for file in changed_files:
-            if file in dependency_graph:
-                function_set.update(dependency_graph[file])
-    return list(function_set)
+    Looked up in the repository's dependency graph, following imports up to
+    PR_DEPENDENCY_DEPTH hops.
+    """
+    return get_dependency_graph(repo_id).dependencies_of_files(
+        changed_files, PR_DEPENDENCY_DEPTH
+    )
 
 
 def handle_new_pull_request(
@@ -83,23 +118,58 @@ def handle_new_pull_request(
     pr_body: str,
     pr_diff: str,
     changed_files: List[str],
+    cancel: Optional[threading.Event] = None,
+    head_sha: Optional[str] = None,
 ):
-    """Handle new pull request webhook"""
+    """
+    Handle new pull request webhook
+
+    :param cancel: Set when a newer event for the same pull request arrives, which
+        stops the generation and skips the comment
+    :param head_sha: Head commit of the pull request, the same feedback is not
+        posted twice for it
+    """
     try:
-        dependency_functions = get_function_dependencies(changed_files)
+        dependency_functions = get_function_dependencies(changed_files, repo_id)
         dependency_function_context = query_by_function_names(
             dependency_functions, repo_id
         )
+        context = build_pr_context(
+            pr_diff, dependency_function_context, PR_CONTEXT_TOKEN_BUDGET, embed_texts
+        )
         # Generate feedback
         feedback = generate_pr_feedback(
-            dependency_function_context, pr_title, pr_body, pr_diff
+            context.functions, pr_title, pr_body, context.diff, cancel
         )
+        if cancel is not None and cancel.is_set():
+            raise GenerationCancelled()
+
+        posted_key = (
+            ResponseCache.make_key(f"{repo_id}#{pr_number}", head_sha)
+            if head_sha
+            else None
+        )
+        if posted_key and get_posted_feedback().get(posted_key) == feedback:
+            logger.info(
+                f"Feedback for PR #{pr_number} in {repo_full_name} already posted for {head_sha}"
+            )
+            return
 
         # Post comment
-        leave_comment(installation_id, repo_full_name, pr_number, feedback)
+        run_once(
+            "comment",
+            lambda: leave_comment(installation_id, repo_full_name, pr_number, feedback),
+        )
+        if posted_key:
+            get_posted_feedback().put(posted_key, feedback)
 
         logger.info(f"Posted feedback for PR #{pr_number} in {repo_full_name}")
 
+    except GenerationCancelled:
+        logger.info(
+            f"Feedback for PR #{pr_number} in {repo_full_name} superseded by a newer event"
+        )
+
     except Exception as e:
         logger.error(f"Error handling PR #{pr_number}: {str(e)}")
         raise
@@ -0,0 +1,98 @@
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+Candidate = Dict[str, Any]
+
+
+def _tokens(text: str) -> set:
+    return set(re.findall(r"\w+", text.lower()))
+
+
+def lexical_overlap(a: str, b: str) -> float:
+    """Jaccard similarity of the word sets of two texts"""
+    tokens_a, tokens_b = _tokens(a), _tokens(b)
+    if not tokens_a or not tokens_b:
+        return 0.0
+    return len(tokens_a & tokens_b) / len(tokens_a | tokens_b)
+
+
+class Reranker:
+    """Second retrieval stage scoring candidates against the new issue, from 0 to 1"""
+
+    def score(
+        self, query_title: str, query_text: str, candidates: List[Candidate]
+    ) -> List[float]:
+        raise NotImplementedError
+
+
+class LexicalReranker(Reranker):
+    """Word overlap between the issue and each candidate document"""
+
+    def score(self, query_title, query_text, candidates):
+        return [
+            lexical_overlap(query_text, candidate["document"] or candidate["title"])
+            for candidate in candidates
+        ]
+
+
+class TitleReranker(Reranker):
+    """Title-only cosine similarity averaged with the lexical overlap of the full text"""
+
+    def __init__(self, embed_fn: Callable[[List[str]], np.ndarray]) -> None:
+        self._embed_fn = embed_fn
+
+    def score(self, query_title, query_text, candidates):
+        vectors = self._embed_fn([query_title] + [c["title"] for c in candidates])
+        vectors = vectors / np.maximum(
+            np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12
+        )
+        title_similarities = vectors[1:] @ vectors[0]
+        return [
+            0.5 * float(title_similarity)
+            + 0.5 * lexical_overlap(query_text, candidate["document"] or "")
+            for title_similarity, candidate in zip(title_similarities, candidates)
+        ]
+
+
+class CrossEncoderReranker(Reranker):
+    """
+    Local cross-encoder scoring (issue, candidate) pairs jointly
+
+    Use a model trained for semantic similarity (e.g. an STSB cross-encoder) so
+    scores fall between 0 and 1. The model is loaded on first use.
+    """
+
+    def __init__(self, model_name: str) -> None:
+        self._model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder
+
+                self._model = CrossEncoder(self._model_name)
+            return self._model
+
+    def score(self, query_title, query_text, candidates):
+        pairs = [(query_text, candidate["document"] or "") for candidate in candidates]
+        return [float(score) for score in self._get_model().predict(pairs)]
+
+
+def get_reranker(
+    name: str, embed_fn: Callable[[List[str]], np.ndarray], cross_encoder_model: str
+) -> Optional[Reranker]:
+    """Build the reranker selected by name, None for plain vector ranking"""
+    if name == "none":
+        return None
+    if name == "lexical":
+        return LexicalReranker()
+    if name == "title":
+        return TitleReranker(embed_fn)
+    if name == "cross-encoder":
+        return CrossEncoderReranker(cross_encoder_model)
+    raise ValueError(f"Unknown reranker: {name}")
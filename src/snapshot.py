@@ -0,0 +1,390 @@
+import argparse
+import json
+import logging
+import os
+import shutil
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from config import CHROMA_PATH, SNAPSHOT_DIR, SNAPSHOT_DTYPE
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+DTYPES = ("int8", "float16")
+COLLECTION_PREFIXES = ("github_issues_", "github_code_")
+
+
+def quantize(vectors: np.ndarray, dtype: str):
+    """
+    Quantize float vectors to `dtype`
+
+    int8 uses a symmetric scale per row, `row = codes * scale`, float16 needs none.
+
+    :return: Quantized vectors and the per-row scales, None for float16
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    if dtype != "int8":
+        raise ValueError(
+            f"Unsupported snapshot dtype {dtype}, expected one of {DTYPES}"
+        )
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def dequantize(codes: np.ndarray, scales: Optional[np.ndarray]) -> np.ndarray:
+    vectors = np.asarray(codes, dtype=np.float32)
+    if scales is not None:
+        vectors *= np.asarray(scales, dtype=np.float32)[:, None]
+    return vectors
+
+
+class _StringWriter:
+    """Writes strings as one UTF-8 blob plus an offsets array"""
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._blob = open(f"{path}.bin", "wb")
+        self._offsets = [0]
+
+    def extend(self, values) -> None:
+        for value in values:
+            data = (value or "").encode("utf-8")
+            self._blob.write(data)
+            self._offsets.append(self._offsets[-1] + len(data))
+
+    def close(self) -> None:
+        self._blob.close()
+        np.save(f"{self._path}.offsets.npy", np.asarray(self._offsets, dtype=np.int64))
+
+
+class StringColumn:
+    """Strings of a snapshot, decoded on access from a memory-mapped blob"""
+
+    def __init__(self, path: str) -> None:
+        self._offsets = np.load(f"{path}.offsets.npy", mmap_mode="r")
+        blob_path = f"{path}.bin"
+        # np.memmap cannot map an empty file
+        if os.path.getsize(blob_path):
+            self._blob = np.memmap(blob_path, dtype=np.uint8, mode="r")
+        else:
+            self._blob = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, row: int) -> str:
+        start, stop = self._offsets[row], self._offsets[row + 1]
+        return self._blob[start:stop].tobytes().decode("utf-8")
+
+    def slice(self, start: int, stop: int) -> List[str]:
+        return [self[row] for row in range(start, stop)]
+
+
+def _column_type(values: List[Any]) -> str:
+    present = [value for value in values if value is not None]
+    if present and all(isinstance(value, bool) for value in present):
+        return "bool"
+    if present and all(
+        isinstance(value, int) and not isinstance(value, bool) for value in present
+    ):
+        return "int"
+    if present and all(
+        isinstance(value, (int, float)) and not isinstance(value, bool)
+        for value in present
+    ):
+        return "float"
+    return "str"
+
+
+_NUMPY_TYPES = {"bool": np.bool_, "int": np.int64, "float": np.float64}
+
+
+def _write_metadata(path: str, metadatas: List[Dict[str, Any]]) -> Dict[str, str]:
+    """Write one column per metadata key, returns key -> column type"""
+    keys = sorted({key for metadata in metadatas for key in (metadata or {})})
+    columns = {}
+    for key in keys:
+        values = [(metadata or {}).get(key) for metadata in metadatas]
+        column_type = _column_type(values)
+        column_path = os.path.join(path, f"metadata.{key}")
+        if column_type == "str":
+            writer = _StringWriter(column_path)
+            writer.extend(None if value is None else str(value) for value in values)
+            writer.close()
+        else:
+            np.save(
+                f"{column_path}.npy",
+                np.asarray(
+                    [0 if value is None else value for value in values],
+                    dtype=_NUMPY_TYPES[column_type],
+                ),
+            )
+        missing = np.asarray([value is None for value in values])
+        if missing.any():
+            np.save(f"{column_path}.missing.npy", missing)
+        columns[key] = column_type
+    return columns
+
+
+class Snapshot:
+    """
+    Read-only view of a collection snapshot
+
+    Vectors, scales, offsets and numeric metadata columns are opened with
+    `mmap_mode="r"`, so opening a snapshot copies nothing and pages are read as
+    rows are used.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(os.path.join(path, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(
+                f"Unsupported snapshot version {self.manifest.get('version')} in {path}"
+            )
+        self.collection = self.manifest["collection"]
+        self.space = self.manifest["space"]
+        self.codes = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        scales_path = os.path.join(path, "scales.npy")
+        self.scales = (
+            np.load(scales_path, mmap_mode="r") if os.path.exists(scales_path) else None
+        )
+        self.ids = StringColumn(os.path.join(path, "ids"))
+        self.documents = StringColumn(os.path.join(path, "documents"))
+        self._columns = {}
+        self._missing = {}
+        for key, column_type in self.manifest["columns"].items():
+            column_path = os.path.join(path, f"metadata.{key}")
+            if column_type == "str":
+                self._columns[key] = StringColumn(column_path)
+            else:
+                self._columns[key] = np.load(f"{column_path}.npy", mmap_mode="r")
+            if os.path.exists(f"{column_path}.missing.npy"):
+                self._missing[key] = np.load(
+                    f"{column_path}.missing.npy", mmap_mode="r"
+                )
+
+    def __len__(self) -> int:
+        return self.manifest["count"]
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the quantized vectors and their scales"""
+        return self.codes.nbytes + (0 if self.scales is None else self.scales.nbytes)
+
+    def embeddings(self, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """Dequantized float32 vectors of rows `start` to `stop`"""
+        stop = len(self) if stop is None else stop
+        scales = None if self.scales is None else self.scales[start:stop]
+        return dequantize(self.codes[start:stop], scales)
+
+    def metadata(self, row: int) -> Dict[str, Any]:
+        metadata = {}
+        for key, column in self._columns.items():
+            if key in self._missing and self._missing[key][row]:
+                continue
+            value = column[row]
+            metadata[key] = value.item() if isinstance(value, np.generic) else value
+        return metadata
+
+    def batches(self, batch_size: int) -> Iterator[Dict[str, Any]]:
+        """Rows as keyword arguments for `collection.upsert`"""
+        for start in range(0, len(self), batch_size):
+            stop = min(start + batch_size, len(self))
+            yield {
+                "ids": self.ids.slice(start, stop),
+                "embeddings": self.embeddings(start, stop).tolist(),
+                "metadatas": [self.metadata(row) for row in range(start, stop)],
+                "documents": self.documents.slice(start, stop),
+            }
+
+
+def export_collection(
+    collection, path: str, dtype: str = SNAPSHOT_DTYPE, batch_size: int = 1000
+) -> Dict[str, Any]:
+    """
+    Write a snapshot of a Chroma collection to the directory `path`
+
+    The collection is read in pages of `batch_size` rows. The snapshot is built
+    next to `path` and moved into place once complete.
+
+    :return: Number of rows and snapshot size compared to float32 vectors
+    """
+    if dtype not in DTYPES:
+        raise ValueError(
+            f"Unsupported snapshot dtype {dtype}, expected one of {DTYPES}"
+        )
+    start = time.perf_counter()
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    ids = _StringWriter(os.path.join(tmp_path, "ids"))
+    documents = _StringWriter(os.path.join(tmp_path, "documents"))
+    codes, scales, metadatas = [], [], []
+    dim = 0
+    offset = 0
+    while True:
+        page = collection.get(
+            include=["embeddings", "metadatas", "documents"],
+            limit=batch_size,
+            offset=offset,
+        )
+        if not page["ids"]:
+            break
+        page_codes, page_scales = quantize(page["embeddings"], dtype)
+        dim = page_codes.shape[1]
+        codes.append(page_codes)
+        if page_scales is not None:
+            scales.append(page_scales)
+        ids.extend(page["ids"])
+        documents.extend(page["documents"] or [None] * len(page["ids"]))
+        metadatas.extend(page["metadatas"] or [None] * len(page["ids"]))
+        offset += len(page["ids"])
+    ids.close()
+    documents.close()
+
+    np.save(
+        os.path.join(tmp_path, "vectors.npy"),
+        np.concatenate(codes) if codes else np.zeros((0, dim), dtype=dtype),
+    )
+    if dtype == "int8":
+        np.save(
+            os.path.join(tmp_path, "scales.npy"),
+            np.concatenate(scales) if scales else np.zeros(0, dtype=np.float32),
+        )
+    manifest = {
+        "version": SNAPSHOT_VERSION,
+        "collection": collection.name,
+        "space": (collection.metadata or {}).get("hnsw:space", "l2"),
+        "dtype": dtype,
+        "dim": dim,
+        "count": offset,
+        "columns": _write_metadata(tmp_path, metadatas),
+        "created_at": time.time(),
+    }
+    with open(os.path.join(tmp_path, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+    snapshot = Snapshot(path)
+    stats = {
+        "collection": collection.name,
+        "rows": len(snapshot),
+        "dtype": dtype,
+        "vector_bytes": snapshot.nbytes,
+        "float32_bytes": len(snapshot) * dim * 4,
+        "seconds": time.perf_counter() - start,
+    }
+    logger.info(f"Exported {collection.name} to {path}: {stats}")
+    return stats
+
+
+def import_snapshot(
+    client, path: str, collection_name: Optional[str] = None, replace: bool = False
+) -> Dict[str, Any]:
+    """
+    Load a snapshot into a Chroma collection, without re-encoding anything
+
+    :param collection_name: Target collection, the exported collection by default
+    :param replace: Drop the target collection first instead of upserting into it
+    """
+    start = time.perf_counter()
+    snapshot = Snapshot(path)
+    name = collection_name or snapshot.collection
+    if replace and name in {
+        collection.name for collection in client.list_collections()
+    }:
+        client.delete_collection(name)
+    collection = client.get_or_create_collection(
+        name, metadata={"hnsw:space": snapshot.space}
+    )
+    # upserts check every id against the collection, plain adds skip that when empty
+    write = collection.add if collection.count() == 0 else collection.upsert
+    for batch in snapshot.batches(5000):
+        write(**batch)
+    stats = {
+        "collection": name,
+        "rows": len(snapshot),
+        "seconds": time.perf_counter() - start,
+    }
+    logger.info(f"Imported {path} into {name}: {stats}")
+    return stats
+
+
+def _code_manifest_file(collection_name: str) -> Optional[str]:
+    """Manifest of `embed_code_base` for a code collection, None for other collections"""
+    if not collection_name.startswith("github_code_"):
+        return None
+    suffix = collection_name[len("github_code_") :]
+    return os.path.join(CHROMA_PATH, f"code_manifest_{suffix}.json")
+
+
+def main() -> None:
+    from src.vector_db import get_chroma_client
+
+    parser = argparse.ArgumentParser(
+        description="Export Chroma issue and code collections to compact snapshots "
+        "and import them on another node"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export")
+    export_parser.add_argument(
+        "collections", nargs="*", help="e.g. github_issues_<repo_id>"
+    )
+    export_parser.add_argument(
+        "--all", action="store_true", help="Export every issue and code collection"
+    )
+    export_parser.add_argument("--out", default=SNAPSHOT_DIR)
+    export_parser.add_argument("--dtype", choices=DTYPES, default=SNAPSHOT_DTYPE)
+    import_parser = commands.add_parser("import")
+    import_parser.add_argument("paths", nargs="+", help="Snapshot directories")
+    import_parser.add_argument(
+        "--replace", action="store_true", help="Drop existing collections first"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    client = get_chroma_client()
+    results = []
+    if args.command == "export":
+        names = list(args.collections)
+        if args.all:
+            names += [
+                collection.name
+                for collection in client.list_collections()
+                if collection.name.startswith(COLLECTION_PREFIXES)
+            ]
+        for name in names:
+            path = os.path.join(args.out, name)
+            results.append(
+                export_collection(client.get_collection(name), path, args.dtype)
+            )
+            # lets embed_code_base skip unchanged files after an import
+            manifest_file = _code_manifest_file(name)
+            if manifest_file and os.path.exists(manifest_file):
+                shutil.copyfile(manifest_file, os.path.join(path, "code_manifest.json"))
+    else:
+        for path in args.paths:
+            results.append(import_snapshot(client, path, replace=args.replace))
+            manifest_file = _code_manifest_file(results[-1]["collection"])
+            if manifest_file and os.path.exists(
+                os.path.join(path, "code_manifest.json")
+            ):
+                os.makedirs(CHROMA_PATH, exist_ok=True)
+                shutil.copyfile(os.path.join(path, "code_manifest.json"), manifest_file)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
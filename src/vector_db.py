@@ -1,49 +1,438 @@
-import ast
+import hashlib
+import json
+import logging
 import os
-from typing import List, Dict, Any
+import threading
+import time
+from collections import defaultdict
+from itertools import islice
+from typing import List, Dict, Any, Iterable, DefaultDict, Set, Tuple
 import re
-import chromadb
-from sentence_transformers import SentenceTransformer
-from config import ROOT_DIR
+import numpy as np
+from config import (
+    ROOT_DIR,
+    CHROMA_PATH,
+    CHROMA_HOST,
+    CHROMA_PORT,
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_BACKEND,
+    ONNX_MODEL_DIR,
+    ONNX_QUANTIZED,
+    ONNX_THREADS,
+    EMBEDDING_CACHE_PATH,
+    EMBEDDING_CACHE_SIZE,
+    EMBEDDING_BATCH_SIZE,
+    ENCODE_BATCH_WAIT_MS,
+    ENCODE_BATCH_MAX_SIZE,
+    CODE_INDEX_WORKERS,
+    CODE_INDEX_PARALLEL_MIN_FILES,
+    RETRIEVAL_TOP_K,
+    RERANKER,
+    RERANK_WEIGHT,
+    CROSS_ENCODER_MODEL,
+    CROSS_REPO_SEARCH,
+    HOT_INDEX_MEMORY_MB,
+)
+from src.code_parser import extract_functions_from_files
+from src.dependency_graph import get_dependency_graph
+from src.embedding_cache import EmbeddingCache
+from src.embeddings import EmbeddingBackend, create_backend
+from src.hot_index import HotIndexCache, Loaded
+from src.installation_registry import get_repository_installation
+from src.metrics import timed
+from src.micro_batcher import MicroBatcher
+from src.reranker import get_reranker
+
+logger = logging.getLogger(__name__)
+
+_chroma_client = None
+_chroma_client_lock = threading.Lock()
+_backend = None
+_backend_lock = threading.Lock()
+_embedding_cache = None
+_embedding_cache_lock = threading.Lock()
+hot_indexes = HotIndexCache(int(HOT_INDEX_MEMORY_MB * 2**20))
+
+
+def get_chroma_client():
+    """Chroma client, created on first use so importing this module stays cheap"""
+    global _chroma_client
+    if _chroma_client is None:
+        with _chroma_client_lock:
+            if _chroma_client is None:
+                import chromadb
+
+                if CHROMA_HOST:
+                    _chroma_client = chromadb.HttpClient(
+                        host=CHROMA_HOST, port=CHROMA_PORT
+                    )
+                else:
+                    _chroma_client = chromadb.PersistentClient(path=CHROMA_PATH)
+    return _chroma_client
+
+
+def get_embedding_backend() -> EmbeddingBackend:
+    """Embedding backend selected by EMBEDDING_BACKEND, loaded on first use since it takes seconds"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                start = time.perf_counter()
+                _backend = create_backend(
+                    EMBEDDING_BACKEND,
+                    EMBEDDING_MODEL_NAME,
+                    onnx_model_dir=ONNX_MODEL_DIR,
+                    onnx_quantized=ONNX_QUANTIZED,
+                    onnx_threads=ONNX_THREADS,
+                )
+                logger.info(
+                    f"Loaded embedding backend {_backend.name} "
+                    f"in {time.perf_counter() - start:.2f}s"
+                )
+    return _backend
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    global _embedding_cache
+    if _embedding_cache is None:
+        with _embedding_cache_lock:
+            if _embedding_cache is None:
+                _embedding_cache = EmbeddingCache(
+                    EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_SIZE
+                )
+    return _embedding_cache
+
+
+def warm_up() -> float:
+    """
+    Load the embedding backend and Chroma client ahead of the first request
+
+    :return: Seconds spent warming up
+    """
+    start = time.perf_counter()
+    get_chroma_client()
+    get_embedding_backend().encode(["warm up"])
+    get_embedding_cache()
+    elapsed = time.perf_counter() - start
+    logger.info(f"Warm-up finished in {elapsed:.2f}s")
+    return elapsed
+
+
+def embed_texts(texts: List[str], batch_size: int = EMBEDDING_BATCH_SIZE) -> np.ndarray:
+    """
+    Encode texts, reusing cached vectors and batch encoding only the misses
+
+    :param texts: Texts to encode
+    :param batch_size: Batch size passed to the model for the cache misses
+    :return: Array of shape (len(texts), dim)
+    """
+    backend = get_embedding_backend()
+    keys = [EmbeddingCache.make_key(backend.name, text) for text in texts]
+    vectors = get_embedding_cache().get_many(keys)
+
+    missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+    if missing:
+        with timed("encode"):
+            encoded = backend.encode(list(missing.values()), batch_size=batch_size)
+        new_vectors = dict(zip(missing.keys(), encoded))
+        get_embedding_cache().put_many(new_vectors)
+        vectors.update(new_vectors)
+
+    return np.stack([vectors[key] for key in keys])
+
+
+encode_batcher = MicroBatcher(
+    embed_texts, ENCODE_BATCH_MAX_SIZE, ENCODE_BATCH_WAIT_MS / 1000
+)
+
+
+def embed_text(text: str) -> np.ndarray:
+    """Encode one text, batched with concurrent callers by the encode micro-batcher"""
+    return encode_batcher.encode(text)
+
+
+reranker = get_reranker(RERANKER, embed_texts, CROSS_ENCODER_MODEL)
+
+
+def get_embedding_cache_stats() -> Dict[str, float]:
+    return get_embedding_cache().stats()
+
 
-chroma_client = chromadb.PersistentClient(path="./chroma")
-model = SentenceTransformer("all-MiniLM-L6-v2")
+def get_hot_index_stats() -> Dict[str, float]:
+    return hot_indexes.stats()
+
+
+def _get_or_create_collection(name: str):
+    client = get_chroma_client()
+    try:
+        return client.get_or_create_collection(name)
+    except Exception as e:
+        # a Chroma server rejects the create when another worker process
+        # created the collection since the server's lookup
+        if "UniqueConstraintError" not in f"{type(e).__name__} {e}":
+            raise
+        return client.get_collection(name)
 
 
 def get_collection_for_repo(repo_id):
-    return chroma_client.get_or_create_collection(f"github_issues_{repo_id}")
+    return _get_or_create_collection(f"github_issues_{repo_id}")
 
 
-def add_issue_to_chroma(full_issue, issue_number, issue_title, repo_id):
-    embedding = model.encode(full_issue).tolist()
-    collection = get_collection_for_repo(repo_id)
+def get_collection_for_installation(installation_id):
+    """Collection holding the issues of every repository of an installation"""
+    return _get_or_create_collection(f"github_issues_installation_{installation_id}")
+
+
+def _load_hot_index(get_collection) -> Loaded:
+    collection = get_collection()
+    results = collection.get(include=["embeddings", "metadatas", "documents"])
+    return Loaded(
+        results["ids"],
+        results["embeddings"],
+        results["metadatas"],
+        results["documents"],
+        (collection.metadata or {}).get("hnsw:space", "l2"),
+    )
+
 
-    collection.add(
-        documents=[full_issue],
-        metadatas=[
+def _get_installation_collection_for_repo(repo_id):
+    """Installation collection mirroring the repository, None without CROSS_REPO_SEARCH"""
+    if not CROSS_REPO_SEARCH:
+        return None
+    installation_id = get_repository_installation(repo_id)
+    if installation_id is None:
+        return None
+    return get_collection_for_installation(installation_id)
+
+
+def add_issue_to_chroma(full_issue, issue_number, issue_title, repo_id, embedding=None):
+    if embedding is None:
+        embedding = embed_text(full_issue)
+    collection = get_collection_for_repo(repo_id)
+    record = {
+        "documents": [full_issue],
+        "metadatas": [
             {
                 "issue_number": str(issue_number),
                 "title": issue_title,
                 "repo_id": repo_id,
             }
         ],
-        embeddings=[embedding],
-        ids=[f"{repo_id}_{issue_number}"],
+        "embeddings": [np.asarray(embedding).tolist()],
+        "ids": [f"{repo_id}_{issue_number}"],
+    }
+
+    # an edited or reopened issue replaces its row, like in the hot index
+    with timed("chroma_add"):
+        collection.upsert(**record)
+        hot_indexes.upsert(collection.name, **record)
+        installation_collection = _get_installation_collection_for_repo(repo_id)
+        if installation_collection is not None:
+            installation_collection.upsert(**record)
+            hot_indexes.upsert(installation_collection.name, **record)
+
+
+def distance_to_similarity(distance: float, space: str = "l2") -> float:
+    """Cosine similarity of normalized embeddings from a Chroma distance"""
+    if space == "l2":
+        # squared euclidean distance of unit vectors is 2 - 2 * cosine
+        return 1 - distance / 2
+    return 1 - distance
+
+
+def similarity_to_distance(similarity: float, space: str = "l2") -> float:
+    if space == "l2":
+        return 2 * (1 - similarity)
+    return 1 - similarity
+
+
+def query_similar_issues(
+    full_issue, repo_id, issue_title=None, k=RETRIEVAL_TOP_K, embedding=None
+) -> List[Dict[str, Any]]:
+    """
+    Retrieve the top-k most similar issues, re-ranked by the configured RERANKER
+
+    With a reranker, each candidate's vector similarity is blended with the second
+    stage score using RERANK_WEIGHT, and `distance` is that blended score expressed
+    in the collection's distance space so SIMILARITY_THRESHOLD keeps its meaning.
+    The raw Chroma distance is kept as `vector_distance`.
+
+    :param full_issue: Title and body of the new issue
+    :param repo_id: Repository ID to search
+    :param issue_title: Title of the new issue, used by the title reranker
+    :param k: Number of candidates fetched from Chroma
+    :param embedding: Precomputed embedding of `full_issue`
+    :return: Candidates ordered from most to least similar
+    """
+    return _query_collection(
+        f"github_issues_{repo_id}",
+        lambda: get_collection_for_repo(repo_id),
+        full_issue,
+        issue_title,
+        k,
+        embedding,
     )
 
 
-def query_similar_issue(full_issue, repo_id):
-    embedding = model.encode(full_issue).tolist()
-    collection = get_collection_for_repo(repo_id)
-    results = collection.query(query_embeddings=[embedding], n_results=1)
+def query_similar_issues_for_installation(
+    full_issue,
+    installation_id,
+    repo_ids,
+    issue_title=None,
+    k=RETRIEVAL_TOP_K,
+    embedding=None,
+) -> List[Dict[str, Any]]:
+    """
+    Retrieve the top-k most similar issues over every repository of an installation
+
+    The installation collection is searched with a single query, so latency does
+    not grow with the number of repositories. Repositories whose issues are not
+    in it yet, e.g. indexed before CROSS_REPO_SEARCH was enabled, are copied over
+    first. Candidates carry the `repo_id` they belong to.
+
+    :param repo_ids: Repository IDs of the installation
+    :return: Candidates ordered from most to least similar, see `query_similar_issues`
+    """
+    index_installation_repositories(installation_id, repo_ids)
+    return _query_collection(
+        f"github_issues_installation_{installation_id}",
+        lambda: get_collection_for_installation(installation_id),
+        full_issue,
+        issue_title,
+        k,
+        embedding,
+    )
+
 
-    if results["distances"][0]:
-        return {
-            "issue_number": results["metadatas"][0][0]["issue_number"],
-            "title": results["metadatas"][0][0]["title"],
-            "distance": results["distances"][0][0],
+def _query_collection(
+    name, get_collection, full_issue, issue_title, k, embedding
+) -> List[Dict[str, Any]]:
+    """
+    Query the collection `name`, through its hot index when HOT_INDEX_MEMORY_MB
+    allows, so Chroma is only touched to load the index
+    """
+    with timed("query_embed") as embed_timer:
+        if embedding is None:
+            embedding = embed_text(full_issue)
+        embedding = np.asarray(embedding).tolist()
+
+    index = hot_indexes.get(name, lambda: _load_hot_index(get_collection))
+    if index is not None:
+        space = index.space
+        with timed("hot_index_query") as query_timer:
+            results = index.search(embedding, k)
+    else:
+        collection = get_collection()
+        space = (collection.metadata or {}).get("hnsw:space", "l2")
+        with timed("chroma_query") as query_timer:
+            results = collection.query(query_embeddings=[embedding], n_results=k)
+
+    candidates = [
+        {
+            "repo_id": metadata["repo_id"],
+            "issue_number": metadata["issue_number"],
+            "title": metadata["title"],
+            "document": document,
+            "distance": distance,
+            "vector_distance": distance,
         }
-    return None
+        for metadata, document, distance in zip(
+            results["metadatas"][0], results["documents"][0], results["distances"][0]
+        )
+    ]
+
+    if reranker and candidates:
+        with timed("rerank"):
+            scores = reranker.score(issue_title or full_issue, full_issue, candidates)
+        for candidate, score in zip(candidates, scores):
+            similarity = (1 - RERANK_WEIGHT) * distance_to_similarity(
+                candidate["vector_distance"], space
+            ) + RERANK_WEIGHT * score
+            candidate["distance"] = similarity_to_distance(similarity, space)
+        candidates.sort(key=lambda candidate: candidate["distance"])
+
+    logger.debug(
+        f"Retrieved {len(candidates)} candidates from {name}: "
+        f"encode {embed_timer.elapsed * 1000:.1f}ms, "
+        f"query {query_timer.elapsed * 1000:.1f}ms"
+    )
+    return candidates
+
+
+def query_similar_issue(full_issue, repo_id, issue_title=None):
+    candidates = query_similar_issues(full_issue, repo_id, issue_title)
+    return candidates[0] if candidates else None
+
+
+# (installation id, repo id) pairs checked against the installation collection,
+# each installation's pairs are only touched under its lock
+_indexed_repositories: Set[Tuple[int, int]] = set()
+_installation_index_locks: Dict[int, threading.Lock] = defaultdict(threading.Lock)
+_installation_index_locks_lock = threading.Lock()
+
+
+def index_installation_repositories(
+    installation_id, repo_ids, batch_size: int = EMBEDDING_BATCH_SIZE
+) -> int:
+    """
+    Copy repositories' issues into the installation collection where they differ
+
+    Stored embeddings are copied, nothing is re-encoded. Each repository is checked
+    once per process, after that the collection is kept in sync as issues are
+    added and deleted.
+
+    :return: Number of copied issues
+    """
+    with _installation_index_locks_lock:
+        installation_lock = _installation_index_locks[installation_id]
+
+    # one copy per installation at a time, other installations are not blocked
+    with installation_lock:
+        missing = [
+            repo_id
+            for repo_id in repo_ids
+            if (installation_id, repo_id) not in _indexed_repositories
+        ]
+        if not missing:
+            return 0
+
+        installation_collection = get_collection_for_installation(installation_id)
+        copied = 0
+        for repo_id in missing:
+            collection = get_collection_for_repo(repo_id)
+            indexed = installation_collection.get(
+                where={"repo_id": repo_id}, include=[]
+            )
+            if len(indexed["ids"]) != collection.count():
+                if indexed["ids"]:
+                    installation_collection.delete(ids=indexed["ids"])
+                offset = 0
+                while True:
+                    batch = collection.get(
+                        include=["documents", "metadatas", "embeddings"],
+                        limit=batch_size,
+                        offset=offset,
+                    )
+                    if not batch["ids"]:
+                        break
+                    installation_collection.upsert(
+                        ids=batch["ids"],
+                        documents=batch["documents"],
+                        metadatas=batch["metadatas"],
+                        embeddings=batch["embeddings"],
+                    )
+                    offset += len(batch["ids"])
+                copied += offset
+            _indexed_repositories.add((installation_id, repo_id))
+        if copied:
+            hot_indexes.discard(installation_collection.name)
+
+    if copied:
+        logger.info(
+            f"Copied {copied} issues from {len(missing)} repos into the collection "
+            f"of installation {installation_id}"
+        )
+    return copied
 
 
 def remove_issues_from_chroma(repo_id):
@@ -52,52 +441,90 @@ def remove_issues_from_chroma(repo_id):
 
     if results and results["ids"]:
         collection.delete(ids=results["ids"])
+    hot_indexes.discard(collection.name)
 
+    installation_collection = _get_installation_collection_for_repo(repo_id)
+    if installation_collection is not None:
+        installation_collection.delete(where={"repo_id": repo_id})
+        hot_indexes.discard(installation_collection.name)
 
-def add_issues_to_chroma(issues, repo_id):
-    for issue in issues:
-        issue_number = issue["number"]
-        issue_title = issue["title"]
-        issue_body = issue.get("body", "")
-        full_issue = f"{issue_title} {issue_body}"
-        repo_id = issue["repository"]["id"]
 
-        add_issue_to_chroma(full_issue, issue_number, issue_title, repo_id)
+def delete_issues_from_chroma(issue_numbers, repo_id):
+    if not issue_numbers:
+        return
+    ids = [f"{repo_id}_{number}" for number in issue_numbers]
+    collection = get_collection_for_repo(repo_id)
+    collection.delete(ids=ids)
+    hot_indexes.delete(collection.name, ids)
+    installation_collection = _get_installation_collection_for_repo(repo_id)
+    if installation_collection is not None:
+        installation_collection.delete(ids=ids)
+        hot_indexes.delete(installation_collection.name, ids)
 
 
-def get_collection_for_repo_branch(repo_id: int, branch: str = "main"):
-    return chroma_client.get_or_create_collection(f"github_code_{repo_id}_{branch}")
+def _iter_batches(items: Iterable, batch_size: int) -> Iterable[List]:
+    iterator = iter(items)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
 
 
-def _extract_function_info(file_path: str) -> List[Dict[str, Any]]:
+def add_issues_to_chroma(
+    issues: Iterable[Dict[str, Any]], repo_id, batch_size: int = EMBEDDING_BATCH_SIZE
+) -> int:
     """
-    Extract function information from a Python file
+    Bulk load issues into the repository collection
 
-    :param file_path: Path to the Python source file
-    :return: List of function information dictionaries
+    Issues are encoded in chunks of `batch_size` with one batched encode call per
+    chunk, and each chunk is written with a single `collection.upsert`. The
+    iterable is consumed lazily, so issues streamed from GitHub become queryable
+    chunk by chunk while later pages are still downloading.
+
+    :param issues: Iterable of GitHub issue dictionaries
+    :param repo_id: Repository ID the issues belong to
+    :param batch_size: Number of issues to encode and write per chunk
+    :return: Number of issues loaded
     """
-    with open(file_path, "r") as f:
-        try:
-            tree = ast.parse(f.read(), filename=file_path)
-        except SyntaxError:
-            return []  # Skip files with syntax errors
+    collection = get_collection_for_repo(repo_id)
+    installation_collection = _get_installation_collection_for_repo(repo_id)
+    total = 0
+    start = time.perf_counter()
+
+    for batch in _iter_batches(issues, batch_size):
+        documents = [f"{issue['title']} {issue.get('body') or ''}" for issue in batch]
+        embeddings = embed_texts(documents, batch_size=batch_size).tolist()
+
+        record = {
+            "documents": documents,
+            "metadatas": [
+                {
+                    "issue_number": str(issue["number"]),
+                    "title": issue["title"],
+                    "repo_id": repo_id,
+                }
+                for issue in batch
+            ],
+            "embeddings": embeddings,
+            "ids": [f"{repo_id}_{issue['number']}" for issue in batch],
+        }
+        with timed("chroma_upsert"):
+            collection.upsert(**record)
+            hot_indexes.upsert(collection.name, **record)
+            if installation_collection is not None:
+                installation_collection.upsert(**record)
+                hot_indexes.upsert(installation_collection.name, **record)
+        total += len(batch)
+
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"Embedded {total} issues for repo {repo_id} in {elapsed:.2f}s "
+        f"({total / elapsed if elapsed else 0:.1f} issues/sec, batch_size={batch_size}), "
+        f"embedding cache hit rate {get_embedding_cache().stats()['hit_rate']:.1%}"
+    )
+    return total
 
-    functions = []
-    for node in ast.walk(tree):
-        if isinstance(node, ast.FunctionDef):
-            func_name = node.name
-            func_path = f"{file_path}:{func_name}"
-            code = ast.get_source_segment(open(file_path).read(), node)
-            if code:
-                functions.append(
-                    {
-                        "function_path": func_path,
-                        "file_path": file_path,
-                        "function_name": func_name,
-                        "source_code": code,
-                    }
-                )
-    return functions
+
+def get_collection_for_repo_branch(repo_id: int, branch: str = "main"):
+    return _get_or_create_collection(f"github_code_{repo_id}_{branch}")
 
 
 def _format_function_path(function_path: str, file_extensions: List[str]) -> str:
@@ -108,59 +535,176 @@ def _format_function_path(function_path: str, file_extensions: List[str]) -> str
     return formatted_func_path
 
 
+def _code_manifest_path(repo_id: int, branch: str) -> str:
+    return os.path.join(CHROMA_PATH, f"code_manifest_{repo_id}_{branch}.json")
+
+
+def _load_code_manifest(path: str) -> Dict[str, Dict[str, Any]]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _save_code_manifest(path: str, manifest: Dict[str, Dict[str, Any]]) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _file_hash(file_path: str) -> str:
+    with open(file_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+_code_index_locks: DefaultDict[str, threading.Lock] = defaultdict(threading.Lock)
+
+
 def embed_code_base(
-    repo_id: int, base_path: str, file_extensions: List[str] = [".py"]
-) -> None:
+    repo_id: int,
+    base_path: str,
+    file_extensions: List[str] = [".py"],
+    branch: str = "main",
+) -> Dict[str, int]:
     """
-    Recursively embed all functions in a code base
+    Incrementally embed all functions in a code base
+
+    A manifest of file path -> (mtime, size, content hash, function ids) is kept
+    next to the Chroma data. Only files whose content changed are re-parsed and
+    re-embedded, their functions are upserted, and functions of edited or removed
+    files that no longer exist are deleted, so the cost is O(diff) not O(codebase).
+    The repository's dependency graph is refreshed from the same manifest.
 
     :param repo_id: Repository ID of code base
     :param base_path: Root directory of the code base
     :param file_extensions: List of file extensions to process
-    """
-
-    # Add or update code files in the collection
-    collection = get_collection_for_repo_branch(repo_id)
+    :param branch: Branch the code base was checked out from
 
-    # Walk through the directory
-    for root, _, files in os.walk(base_path):
-        for file in files:
-            # Check file extension
-            if any(file.endswith(ext) for ext in file_extensions):
+    :return: Number of changed files, removed files, upserted and deleted functions
+    """
+    collection = get_collection_for_repo_branch(repo_id, branch)
+    manifest_path = _code_manifest_path(repo_id, branch)
+
+    with _code_index_locks[manifest_path]:
+        manifest = _load_code_manifest(manifest_path)
+        new_manifest = {}
+        changed_files = []
+
+        # Walk through the directory
+        for root, _, files in os.walk(base_path):
+            for file in files:
+                if not any(file.endswith(ext) for ext in file_extensions):
+                    continue
                 file_path = os.path.join(root, file)
+                relative_path = os.path.relpath(file_path, base_path).replace("\\", "/")
+                stat = os.stat(file_path)
+                entry = manifest.get(relative_path)
+
+                # mtime and size unchanged, skip hashing the file
+                if (
+                    entry
+                    and entry["mtime"] == stat.st_mtime
+                    and entry["size"] == stat.st_size
+                ):
+                    new_manifest[relative_path] = entry
+                    continue
+
+                content_hash = _file_hash(file_path)
+                if entry and entry["hash"] == content_hash:
+                    new_manifest[relative_path] = {
+                        **entry,
+                        "mtime": stat.st_mtime,
+                        "size": stat.st_size,
+                    }
+                    continue
+
+                new_manifest[relative_path] = {
+                    "mtime": stat.st_mtime,
+                    "size": stat.st_size,
+                    "hash": content_hash,
+                    "function_ids": [],
+                }
+                changed_files.append((relative_path, file_path))
+
+        removed_files = [path for path in manifest if path not in new_manifest]
+        stale_ids = {
+            function_id
+            for path in removed_files + [path for path, _ in changed_files]
+            for function_id in manifest.get(path, {}).get("function_ids", [])
+        }
 
-                # Extract function information
-                functions = _extract_function_info(file_path)
+        functions = []
+        extracted = extract_functions_from_files(
+            [file_path for _, file_path in changed_files],
+            max_workers=CODE_INDEX_WORKERS,
+            parallel_min_files=CODE_INDEX_PARALLEL_MIN_FILES,
+        )
+        for (relative_path, _), file_functions in zip(changed_files, extracted):
+            # ids must be unique within an upsert, a function defined twice in a
+            # file (property setters, overloads, redefinitions) keeps its last definition
+            unique_functions = {}
+            for func in file_functions:
+                func["function_path"] = _format_function_path(
+                    func["function_path"], file_extensions
+                )
+                unique_functions.pop(func["function_path"], None)
+                unique_functions[func["function_path"]] = func
+            new_manifest[relative_path]["function_ids"] = list(unique_functions)
+            functions.extend(unique_functions.values())
+
+        for batch in _iter_batches(functions, EMBEDDING_BATCH_SIZE):
+            collection.upsert(
+                ids=[func["function_path"] for func in batch],
+                embeddings=embed_texts(
+                    [func["source_code"] for func in batch]
+                ).tolist(),
+                documents=[func["source_code"] for func in batch],
+                metadatas=[
+                    {
+                        # sample: src/vector_db/add_issue_to_chroma
+                        "function_path": func["function_path"],
+                        # sample: '<absolutute path to doppelganger>\\src\\vector_db.py'
+                        "file_path": func["file_path"],
+                        # sample: add_issue_to_chroma
+                        "function_name": func["function_name"],
+                        # sample: GenerateDependency.iter_py_files
+                        "qualified_name": func["qualified_name"],
+                    }
+                    for func in batch
+                ],
+            )
 
-                # Embed and store functions
-                for func in functions:
+        deleted_ids = list(stale_ids - {func["function_path"] for func in functions})
+        if deleted_ids:
+            collection.delete(ids=deleted_ids)
 
-                    func["function_path"] = _format_function_path(
-                        func["function_path"], file_extensions
-                    )
+        _save_code_manifest(manifest_path, new_manifest)
 
-                    # Create embedding
-                    embedding = model.encode(f"{func['source_code']}").tolist()
-
-                    # Add to ChromaDB
-                    collection.add(
-                        ids=[func["function_path"]],
-                        embeddings=[embedding],
-                        documents=[func["source_code"]],
-                        metadatas=[
-                            {
-                                "function_path": func[
-                                    "function_path"
-                                ],  # sample: src/vector_db/add_issue_to_chroma
-                                "file_path": func[
-                                    "file_path"
-                                ],  # sample: '<absolutute path to doppelganger>\\src\\vector_db.py'
-                                "function_name": func[
-                                    "function_name"
-                                ],  # sample: add_issue_to_chroma
-                            }
-                        ],
-                    )
+        graph_stats = get_dependency_graph(repo_id, branch).refresh(
+            {
+                os.path.relpath(os.path.join(base_path, path), ROOT_DIR): (
+                    os.path.join(base_path, path),
+                    entry["hash"],
+                )
+                for path, entry in new_manifest.items()
+            }
+        )
+
+    stats = {
+        "changed_files": len(changed_files),
+        "removed_files": len(removed_files),
+        "upserted_functions": len(functions),
+        "deleted_functions": len(deleted_ids),
+        "dependency_graph_parsed_files": graph_stats["parsed_files"],
+    }
+    logger.info(
+        f"Indexed code base of repo {repo_id} ({branch}): {stats}, "
+        f"embedding cache hit rate {get_embedding_cache().stats()['hit_rate']:.1%}"
+    )
+    return stats
 
 
 def query_by_function_names(function_paths, repo_id):
@@ -1,26 +1,80 @@
 import hashlib
 import hmac
 import logging
-
-import requests
-from flask import Blueprint, request, jsonify, abort
-
-from config import WEBHOOK_SECRET, ROOT_DIR
-from src.github_api import fetch_existing_issues
+import threading
+import uuid
+
+from flask import Blueprint, Response, request, jsonify, abort
+
+from config import (
+    WEBHOOK_SECRET,
+    ROOT_DIR,
+    JOB_QUEUE_PATH,
+    JOB_WORKERS,
+    START_JOB_WORKERS,
+    JOB_MAX_ATTEMPTS,
+    JOB_RETRY_BACKOFF,
+    SYNC_DELETE_CLOSED,
+)
 from src.issue_handler import handle_new_issue
-from src.pull_request_handler import handle_new_pull_request
+from src.installation_registry import (
+    register_repositories,
+    unregister_repositories,
+    remove_installation,
+)
+from src.issue_sync import sync_repo_issues, clear_checkpoint
+from src.github_api import get_pull_request_changes, get_token_cache_stats
+from src.job_queue import JobQueue, JobWorkerPool
+from src.metrics import (
+    jobs_processed,
+    metric_labels,
+    registry,
+    render_metrics,
+    timed,
+)
+from src.pull_request_handler import feedback_generations, handle_new_pull_request
 from src.vector_db import (
     add_issues_to_chroma,
+    delete_issues_from_chroma,
     remove_issues_from_chroma,
     embed_code_base,
+    get_embedding_cache_stats,
+    get_hot_index_stats,
 )
 
 logger = logging.getLogger(__name__)
 webhook_blueprint = Blueprint("webhook", __name__)
 
 
+token_cache_gauge = registry.gauge(
+    "doppelganger_token_cache", "GitHub JWT and access token cache counters", ["stat"]
+)
+embedding_cache_gauge = registry.gauge(
+    "doppelganger_embedding_cache", "Embedding cache counters and size", ["stat"]
+)
+hot_index_gauge = registry.gauge(
+    "doppelganger_hot_index", "In-process hot index counters and size", ["stat"]
+)
+
+
+def _collect_cache_stats():
+    for stat, value in get_token_cache_stats().items():
+        token_cache_gauge.set(value, stat=stat)
+    for stat, value in get_embedding_cache_stats().items():
+        embedding_cache_gauge.set(value, stat=stat)
+    for stat, value in get_hot_index_stats().items():
+        hot_index_gauge.set(value, stat=stat)
+
+
+registry.add_collector(_collect_cache_stats)
+
+
 @webhook_blueprint.before_request
 def verify_github_signature():
+    # scraped by Prometheus, which cannot sign its requests
+    if request.endpoint == "webhook.metrics":
+        return
+
     signature = request.headers.get("X-Hub-Signature-256")
     if not signature:
         abort(400, "Signature is missing")
@@ -41,6 +95,7 @@ def github_webhook():
     logger.info("Received webhook")
     data = request.json
     event_type = request.headers.get("X-GitHub-Event", "ping")
+    delivery_id = request.headers.get("X-GitHub-Delivery") or str(uuid.uuid4())
 
     installation_id = data.get("installation", {}).get("id")
 
@@ -50,6 +105,56 @@ def github_webhook():
     logger.info(f"Received webhook with event_type {event_type}")
     logger.info(f"installation_id: {installation_id}")
 
+    if get_job_queue().enqueue(delivery_id, event_type, data):
+        _notify_workers()
+        logger.info(f"Queued delivery {delivery_id}")
+    else:
+        logger.info(f"Ignoring duplicate delivery {delivery_id}")
+
+    return jsonify({"status": "queued", "delivery_id": delivery_id}), 202
+
+
+@webhook_blueprint.route("/sync", methods=["POST"])
+def sync_repositories():
+    """
+    Queue an incremental issue sync, signed with the webhook secret like a delivery
+
+    Expects `{"installation": {"id": ...}, "repositories": [{"id": ..., "full_name": ...}]}`
+    """
+    data = request.json
+    if not data.get("installation", {}).get("id") or not data.get("repositories"):
+        abort(400, "Installation ID or repositories are missing")
+
+    delivery_id = f"sync-{uuid.uuid4()}"
+    get_job_queue().enqueue(delivery_id, "sync", data)
+    _notify_workers()
+    logger.info(f"Queued issue sync {delivery_id}")
+
+    return jsonify({"status": "queued", "delivery_id": delivery_id}), 202
+
+
+@webhook_blueprint.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus scrape endpoint, the only route without a signature check"""
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+def process_event(event_type, data):
+    """Run the handler for a queued webhook delivery"""
+    installation_id = data["installation"]["id"]
+    repo_full_name = data.get("repository", {}).get("full_name", "")
+
+    with metric_labels(event=event_type, repo=repo_full_name):
+        try:
+            with timed("event"):
+                _dispatch_event(event_type, data, installation_id)
+        except Exception:
+            jobs_processed.inc(outcome="error")
+            raise
+        jobs_processed.inc(outcome="ok")
+
+
+def _dispatch_event(event_type, data, installation_id):
     if event_type == "installation_repositories":
         handle_installation_repositories(data, installation_id)
     elif event_type == "installation":
@@ -58,8 +163,56 @@ def github_webhook():
         handle_issues(data, installation_id)
     elif event_type == "pull_request":
         handle_pull_requests(data, installation_id)
+    elif event_type == "sync":
+        handle_sync(data, installation_id)
+
+
+_job_queue = None
+_worker_pool = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """Job queue, opened on first use so importing the app does not touch the disk"""
+    global _job_queue
+    if _job_queue is None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                _job_queue = JobQueue(JOB_QUEUE_PATH)
+    return _job_queue
+
+
+def get_worker_pool() -> JobWorkerPool:
+    global _worker_pool
+    if _worker_pool is None:
+        queue = get_job_queue()
+        with _job_queue_lock:
+            if _worker_pool is None:
+                _worker_pool = JobWorkerPool(
+                    queue,
+                    process_event,
+                    concurrency=JOB_WORKERS,
+                    max_attempts=JOB_MAX_ATTEMPTS,
+                    retry_backoff=JOB_RETRY_BACKOFF,
+                )
+    return _worker_pool
+
+
+def start_worker_pool() -> None:
+    """
+    Start the job workers of this process
 
-    return jsonify({"status": "success"}), 200
+    Called by `python app.py` on startup and otherwise on the first delivery, so
+    importing the app starts no threads. gunicorn.conf.py turns this off and
+    starts the pool in each worker process after the fork.
+    """
+    if START_JOB_WORKERS:
+        get_worker_pool().start()
+
+
+def _notify_workers() -> None:
+    start_worker_pool()
+    get_worker_pool().notify()
 
 
 def handle_installation_repositories(data, installation_id):
@@ -72,11 +225,8 @@ def handle_installation_repositories(data, installation_id):
             repo_id = repo.get("id")
             if repo_full_name and repo_id:
                 logger.info(f"Repository added to installation: {repo_full_name}")
-                existing_issues = fetch_existing_issues(installation_id, repo_full_name)
-                add_issues_to_chroma(existing_issues, repo_id)
-                logger.info(
-                    f"Loaded {len(existing_issues)} existing issues into the database for {repo_full_name}"
-                )
+                register_repositories(installation_id, {repo_id: repo_full_name})
+                sync_repo_issues(installation_id, repo_full_name, repo_id)
 
     elif action == "removed":
         repositories_removed = data.get("repositories_removed", [])
@@ -86,6 +236,8 @@ def handle_installation_repositories(data, installation_id):
             if repo_full_name and repo_id:
                 logger.info(f"Repository removed from installation: {repo_full_name}")
                 remove_issues_from_chroma(repo_id)
+                clear_checkpoint(repo_id)
+                unregister_repositories(installation_id, [repo_id])
                 logger.info(f"Removed issues for {repo_full_name} from the database")
 
     else:
@@ -100,11 +252,10 @@ def handle_installation(data, installation_id):
             repo_id = repo.get("id")
             if repo_full_name and repo_id:
                 logger.info(f"App installed on repository: {repo_full_name}")
-                existing_issues = fetch_existing_issues(installation_id, repo_full_name)
-                add_issues_to_chroma(existing_issues, repo_id)
-                logger.info(
-                    f"Loaded {len(existing_issues)} existing issues into the database for {repo_full_name}"
-                )
+                register_repositories(installation_id, {repo_id: repo_full_name})
+                sync_repo_issues(installation_id, repo_full_name, repo_id)
+    elif data["action"] == "deleted":
+        remove_installation(installation_id)
 
 
 def handle_issues(data, installation_id):
@@ -114,7 +265,10 @@ def handle_issues(data, installation_id):
     repo_id = data.get("repository", {}).get("id")
 
     if not repo_full_name or not repo_id:
-        abort(400, "Repository full name or ID is missing")
+        raise ValueError("Repository full name or ID is missing")
+
+    # picks up repositories installed before the registry existed
+    register_repositories(installation_id, {repo_id: repo_full_name})
 
     if action == "opened":
         handle_new_issue(
@@ -125,6 +279,24 @@ def handle_issues(data, installation_id):
             issue["title"],
             issue.get("body", ""),
         )
+    elif action in ("edited", "reopened"):
+        add_issues_to_chroma([issue], repo_id)
+        logger.info(f"Updated issue #{issue['number']} in {repo_full_name}")
+    elif action in ("deleted", "transferred"):
+        delete_issues_from_chroma([issue["number"]], repo_id)
+        logger.info(f"Removed issue #{issue['number']} of {repo_full_name}")
+    elif action == "closed" and SYNC_DELETE_CLOSED:
+        delete_issues_from_chroma([issue["number"]], repo_id)
+        logger.info(f"Removed closed issue #{issue['number']} of {repo_full_name}")
+
+
+def handle_sync(data, installation_id):
+    for repo in data.get("repositories", []):
+        repo_full_name = repo.get("full_name")
+        repo_id = repo.get("id")
+        if repo_full_name and repo_id:
+            register_repositories(installation_id, {repo_id: repo_full_name})
+            sync_repo_issues(installation_id, repo_full_name, repo_id)
 
 
 def handle_pull_requests(data, installation_id):
@@ -134,35 +306,52 @@ def handle_pull_requests(data, installation_id):
     repo_id = data.get("repository", {}).get("id")
 
     if not repo_full_name or not repo_id:
-        abort(400, "Repository information missing")
-
-    pr_diff = requests.get(pull_request["diff_url"]).text
-    changed_files = [
-        f["filename"] for f in requests.get(pull_request["url"] + "/files").json()
-    ]
-
-    if action == "opened" or action == "edited":
-        # try:
-        # # Update main branch collection if needed
-        # temp_dir = clone_repo_branch(installation_id, repo_full_name, "main")
-
-        embed_code_base(
-            repo_id, f"{ROOT_DIR}/src"
-        )  # TODO: 1. add embeddings when a repository is added, ensure root dir is from the repo of rep_id and main branch code is embedded
-        # TODO: 2. ensure embeddings are updated after a pull request (look at actions) on main
+        raise ValueError("Repository information missing")
+
+    generation_key = (repo_id, pull_request["number"])
+    # registered before the downloads so a newer delivery always supersedes this one
+    cancel = (
+        feedback_generations.begin(generation_key)
+        if action in ("opened", "edited")
+        else None
+    )
+    try:
+        if action == "opened" or action == "edited":
+            with timed("pr_diff_download"):
+                pr_diff, changed_files = get_pull_request_changes(
+                    installation_id,
+                    repo_full_name,
+                    pull_request["number"],
+                    pull_request["head"]["sha"],
+                )
 
-        # Handle the pull request
-        handle_new_pull_request(
-            installation_id,
-            repo_id,
-            repo_full_name,
-            pull_request["number"],
-            pull_request.get("title", ""),
-            pull_request.get("body", ""),
-            pr_diff,
-            changed_files,
-        )
-        # finally:
-        #     if temp_dir and os.path.exists(temp_dir):
-        #         logging.info(f"removing temp_dir {temp_dir}...")
-        #         shutil.rmtree(temp_dir, ignore_errors=True)
+            # try:
+            # # Update main branch collection if needed
+            # temp_dir = clone_repo_branch(installation_id, repo_full_name, "main")
+
+            with timed("embed_code_base"):
+                embed_code_base(
+                    repo_id, f"{ROOT_DIR}/src"
+                )  # TODO: 1. add embeddings when a repository is added, ensure root dir is from the repo of rep_id and main branch code is embedded
+            # TODO: 2. ensure embeddings are updated after a pull request (look at actions) on main
+
+            # Handle the pull request
+            handle_new_pull_request(
+                installation_id,
+                repo_id,
+                repo_full_name,
+                pull_request["number"],
+                pull_request.get("title", ""),
+                pull_request.get("body", ""),
+                pr_diff,
+                changed_files,
+                cancel,
+                pull_request["head"]["sha"],
+            )
+            # finally:
+            #     if temp_dir and os.path.exists(temp_dir):
+            #         logging.info(f"removing temp_dir {temp_dir}...")
+            #         shutil.rmtree(temp_dir, ignore_errors=True)
+    finally:
+        if cancel is not None:
+            feedback_generations.end(generation_key, cancel)
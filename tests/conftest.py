@@ -0,0 +1,7 @@
+import os
+import tempfile
+
+# keep tests away from the app's Chroma data and caches, this has to happen
+# before config is imported
+if "CHROMA_PATH" not in os.environ:
+    os.environ["CHROMA_PATH"] = tempfile.mkdtemp(prefix="doppelganger-tests-")
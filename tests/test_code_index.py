@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from src import code_parser, vector_db
+from src.code_parser import extract_function_info, extract_functions_from_files
+
+PROPERTY_SETTER = """
+class A:
+    @property
+    def x(self):
+        return self._x
+
+    @x.setter
+    def x(self, value):
+        self._x = value
+"""
+
+
+@pytest.fixture
+def fake_embeddings(monkeypatch):
+    monkeypatch.setattr(
+        vector_db, "embed_texts", lambda texts, *args: np.ones((len(texts), 8))
+    )
+
+
+def test_property_setter_is_indexed_once(tmp_path, fake_embeddings):
+    (tmp_path / "a.py").write_text(PROPERTY_SETTER)
+
+    stats = vector_db.embed_code_base(8001, str(tmp_path))
+
+    collection = vector_db.get_collection_for_repo_branch(8001)
+    stored = collection.get(include=["documents", "metadatas"])
+    assert stats["upserted_functions"] == 1
+    assert len(stored["ids"]) == 1
+    assert stored["metadatas"][0]["qualified_name"] == "A.x"
+    # the setter, defined last, is the one kept
+    assert "self._x = value" in stored["documents"][0]
+
+
+def test_reindexing_file_with_duplicates_deletes_nothing_twice(
+    tmp_path, fake_embeddings
+):
+    source = tmp_path / "a.py"
+    source.write_text(PROPERTY_SETTER)
+    vector_db.embed_code_base(8002, str(tmp_path))
+
+    source.write_text(PROPERTY_SETTER + "\n\ndef y():\n    pass\n")
+    stats = vector_db.embed_code_base(8002, str(tmp_path))
+
+    stored = vector_db.get_collection_for_repo_branch(8002).get()
+    assert stats["deleted_functions"] == 0
+    assert len(stored["ids"]) == 2
+
+
+def test_parser_keeps_last_definition_of_overloads(tmp_path):
+    source = tmp_path / "b.py"
+    source.write_text(
+        "from typing import overload\n\n\n"
+        "@overload\ndef f(x: int) -> int: ...\n\n\n"
+        "@overload\ndef f(x: str) -> str: ...\n\n\n"
+        "def f(x):\n    return x\n"
+    )
+
+    functions = extract_function_info(str(source))
+
+    assert [func["qualified_name"] for func in functions] == ["f"]
+    assert "return x" in functions[0]["source_code"]
+
+
+def test_parallel_parsing_matches_serial(tmp_path):
+    paths = []
+    for i in range(4):
+        path = tmp_path / f"m{i}.py"
+        path.write_text(PROPERTY_SETTER + f"\n\ndef g{i}():\n    pass\n")
+        paths.append(str(path))
+
+    parallel = extract_functions_from_files(paths, max_workers=2, parallel_min_files=1)
+
+    assert parallel == [extract_function_info(path) for path in paths]
+
+
+def test_parse_pool_is_reused_across_calls(tmp_path):
+    path = tmp_path / "m.py"
+    path.write_text(PROPERTY_SETTER)
+
+    extract_functions_from_files([str(path)], max_workers=2, parallel_min_files=1)
+    pool = code_parser._pool
+    extract_functions_from_files([str(path)], max_workers=2, parallel_min_files=1)
+
+    assert code_parser._pool is pool
@@ -0,0 +1,99 @@
+import threading
+from types import SimpleNamespace
+
+from src import vector_db
+
+
+def _repo_collection(repo_id, count):
+    ids = [f"{repo_id}_{n}" for n in range(count)]
+
+    def get(include=None, limit=None, offset=0, **kwargs):
+        batch = ids[offset : offset + limit]
+        return {
+            "ids": batch,
+            "documents": ["doc"] * len(batch),
+            "metadatas": [{"repo_id": repo_id}] * len(batch),
+            "embeddings": [[1.0, 0.0]] * len(batch),
+        }
+
+    return SimpleNamespace(count=lambda: count, get=get)
+
+
+def test_copy_for_one_installation_does_not_block_another(monkeypatch):
+    reading = threading.Event()
+    release = threading.Event()
+
+    def installation_collection(installation_id):
+        def get(where=None, include=None):
+            if installation_id == 9301:
+                reading.set()
+                release.wait(5)
+            return {"ids": []}
+
+        return SimpleNamespace(
+            name=f"installation_{installation_id}",
+            get=get,
+            upsert=lambda **kwargs: None,
+        )
+
+    monkeypatch.setattr(
+        vector_db, "get_collection_for_installation", installation_collection
+    )
+    monkeypatch.setattr(
+        vector_db,
+        "get_collection_for_repo",
+        lambda repo_id: _repo_collection(repo_id, 3),
+    )
+
+    slow = threading.Thread(
+        target=vector_db.index_installation_repositories, args=(9301, [1])
+    )
+    slow.start()
+    reading.wait(5)
+    try:
+        assert vector_db.index_installation_repositories(9302, [2]) == 3
+        assert slow.is_alive()
+    finally:
+        release.set()
+        slow.join()
+
+
+def _installation_ids(installation_id):
+    return sorted(
+        vector_db.get_collection_for_installation(installation_id).get(include=[])[
+            "ids"
+        ]
+    )
+
+
+def test_issues_are_copied_and_mirrored_across_repositories(monkeypatch):
+    monkeypatch.setattr(vector_db, "reranker", None)
+    installations = {}
+    monkeypatch.setattr(vector_db, "CROSS_REPO_SEARCH", True)
+    monkeypatch.setattr(vector_db, "get_repository_installation", installations.get)
+    # indexed before the repositories joined the installation
+    vector_db.add_issue_to_chroma("Crash on start", 1, "Crash", 9311, [1.0, 0.0])
+    vector_db.add_issue_to_chroma("Dark mode", 2, "Dark mode", 9311, [0.0, 1.0])
+    vector_db.add_issue_to_chroma("Crash on exit", 1, "Crash", 9312, [0.9, 0.1])
+    installations.update({9311: 9310, 9312: 9310})
+
+    assert vector_db.index_installation_repositories(9310, [9311, 9312]) == 3
+    assert vector_db.index_installation_repositories(9310, [9311, 9312]) == 0
+
+    # later writes are mirrored into the installation collection
+    vector_db.add_issue_to_chroma("Slow search", 3, "Slow", 9312, [0.5, 0.5])
+    assert _installation_ids(9310) == ["9311_1", "9311_2", "9312_1", "9312_3"]
+
+    candidates = vector_db.query_similar_issues_for_installation(
+        "Crash", 9310, [9311, 9312], k=2, embedding=[1.0, 0.0]
+    )
+    assert [(c["repo_id"], c["issue_number"]) for c in candidates] == [
+        (9311, "1"),
+        (9312, "1"),
+    ]
+
+    vector_db.delete_issues_from_chroma([2], 9311)
+    assert _installation_ids(9310) == ["9311_1", "9312_1", "9312_3"]
+
+    vector_db.remove_issues_from_chroma(9312)
+    assert _installation_ids(9310) == ["9311_1"]
@@ -0,0 +1,65 @@
+import pytest
+
+from src.dependency_graph import DependencyGraph, extract_imports
+
+FILES = {
+    "pkg/__init__.py": "",
+    "pkg/a.py": "from .b import helper\nfrom . import c\n",
+    "pkg/b.py": "def helper():\n    pass\n\ndef other():\n    pass\n",
+    "pkg/c.py": "from pkg.b import other\n\ndef run():\n    other()\n",
+    "pkg/sub/__init__.py": "",
+    "pkg/sub/d.py": "from ..b import helper\nfrom .. import a\n",
+}
+
+
+@pytest.fixture
+def graph(tmp_path):
+    files = {}
+    for relative_path, source in FILES.items():
+        path = tmp_path / "repo" / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(source)
+        files[relative_path] = (str(path), str(hash(source)))
+    graph = DependencyGraph(str(tmp_path / "graph.json"))
+    graph.refresh(files)
+    return graph
+
+
+def test_relative_imports_are_resolved(tmp_path):
+    path = tmp_path / "d.py"
+    path.write_text(FILES["pkg/sub/d.py"])
+    assert extract_imports(str(path), "pkg/sub/d") == ["pkg.a", "pkg.b.helper"]
+
+    path.write_text("from . import b\nfrom .b import helper\n")
+    # a package's __init__ resolves `.` to the package itself, like a module in it
+    assert extract_imports(str(path), "pkg/__init__") == ["pkg.b", "pkg.b.helper"]
+
+
+def test_imported_functions_and_dependents(graph):
+    assert graph.imported_functions("pkg/a") == {"pkg/b/helper"}
+    assert graph.imported_functions("pkg/sub/d") == {"pkg/b/helper"}
+    assert graph.dependents("pkg/b") == {"pkg/a", "pkg/c", "pkg/sub/d"}
+    assert graph.dependents("pkg/a") == {"pkg/sub/d"}
+
+
+def test_dependencies_follow_imports_up_to_depth(graph):
+    assert graph.dependencies("pkg/a", depth=1) == {"pkg/b/helper"}
+    # pkg/a imports pkg/c, which imports pkg/b.other
+    assert graph.dependencies("pkg/a", depth=2) == {"pkg/b/helper", "pkg/b/other"}
+    assert graph.dependencies_of_files(["pkg/sub/d.py", "pkg/c.py"]) == [
+        "pkg/b/helper",
+        "pkg/b/other",
+    ]
+
+
+def test_snapshot_is_reloaded_and_only_changed_files_reparsed(graph, tmp_path):
+    reloaded = DependencyGraph(str(tmp_path / "graph.json"))
+    assert reloaded.dependents("pkg/b") == graph.dependents("pkg/b")
+
+    files = {
+        relative_path: (str(tmp_path / "repo" / relative_path), str(hash(source)))
+        for relative_path, source in FILES.items()
+        if relative_path != "pkg/c.py"
+    }
+    assert reloaded.refresh(files) == {"parsed_files": 0, "removed_files": 1}
+    assert reloaded.dependents("pkg/b") == {"pkg/a", "pkg/sub/d"}
@@ -0,0 +1,52 @@
+import itertools
+from types import SimpleNamespace
+
+import numpy as np
+
+from src import embedding_cache
+from src.embedding_cache import EmbeddingCache
+
+
+def test_key_ignores_whitespace_but_not_model():
+    key = EmbeddingCache.make_key("model-a", "Crash  on\nstart")
+
+    assert key == EmbeddingCache.make_key("model-a", "Crash on start ")
+    assert key != EmbeddingCache.make_key("model-b", "Crash on start")
+    assert key != EmbeddingCache.make_key("model-a", "Crash on exit")
+
+
+def test_vectors_round_trip(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite3"), 10)
+    cache.put_many({"a": np.array([0.25, -1.0])})
+
+    found = cache.get_many(["a", "b"])
+
+    np.testing.assert_array_equal(found["a"], np.array([0.25, -1.0], np.float32))
+    assert "b" not in found
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_least_recently_used_vector_is_evicted(tmp_path, monkeypatch):
+    # a strictly increasing clock, so last_used never ties
+    ticks = itertools.count()
+    monkeypatch.setattr(
+        embedding_cache, "time", SimpleNamespace(time=lambda: next(ticks))
+    )
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite3"), 2)
+    cache.put_many({"a": np.ones(2)})
+    cache.put_many({"b": np.ones(2)})
+    cache.get_many(["a"])
+
+    cache.put_many({"c": np.ones(2)})
+
+    assert set(cache.get_many(["a", "b", "c"])) == {"a", "c"}
+    assert cache.stats()["size"] == 2
+
+
+def test_zero_entries_disables_the_cache(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite3"), 0)
+    cache.put_many({"a": np.ones(2)})
+
+    assert cache.get_many(["a"]) == {}
+    assert not (tmp_path / "embeddings.sqlite3").exists()
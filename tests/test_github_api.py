@@ -0,0 +1,61 @@
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from src import github_api
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def issued_tokens(monkeypatch):
+    clock = FakeClock()
+    tokens = []
+
+    def request_access_token(installation_id, jwt_token):
+        tokens.append(f"token-{len(tokens)}")
+        return tokens[-1], clock.now + 3600
+
+    monkeypatch.setattr(github_api, "time", clock)
+    monkeypatch.setattr(github_api, "generate_jwt", lambda current_time=None: "jwt")
+    monkeypatch.setattr(github_api, "_request_access_token", request_access_token)
+    monkeypatch.setattr(github_api, "_token_cache", github_api._TokenCache())
+    return SimpleNamespace(clock=clock, tokens=tokens)
+
+
+def test_token_is_reused_until_shortly_before_expiry(issued_tokens):
+    assert github_api.get_access_token(1) == "token-0"
+    assert github_api.get_access_token(1) == "token-0"
+
+    issued_tokens.clock.now += 3600 - github_api.TOKEN_REFRESH_MARGIN
+    assert github_api.get_access_token(1) == "token-1"
+    assert github_api.get_token_cache_stats()["token_misses"] == 2
+
+
+def test_tokens_are_cached_per_installation(issued_tokens):
+    assert github_api.get_access_token(1) == "token-0"
+    assert github_api.get_access_token(2) == "token-1"
+    assert github_api.get_access_token(1) == "token-0"
+
+
+def test_rejected_token_is_dropped(issued_tokens, monkeypatch):
+    response = requests.Response()
+    response.status_code = 401
+    monkeypatch.setattr(
+        github_api,
+        "get_github_client",
+        lambda: SimpleNamespace(post=lambda *args, **kwargs: response),
+    )
+    github_api.get_access_token(1)
+
+    with pytest.raises(requests.HTTPError):
+        github_api.leave_comment(1, "owner/repo", 7, "comment")
+
+    assert github_api.get_access_token(1) == "token-1"
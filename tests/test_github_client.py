@@ -0,0 +1,62 @@
+import json
+import threading
+import time
+
+import requests
+
+from src.github_client import GitHubClient
+
+BASE_URL = "https://api.example.test"
+
+
+class FakeSession:
+    """Serves `pages` pages of a list, earlier pages answering slower"""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.requested = []
+        self._lock = threading.Lock()
+
+    def request(self, method, url, params=None, **kwargs):
+        page = params["page"]
+        with self._lock:
+            self.requested.append(page)
+        if page > 1:
+            time.sleep(0.01 * (self.pages - page))
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps([f"item-{page}"]).encode()
+        if page == 1 and self.pages > 1:
+            response.headers["Link"] = (
+                f'<{url}?per_page=100&page=2>; rel="next", '
+                f'<{url}?per_page=100&page={self.pages}>; rel="last"'
+            )
+        return response
+
+
+def test_last_page_is_read_from_link_header():
+    response = requests.Response()
+    response.headers["Link"] = (
+        f'<{BASE_URL}/repos/o/r/issues?state=all&page=2>; rel="next", '
+        f'<{BASE_URL}/repos/o/r/issues?state=all&page=34>; rel="last"'
+    )
+    assert GitHubClient._last_page_number(response) == 34
+    assert GitHubClient._last_page_number(requests.Response()) == 1
+
+
+def test_concurrent_pages_are_yielded_in_order():
+    client = GitHubClient(BASE_URL, max_workers=4)
+    client.session = FakeSession(pages=8)
+
+    pages = list(client.iter_pages("/repos/o/r/issues"))
+
+    assert pages == [[f"item-{page}"] for page in range(1, 9)]
+    assert sorted(client.session.requested) == list(range(1, 9))
+
+
+def test_single_page_list_is_fetched_once():
+    client = GitHubClient(BASE_URL)
+    client.session = FakeSession(pages=1)
+
+    assert client.paginate("/repos/o/r/issues") == ["item-1"]
+    assert client.session.requested == [1]
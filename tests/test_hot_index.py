@@ -0,0 +1,75 @@
+import threading
+
+from src.hot_index import HotIndexCache, Loaded
+
+
+def _loaded(*ids):
+    return Loaded(
+        list(ids), [[1.0, 0.0]] * len(ids), [{}] * len(ids), ["doc"] * len(ids), "l2"
+    )
+
+
+def test_slow_load_does_not_block_other_collections():
+    cache = HotIndexCache(2**20)
+    cache.get("b", lambda: _loaded("b1"))
+    loading = threading.Event()
+    release = threading.Event()
+
+    def slow_load():
+        loading.set()
+        release.wait(5)
+        return _loaded("a1")
+
+    loader = threading.Thread(target=cache.get, args=("a", slow_load))
+    loader.start()
+    loading.wait(5)
+    try:
+        # served from the loaded index while "a" is still reading from Chroma
+        assert len(cache.get("b", lambda: _loaded())) == 1
+        assert loader.is_alive()
+    finally:
+        release.set()
+        loader.join()
+    assert len(cache.get("a", lambda: _loaded())) == 1
+
+
+def test_write_during_load_is_applied_to_new_index():
+    cache = HotIndexCache(2**20)
+    loading = threading.Event()
+    release = threading.Event()
+
+    def slow_load():
+        loading.set()
+        release.wait(5)
+        return _loaded("a1")
+
+    loader = threading.Thread(target=cache.get, args=("a", slow_load))
+    loader.start()
+    loading.wait(5)
+    writer = threading.Thread(
+        target=cache.upsert, args=("a", ["a2"], [[0.0, 1.0]], [{}], ["doc"])
+    )
+    writer.start()
+    release.set()
+    loader.join()
+    writer.join()
+
+    assert len(cache.get("a", lambda: _loaded())) == 2
+
+
+def test_oversized_collection_is_not_reloaded_until_written():
+    # room for one row, not two
+    cache = HotIndexCache(20)
+    loads = []
+
+    def load():
+        loads.append(1)
+        return _loaded("a1", "a2")
+
+    for _ in range(5):
+        assert cache.get("a", load) is None
+    assert len(loads) == 1
+
+    cache.delete("a", ["a2"])
+    assert cache.get("a", load) is None
+    assert len(loads) == 2
@@ -0,0 +1,21 @@
+from src import vector_db
+from src.hot_index import HotIndexCache
+
+
+def test_adding_issue_again_replaces_it_in_chroma_and_hot_index(monkeypatch):
+    monkeypatch.setattr(vector_db, "hot_indexes", HotIndexCache(2**20))
+    repo_id = 8101
+    vector_db.add_issue_to_chroma("Crash on start", 1, "Crash", repo_id, [1.0, 0.0])
+    collection = vector_db.get_collection_for_repo(repo_id)
+    # load the hot index, so the second write is applied to it
+    vector_db.hot_indexes.get(
+        collection.name, lambda: vector_db._load_hot_index(lambda: collection)
+    )
+
+    vector_db.add_issue_to_chroma("Crash on exit", 1, "Crash", repo_id, [0.0, 1.0])
+
+    stored = collection.get(ids=[f"{repo_id}_1"], include=["documents"])
+    hot = vector_db.hot_indexes.get(collection.name, lambda: None).search([0.0, 1.0], 1)
+    assert stored["documents"] == ["Crash on exit"]
+    assert hot["documents"] == [["Crash on exit"]]
+    assert hot["distances"][0][0] < 1e-6
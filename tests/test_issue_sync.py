@@ -0,0 +1,58 @@
+import pytest
+
+from src import issue_sync
+
+
+@pytest.fixture
+def fetched_since(tmp_path, monkeypatch):
+    calls = []
+
+    def iter_existing_issues(installation_id, repo_full_name, since=None):
+        calls.append(since)
+        yield {"number": 1, "title": "Crash", "body": "", "state": "open"}
+        yield {"number": 2, "title": "Old", "body": "", "state": "closed"}
+
+    def add_issues_to_chroma(issues, repo_id):
+        return len(list(issues))
+
+    monkeypatch.setattr(
+        issue_sync, "CHECKPOINT_FILE", str(tmp_path / "sync_checkpoints.json")
+    )
+    monkeypatch.setattr(issue_sync, "iter_existing_issues", iter_existing_issues)
+    monkeypatch.setattr(issue_sync, "add_issues_to_chroma", add_issues_to_chroma)
+    monkeypatch.setattr(issue_sync, "delete_issues_from_chroma", lambda *args: None)
+    monkeypatch.setattr(issue_sync, "SYNC_DELETE_CLOSED", True)
+    return calls
+
+
+def test_second_sync_fetches_since_the_first(fetched_since):
+    stats = issue_sync.sync_repo_issues(1, "owner/repo", 9201)
+    assert stats == {"upserted": 1, "deleted": 1}
+    first_checkpoint = issue_sync.load_checkpoint(9201)
+
+    issue_sync.sync_repo_issues(1, "owner/repo", 9201)
+
+    assert fetched_since == [None, first_checkpoint]
+    assert issue_sync.load_checkpoint(9201) >= first_checkpoint
+
+
+def test_failed_sync_keeps_the_checkpoint(fetched_since, monkeypatch):
+    issue_sync.save_checkpoint(9202, "2024-01-01T00:00:00Z")
+
+    def failing_add(issues, repo_id):
+        raise RuntimeError("Chroma is down")
+
+    monkeypatch.setattr(issue_sync, "add_issues_to_chroma", failing_add)
+    with pytest.raises(RuntimeError):
+        issue_sync.sync_repo_issues(1, "owner/repo", 9202)
+
+    assert issue_sync.load_checkpoint(9202) == "2024-01-01T00:00:00Z"
+
+
+def test_clearing_a_checkpoint_syncs_everything_again(fetched_since):
+    issue_sync.save_checkpoint(9203, "2024-01-01T00:00:00Z")
+    issue_sync.clear_checkpoint(9203)
+
+    issue_sync.sync_repo_issues(1, "owner/repo", 9203)
+
+    assert fetched_since == [None]
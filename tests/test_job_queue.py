@@ -0,0 +1,85 @@
+import sqlite3
+import time
+
+from src.job_queue import JobQueue, JobWorkerPool, run_once
+
+
+def _status(path, delivery_id):
+    with sqlite3.connect(path) as conn:
+        return conn.execute(
+            "SELECT status FROM jobs WHERE delivery_id = ?", (delivery_id,)
+        ).fetchone()[0]
+
+
+def test_enqueue_deduplicates_delivery_ids(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+
+    assert queue.enqueue("d1", "issues", {"n": 1})
+    assert not queue.enqueue("d1", "issues", {"n": 1})
+    job = queue.claim()
+    assert job.delivery_id == "d1"
+    assert queue.claim() is None
+
+
+def test_failed_attempt_is_retried_after_backoff(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    queue.enqueue("d1", "issues", {})
+
+    assert queue.fail(queue.claim(), "boom", max_attempts=3, backoff=60)
+    # not ready before the backoff has passed
+    assert queue.claim() is None
+
+    queue.enqueue("d2", "issues", {})
+    assert queue.fail(queue.claim(), "boom", max_attempts=3, backoff=0)
+    retried = queue.claim()
+    assert retried.delivery_id == "d2"
+    assert retried.attempts == 2
+    assert not queue.fail(retried, "boom", max_attempts=2, backoff=0)
+
+
+def test_redelivered_failed_job_is_queued_again(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    queue = JobQueue(path)
+    queue.enqueue("d1", "issues", {})
+    queue.fail(queue.claim(), "boom", max_attempts=1, backoff=0)
+    assert _status(path, "d1") == "failed"
+
+    assert queue.enqueue("d1", "issues", {"redelivered": True})
+    job = queue.claim()
+    assert job.payload == {"redelivered": True}
+    assert job.attempts == 1
+
+
+def test_retry_skips_steps_completed_by_earlier_attempts(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    queue = JobQueue(path)
+    comments = []
+
+    def handler(event_type, payload):
+        run_once("comment", lambda: comments.append(payload["n"]))
+        if len(comments) == 1 and not handler.failed:
+            handler.failed = True
+            raise RuntimeError("a later stage failed")
+
+    handler.failed = False
+    pool = JobWorkerPool(
+        queue, handler, concurrency=1, retry_backoff=0, poll_interval=0.01
+    )
+    queue.enqueue("d1", "issues", {"n": 1})
+    pool.start()
+    try:
+        deadline = time.time() + 10
+        while _status(path, "d1") != "done" and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        pool.stop(timeout=5)
+
+    assert _status(path, "d1") == "done"
+    assert comments == [1]
+
+
+def test_run_once_outside_a_job_always_runs():
+    calls = []
+    run_once("comment", lambda: calls.append(1))
+    run_once("comment", lambda: calls.append(1))
+    assert calls == [1, 1]
@@ -0,0 +1,36 @@
+import os
+
+from src.metrics import Registry
+
+
+def test_shared_metrics_sum_over_processes(tmp_path, monkeypatch):
+    registry = Registry()
+    jobs = registry.counter("jobs_total", "Jobs", ["event"])
+    seconds = registry.histogram("seconds", "Seconds", ["event"], buckets=(1.0,))
+    cached = registry.gauge("cached", "Cached", ["stat"])
+
+    # one registry stands in for two workers, told apart by their pid
+    monkeypatch.setattr(os, "getpid", lambda: 101)
+    registry.share(str(tmp_path), interval=3600)
+    jobs.inc(event="issues")
+    seconds.observe(0.5, event="issues")
+    cached.set(5, stat="size")
+    registry.write()
+
+    monkeypatch.setattr(os, "getpid", lambda: 102)
+    registry.share(str(tmp_path), interval=3600)
+    jobs.inc(2, event="issues")
+    seconds.observe(2.0, event="issues")
+    cached.set(7, stat="size")
+    rendered = registry.render()
+
+    assert 'jobs_total{event="issues"} 3' in rendered
+    assert 'seconds_bucket{event="issues",le="1"} 1' in rendered
+    assert 'seconds_count{event="issues"} 2' in rendered
+    assert 'cached{stat="size",pid="101"} 5' in rendered
+    assert 'cached{stat="size",pid="102"} 7' in rendered
+
+    registry.remove_process(str(tmp_path), 101)
+    rendered = registry.render()
+    assert 'jobs_total{event="issues"} 3' in rendered
+    assert 'pid="101"' not in rendered
@@ -0,0 +1,55 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from src.micro_batcher import MicroBatcher
+
+
+def encode_lengths(texts):
+    encode_lengths.batches.append(len(texts))
+    return np.array([[len(text)] for text in texts], dtype=np.float32)
+
+
+def test_each_caller_gets_its_own_vector():
+    encode_lengths.batches = []
+    batcher = MicroBatcher(encode_lengths, max_batch_size=8, max_wait=0.05)
+    texts = ["a" * length for length in range(1, 33)]
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        vectors = list(executor.map(batcher.encode, texts))
+
+    assert [int(vector[0]) for vector in vectors] == list(range(1, 33))
+    # concurrent requests were coalesced
+    assert len(encode_lengths.batches) < len(texts)
+    assert max(encode_lengths.batches) <= 8
+
+
+def test_encode_error_reaches_every_caller_of_the_batch():
+    broken = [True]
+
+    def flaky_encode(texts):
+        if broken[0]:
+            raise ValueError("model crashed")
+        return encode_lengths(texts)
+
+    batcher = MicroBatcher(flaky_encode, max_batch_size=8, max_wait=0.05)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(batcher.encode, "text") for _ in range(4)]
+        for future in futures:
+            with pytest.raises(ValueError, match="model crashed"):
+                future.result()
+
+    # the batcher thread survives and serves later requests
+    broken[0] = False
+    encode_lengths.batches = []
+    assert int(batcher.encode("abc")[0]) == 3
+
+
+def test_disabled_batcher_encodes_on_the_callers_thread():
+    encode_lengths.batches = []
+    batcher = MicroBatcher(encode_lengths, max_batch_size=1)
+
+    assert int(batcher.encode("abcd")[0]) == 4
+    assert batcher._thread is None
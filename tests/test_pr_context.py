@@ -0,0 +1,72 @@
+import numpy as np
+
+from src.pr_context import (
+    DIFF_BUDGET_SHARE,
+    build_pr_context,
+    estimate_tokens,
+    split_diff,
+)
+
+
+def _file_diff(path, hunks):
+    return f"diff --git a/{path} b/{path}\n--- a/{path}\n+++ b/{path}\n" + "".join(
+        f"@@ -{i},1 +{i},1 @@\n-{body}\n+{body}!\n" for i, body in enumerate(hunks, 1)
+    )
+
+
+def _function(name, source):
+    return {"metadata": {"function_path": name}, "source_code": source}
+
+
+def embed_by_keyword(texts):
+    # one dimension per keyword, so similarity follows shared keywords
+    return np.array(
+        [[text.count("parse"), text.count("render"), 0.01] for text in texts],
+        dtype=np.float32,
+    )
+
+
+def test_split_diff_prefixes_every_hunk_with_its_file_header():
+    diff = _file_diff("a.py", ["x", "y"]) + (
+        "diff --git a/logo.png b/logo.png\nBinary files differ\n"
+    )
+
+    hunks = split_diff(diff)
+
+    assert [hunk.file_path for hunk in hunks] == ["a.py", "a.py", "logo.png"]
+    assert hunks[1].text.startswith(
+        "diff --git a/a.py b/a.py\n--- a/a.py\n+++ b/a.py\n@@ -2"
+    )
+    assert "Binary files differ" in hunks[2].text
+
+
+def test_diff_takes_its_share_and_functions_the_rest():
+    diff = _file_diff("parser.py", ["parse " * 20]) + _file_diff("big.py", ["x" * 4000])
+    functions = [
+        _function("render_page", "def render_page():\n    render()\n" * 3),
+        _function("parse_args", "def parse_args():\n    parse()\n" * 3),
+    ]
+    budget = 200
+
+    context = build_pr_context(diff, functions, budget, embed_by_keyword)
+
+    assert "parser.py" in context.diff
+    assert "x" * 100 not in context.diff
+    assert "[Changes omitted to fit the context: big.py]" in context.diff
+    # the kept hunks fit the diff share, the note listing omitted files comes on top
+    assert estimate_tokens(context.diff) <= budget * DIFF_BUDGET_SHARE + 20
+    # the function closest to the kept hunk comes first
+    assert context.functions.index("parse_args") < context.functions.index(
+        "render_page"
+    )
+    assert context.stats["context_tokens"] <= budget
+
+
+def test_functions_beyond_the_budget_are_dropped():
+    diff = _file_diff("parser.py", ["parse"])
+    functions = [_function(f"parse_{i}", "parse()\n" * 40) for i in range(10)]
+
+    context = build_pr_context(diff, functions, 300, embed_by_keyword)
+
+    assert 0 < context.stats["kept_functions"] < len(functions)
+    assert context.stats["context_tokens"] <= 300
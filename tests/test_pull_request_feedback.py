@@ -0,0 +1,61 @@
+from types import SimpleNamespace
+
+import pytest
+
+from src import pull_request_handler
+from src.llm import GenerationRegistry
+
+
+@pytest.fixture
+def posted_comments(monkeypatch):
+    comments = []
+    monkeypatch.setattr(
+        pull_request_handler, "get_function_dependencies", lambda *args: []
+    )
+    monkeypatch.setattr(
+        pull_request_handler, "query_by_function_names", lambda *args: ""
+    )
+    monkeypatch.setattr(
+        pull_request_handler,
+        "build_pr_context",
+        lambda diff, *args: SimpleNamespace(diff=diff, functions=""),
+    )
+    monkeypatch.setattr(
+        pull_request_handler, "generate_pr_feedback", lambda *args: "Looks risky."
+    )
+    monkeypatch.setattr(
+        pull_request_handler,
+        "leave_comment",
+        lambda *args: comments.append(args),
+    )
+    return comments
+
+
+def _handle(head_sha):
+    pull_request_handler.handle_new_pull_request(
+        "1", 9001, "owner/repo", 7, "Title", "Body", "diff", [], None, head_sha
+    )
+
+
+def test_generation_in_other_process_cancels(tmp_path):
+    path = str(tmp_path / "generations.sqlite3")
+    # two registries on one file stand in for two gunicorn workers
+    worker_a = GenerationRegistry(path, poll_interval=0)
+    worker_b = GenerationRegistry(path, poll_interval=0)
+
+    older = worker_a.begin((1, 7))
+    newer = worker_b.begin((1, 7))
+
+    assert older.is_set()
+    assert not newer.is_set()
+    worker_a.end((1, 7), older)
+    assert not newer.is_set()
+
+
+def test_same_feedback_is_posted_once_per_head(posted_comments):
+    _handle("abc")
+    _handle("abc")
+    assert len(posted_comments) == 1
+
+    _handle("def")
+    assert len(posted_comments) == 2
@@ -0,0 +1,83 @@
+from types import SimpleNamespace
+
+import pytest
+
+from src import vector_db
+from src.reranker import LexicalReranker, lexical_overlap
+
+
+@pytest.mark.parametrize("space", ["l2", "cosine"])
+def test_distance_and_similarity_round_trip(space):
+    for similarity in (-0.5, 0.0, 0.3, 1.0):
+        distance = vector_db.similarity_to_distance(similarity, space)
+        assert vector_db.distance_to_similarity(distance, space) == pytest.approx(
+            similarity
+        )
+
+
+def test_lexical_overlap_is_jaccard_of_words():
+    assert lexical_overlap("Crash on start", "crash on exit") == pytest.approx(2 / 4)
+    assert lexical_overlap("", "crash") == 0.0
+
+
+def _collection(distances):
+    def query(query_embeddings, n_results):
+        return {
+            "metadatas": [
+                [
+                    {"repo_id": 1, "issue_number": str(i), "title": f"Issue {i}"}
+                    for i in range(len(distances))
+                ]
+            ],
+            "documents": [[f"document {i}" for i in range(len(distances))]],
+            "distances": [distances],
+        }
+
+    return SimpleNamespace(metadata={"hnsw:space": "cosine"}, query=query)
+
+
+class FixedReranker:
+    def __init__(self, scores):
+        self.scores = scores
+
+    def score(self, query_title, query_text, candidates):
+        return self.scores
+
+
+def test_reranker_score_is_blended_with_vector_similarity(monkeypatch):
+    monkeypatch.setattr(vector_db, "reranker", FixedReranker([0.0, 1.0]))
+    monkeypatch.setattr(vector_db, "RERANK_WEIGHT", 0.5)
+    collection = _collection([0.1, 0.2])
+
+    candidates = vector_db._query_collection(
+        "repo", lambda: collection, "Crash", "Crash", 2, [1.0, 0.0]
+    )
+
+    # similarities 0.9 and 0.8 blended with scores 0 and 1 give 0.45 and 0.9
+    assert [c["issue_number"] for c in candidates] == ["1", "0"]
+    assert candidates[0]["distance"] == pytest.approx(0.1)
+    assert candidates[0]["vector_distance"] == pytest.approx(0.2)
+    assert candidates[1]["distance"] == pytest.approx(0.55)
+
+
+def test_without_reranker_vector_order_is_kept(monkeypatch):
+    monkeypatch.setattr(vector_db, "reranker", None)
+    collection = _collection([0.1, 0.2])
+
+    candidates = vector_db._query_collection(
+        "repo", lambda: collection, "Crash", "Crash", 2, [1.0, 0.0]
+    )
+
+    assert [c["distance"] for c in candidates] == [0.1, 0.2]
+
+
+def test_lexical_reranker_prefers_shared_words():
+    scores = LexicalReranker().score(
+        "Crash",
+        "app crashes on start",
+        [
+            {"document": "app crashes on start", "title": ""},
+            {"document": "dark mode", "title": ""},
+        ],
+    )
+    assert scores[0] > scores[1]
@@ -0,0 +1,91 @@
+from types import SimpleNamespace
+
+import chromadb
+import numpy as np
+import pytest
+
+from src.snapshot import (
+    Snapshot,
+    dequantize,
+    export_collection,
+    import_snapshot,
+    quantize,
+)
+
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(64, 384)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_int8_error_is_within_half_a_step(vectors):
+    codes, scales = quantize(vectors, "int8")
+
+    restored = dequantize(codes, scales)
+
+    assert codes.dtype == np.int8
+    step = np.abs(vectors).max(axis=1) / 127
+    assert np.all(np.abs(restored - vectors) <= step[:, None] / 2 + 1e-7)
+    cosines = np.sum(restored * vectors, axis=1) / np.linalg.norm(restored, axis=1)
+    assert cosines.min() > 0.999
+
+
+def test_float16_error_is_within_its_precision(vectors):
+    codes, scales = quantize(vectors, "float16")
+
+    restored = dequantize(codes, scales)
+
+    assert scales is None
+    # half a unit in the last place, absolute for values in the subnormal range
+    assert np.all(np.abs(restored - vectors) <= np.abs(vectors) * 2**-11 + 2**-25)
+
+
+def test_zero_vector_survives_int8():
+    codes, scales = quantize(np.zeros((1, 4)), "int8")
+    assert np.all(dequantize(codes, scales) == 0)
+
+
+def test_unknown_dtype_is_rejected(vectors):
+    with pytest.raises(ValueError):
+        quantize(vectors, "int4")
+
+
+def _collection(vectors):
+    ids = [f"1_{row}" for row in range(len(vectors))]
+
+    def get(include=None, limit=None, offset=0):
+        stop = offset + limit
+        return {
+            "ids": ids[offset:stop],
+            "embeddings": vectors[offset:stop].tolist(),
+            "documents": [f"issue {row}" for row in range(len(vectors))][offset:stop],
+            "metadatas": [
+                {"issue_number": str(row), "repo_id": 1} for row in range(len(vectors))
+            ][offset:stop],
+        }
+
+    return SimpleNamespace(
+        name="github_issues_1", metadata={"hnsw:space": "cosine"}, get=get
+    )
+
+
+def test_export_and_import_round_trip(vectors, tmp_path):
+    stats = export_collection(
+        _collection(vectors), str(tmp_path / "snapshot"), "int8", batch_size=10
+    )
+
+    snapshot = Snapshot(str(tmp_path / "snapshot"))
+    assert stats["vector_bytes"] < stats["float32_bytes"] / 3
+    assert len(snapshot) == len(vectors)
+    assert snapshot.ids[5] == "1_5"
+    assert snapshot.metadata(5) == {"issue_number": "5", "repo_id": 1}
+
+    client = chromadb.PersistentClient(path=str(tmp_path / "chroma"))
+    import_snapshot(client, str(tmp_path / "snapshot"), "imported")
+    imported = client.get_collection("imported")
+    stored = imported.get(ids=["1_5"], include=["embeddings", "documents"])
+    assert imported.count() == len(vectors)
+    assert stored["documents"] == ["issue 5"]
+    np.testing.assert_allclose(stored["embeddings"][0], vectors[5], atol=0.01)